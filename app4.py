@@ -10,6 +10,8 @@ from twilio.twiml.voice_response import VoiceResponse, Connect
 from twilio.rest import Client
 from dotenv import load_dotenv
 
+from side_effects import SideEffectService, pooled_twilio_http_client
+
 from urllib.parse import quote_plus
 
 load_dotenv()
@@ -31,9 +33,20 @@ LOG_EVENT_TYPES = [
     'session.created'
 ]
 SHOW_TIMING_MATH = False
+SIDE_EFFECT_CONCURRENCY = int(os.getenv('SIDE_EFFECT_CONCURRENCY', 8))
+SIDE_EFFECT_TIMEOUT = float(os.getenv('SIDE_EFFECT_TIMEOUT', 10))
+SIDE_EFFECT_RETRIES = int(os.getenv('SIDE_EFFECT_RETRIES', 2))
 
 app = FastAPI()
-twilio_client = Client(os.getenv("TWILIO_SID"), os.getenv("TWILIO_AUTH"))
+twilio_client = Client(
+    os.getenv("TWILIO_SID"), os.getenv("TWILIO_AUTH"),
+    http_client=pooled_twilio_http_client(timeout=SIDE_EFFECT_TIMEOUT)
+)
+side_effects = SideEffectService(
+    max_concurrency=SIDE_EFFECT_CONCURRENCY,
+    timeout=SIDE_EFFECT_TIMEOUT,
+    retries=SIDE_EFFECT_RETRIES,
+)
 
 if not OPENAI_API_KEY:
     raise ValueError('Missing the OpenAI API key. Please set it in the .env file.')
@@ -42,6 +55,10 @@ if not OPENAI_API_KEY:
 async def index_page():
     return {"message": "Twilio Media Stream Server is running!"}
 
+@app.on_event("shutdown")
+async def stop_side_effects():
+    await side_effects.close()
+
 @app.api_route("/incoming-call", methods=["GET", "POST"])
 async def handle_incoming_call(request: Request):
     form = await request.form()
@@ -73,10 +90,13 @@ async def missed_call(request: Request):
     if status in ("busy", "no-answer", "failed"):
         try:
             print("✅  Condition met, sending SMS…")
-            twilio_client.messages.create(
+            await side_effects.run(
+                "missed-call-sms",
+                twilio_client.messages.create,
                 body="Hey! Sorry we missed your call. How can we help today?",
                 from_=os.getenv("TWILIO_NUMBER"),
-                to=from_number
+                to=from_number,
+                retries=0,      # a timed-out send may still be delivered; never text twice
             )
         except Exception as e:
             print("❌ Failed to send SMS:", e)
@@ -184,11 +204,7 @@ async def handle_media_stream(websocket: WebSocket):
                             if not call_sid:
                                 print("[ERROR][send] No call_sid! Cannot fetch call.")
                             else:
-                                call = twilio_client.calls(call_sid).fetch()
-                                print(dir(call))
-                                from_number = call.from_formatted
-                                print(f"[DEBUG][send] Twilio Call.from_ = {from_number!r}")
-                                send_calendly_link_sms(from_number)
+                                side_effects.spawn("calendly-link", send_calendly_link(call_sid))
 
                 if etype in LOG_EVENT_TYPES and SHOW_TIMING_MATH:
                     print(f"Event: {etype}", evt)
@@ -251,6 +267,13 @@ async def initialize_session(openai_ws):
     await openai_ws.send(json.dumps(session_update))
 
 
+async def send_calendly_link(call_sid: str):
+    call = await side_effects.run("fetch-call", twilio_client.calls(call_sid).fetch)
+    from_number = call.from_formatted
+    print(f"[DEBUG][send] Twilio Call.from_ = {from_number!r}")
+    await side_effects.run("calendly-sms", send_calendly_link_sms, from_number, retries=0)
+
+
 def send_calendly_link_sms(phone_number: str):
     calendly_link = os.getenv("CALENDLY_LINK")
     twilio_number = os.getenv("TWILIO_NUMBER")
@@ -259,15 +282,12 @@ def send_calendly_link_sms(phone_number: str):
         print("❌ Missing CALENDLY_LINK or TWILIO_NUMBER in .env")
         return
 
-    try:
-        twilio_client.messages.create(
-            body=f"Hey! Here's the link to book a time: {calendly_link}",
-            from_=twilio_number,
-            to=phone_number
-        )
-        print(f"✅ Calendly link sent to {phone_number}")
-    except Exception as e:
-        print(f"❌ Failed to send Calendly link: {e}")
+    twilio_client.messages.create(
+        body=f"Hey! Here's the link to book a time: {calendly_link}",
+        from_=twilio_number,
+        to=phone_number
+    )
+    print(f"✅ Calendly link sent to {phone_number}")
 
 if __name__ == "__main__":
     import uvicorn
@@ -1,29 +1,58 @@
 import os
+import ssl
+import hmac
 import json
+import time
+import base64
 import asyncio
 import websockets
-from fastapi import FastAPI, WebSocket, Request, Response
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, WebSocket, Request, Response
 from fastapi.responses import HTMLResponse, JSONResponse
 from fastapi.websockets import WebSocketDisconnect
-from twilio.twiml.voice_response import VoiceResponse, Connect
-from twilio.rest import Client
 from dotenv import load_dotenv
-import httpx
 
-from urllib.parse import quote_plus
+from session_pool import RealtimeSessionPool
+from speculative import SpeculativeSessions
+from side_effects import SideEffectService, pooled_twilio_http_client
+from audio_batcher import InboundAudioBatcher
+from bridge import Outbox, PacedOutbox
+from media_codec import TwilioFrameEncoder, encode_append_audio, parse_audio_delta, parse_twilio_media
+from playback import PlaybackTracker
+from control_tokens import ControlTokenScanner
+from call_state import open_call_state
+from session_config import SessionConfigCache
+from greeting_cache import GreetingCache, synthesize_greeting
+from faq_cache import FaqCache
+from recorder import CallRecorder
+from tenants import Tenant, TenantRegistry
+from campaigns import CampaignDialer, LeadStore, valid_number
+from capacity import CapacityGovernor
+from hold_queue import HoldQueue
+import twiml
+from twiml import read_form
+import metrics
+from metrics import (
+    ACTIVE_CALLS, FIRST_AUDIO, MARK_BACKLOG, SESSION_INIT, SIDE_EFFECTS_OUTSTANDING, TURN_LATENCY, TWILIO_TO_UPSTREAM_LAG,
+)
+from logs import bind_call, configure as configure_logging, get_logger, log_event, setup_logging, snapshot as logging_snapshot
+
+from urllib.parse import quote_plus, urlparse
 
 load_dotenv()
+setup_logging()
+log = get_logger("app5")
 
 # Configuration
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 PORT = int(os.getenv('PORT', 5000))
 
-# Load system prompt
 dir_path = os.path.dirname(__file__)
-with open(os.path.join(dir_path, "prompt.txt"), "r", encoding="utf-8") as f:
-    SYSTEM_MESSAGE = f.read().strip()
-
 VOICE = 'alloy'
+TEMPERATURE = 0.8
+GREETING = "You've reached Mark's Properties. We're connecting you now."
+GREETING_VOICE = "Polly.Matthew"    # or your preferred voice
+FORWARD_NUMBER = os.getenv('FORWARD_NUMBER', "+13232108697")    # 👈 the real number to forward to
 LOG_EVENT_TYPES = [
     'error', 'response.content.done', 'rate_limits.updated',
     'response.done', 'input_audio_buffer.committed',
@@ -31,150 +60,858 @@ LOG_EVENT_TYPES = [
     'session.created'
 ]
 SHOW_TIMING_MATH = False
+OPENAI_WS_URL = os.getenv('OPENAI_WS_URL', "wss://api.openai.com/v1/realtime?model=gpt-4o-realtime-preview-2024-12-17")
+SESSION_POOL_SIZE = int(os.getenv('SESSION_POOL_SIZE', 2))
+SESSION_POOL_TTL = float(os.getenv('SESSION_POOL_TTL', 300))
+SPECULATIVE_TIMEOUT = float(os.getenv('SPECULATIVE_TIMEOUT', 30))
+SIDE_EFFECT_CONCURRENCY = int(os.getenv('SIDE_EFFECT_CONCURRENCY', 8))
+SIDE_EFFECT_TIMEOUT = float(os.getenv('SIDE_EFFECT_TIMEOUT', 10))
+SIDE_EFFECT_RETRIES = int(os.getenv('SIDE_EFFECT_RETRIES', 2))
+INBOUND_BATCH_MS = int(os.getenv('INBOUND_BATCH_MS', 80))
+PLAYBACK_MARK_MS = int(os.getenv('PLAYBACK_MARK_MS', 250))
+PLAYBACK_DRAIN_GRACE_S = float(os.getenv('PLAYBACK_DRAIN_GRACE_S', 2))
+LOCAL_VAD = os.getenv('LOCAL_VAD', '0') == '1'
+LOCAL_VAD_THRESHOLD_DB = float(os.getenv('LOCAL_VAD_THRESHOLD_DB', -35))
+LOCAL_VAD_ATTACK_MS = int(os.getenv('LOCAL_VAD_ATTACK_MS', 60))
+LOCAL_VAD_HANGOVER_MS = int(os.getenv('LOCAL_VAD_HANGOVER_MS', 300))
+GREETING_CACHE = os.getenv('GREETING_CACHE', '1') == '1'
+GREETING_CACHE_DIR = os.getenv('GREETING_CACHE_DIR', os.path.join(dir_path, ".greeting_cache"))
+# Playback item ids of cached clips; they are not model items, so never truncated upstream
+CACHED_ITEM = "cached:"
+GREETING_ITEM = CACHED_ITEM + "greeting"
+FAQ_CACHE = os.getenv('FAQ_CACHE', '1') == '1'
+FAQ_CACHE_SIZE = int(os.getenv('FAQ_CACHE_SIZE', 64))
+FAQ_CACHE_TTL = float(os.getenv('FAQ_CACHE_TTL', 24 * 3600))
+TRANSCRIBE_MODEL = os.getenv('TRANSCRIBE_MODEL', 'whisper-1')
+RECORD_CALLS = os.getenv('RECORD_CALLS', '0') == '1'
+RECORDINGS_DIR = os.getenv('RECORDINGS_DIR', os.path.join(dir_path, "recordings"))
+PROMPT_CHECK_INTERVAL_S = float(os.getenv('PROMPT_CHECK_INTERVAL_S', 2))
+TENANTS_FILE = os.getenv('TENANTS_FILE')     # see tenants.py; unset = single business
+TENANT_CACHE_SIZE = int(os.getenv('TENANT_CACHE_SIZE', 32))
+LOCAL_VAD_CONFIRM_MS = int(os.getenv('LOCAL_VAD_CONFIRM_MS', 800))
+PUBLIC_HOST = os.getenv('PUBLIC_HOST', "ai-phone-voice.onrender.com")   # for URLs Twilio calls back on
+CAMPAIGNS = os.getenv('CAMPAIGNS', '0') == '1'
+CAMPAIGN_DB = os.getenv('CAMPAIGN_DB', os.path.join(dir_path, "campaigns.db"))
+CAMPAIGN_MAX_CONCURRENT = int(os.getenv('CAMPAIGN_MAX_CONCURRENT', 10))
+CAMPAIGN_CPS = float(os.getenv('CAMPAIGN_CPS', 1))
+CAMPAIGN_ADMIN_TOKEN = os.getenv('CAMPAIGN_ADMIN_TOKEN')     # bearer token for /campaigns; unset = API closed
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN', CAMPAIGN_ADMIN_TOKEN)     # bearer token for POST /logging; unset = closed
+CAPACITY_MAX_CALLS = int(os.getenv('CAPACITY_MAX_CALLS', 0))     # 0 = only upstream limits apply
+CAPACITY_REQUESTS_PER_CALL = float(os.getenv('CAPACITY_REQUESTS_PER_CALL', 1))
+CAPACITY_TOKENS_PER_CALL = float(os.getenv('CAPACITY_TOKENS_PER_CALL', 2000))
+CAPACITY_COOLDOWN_S = float(os.getenv('CAPACITY_COOLDOWN_S', 15))
+OVERFLOW_ACTION = os.getenv('OVERFLOW_ACTION', 'forward')     # forward | voicemail, when there is no capacity
+OVERFLOW_FORWARD_MESSAGE = "All of our lines are busy right now. Connecting you to our team."
+OVERFLOW_VOICEMAIL_MESSAGE = ("All of our lines are busy right now. "
+                              "Please leave a message after the beep and we'll call you back.")
+HOLD_QUEUE = os.getenv('HOLD_QUEUE', '0') == '1'     # hold callers when there is no capacity, before overflow
+HOLD_QUEUE_NAME = os.getenv('HOLD_QUEUE_NAME', "hold")
+HOLD_QUEUE_SIZE = int(os.getenv('HOLD_QUEUE_SIZE', 50))
+HOLD_MAX_WAIT_S = float(os.getenv('HOLD_MAX_WAIT_S', 300))
+HOLD_REPEAT_BONUS_S = float(os.getenv('HOLD_REPEAT_BONUS_S', 60))
+HOLD_MUSIC_URL = os.getenv('HOLD_MUSIC_URL', "http://com.twilio.music.classical.s3.amazonaws.com/BusyStrings.mp3")
+UPSTREAM_AUDIO_FORMAT = os.getenv('UPSTREAM_AUDIO_FORMAT', 'g711_ulaw')   # or pcm16: 24 kHz, converted by audio.py
+PCM16 = UPSTREAM_AUDIO_FORMAT == 'pcm16'
+INBOUND_GAIN_NORMALIZE = os.getenv('INBOUND_GAIN_NORMALIZE', '0') == '1'    # pcm16 only
+PLAYBACK_LEAD_MS = int(os.getenv('PLAYBACK_LEAD_MS', 300))     # audio kept buffered at Twilio; 0 = send as produced
+PLAYBACK_FRAME_MS = int(os.getenv('PLAYBACK_FRAME_MS', 20))
+PLAYBACK_QUEUE_MAX_MS = int(os.getenv('PLAYBACK_QUEUE_MAX_MS', 120_000))     # paced audio held per call
+BRIDGE_QUEUE_MAX = int(os.getenv('BRIDGE_QUEUE_MAX', 256))
+BRIDGE_STALL_TIMEOUT_S = float(os.getenv('BRIDGE_STALL_TIMEOUT_S', 5))
+CALL_STATE_TIMEOUT_S = float(os.getenv('CALL_STATE_TIMEOUT_S', 2))
+
+@asynccontextmanager
+async def lifespan(app):
+    started = time.perf_counter()
+    session_pool.start()
+    session_config.start()
+    greeting_for(default_tenant)
+    warm = asyncio.create_task(warm_up(started))
+    if campaign_dialer is not None:
+        campaign_dialer.start()
+    if hold_queue is not None:
+        hold_queue.start()
+    startup["lifespan_s"] = round(time.perf_counter() - started, 3)
+    try:
+        yield
+    finally:
+        warm.cancel()
+        if hold_queue is not None:
+            await hold_queue.close()
+        if campaign_dialer is not None:
+            await campaign_dialer.close()
+            await campaign_leads.close()
+        await session_config.close()
+        if greeting_cache is not None:
+            await greeting_cache.close()
+        await speculative_sessions.close()
+        await session_pool.close()
+        await side_effects.close()
+        await call_state.close()
+
+app = FastAPI(lifespan=lifespan)
+startup = {}        # cold-start timings, see /ready and main.py
+_twilio_client = None
+_upstream_ssl = None
+
+def twilio_client():
+    # Built on first use: importing twilio is ~60 ms a cold start should not wait for
+    global _twilio_client
+    if _twilio_client is None:
+        from twilio.rest import Client
+        _twilio_client = Client(
+            os.getenv("TWILIO_SID"), os.getenv("TWILIO_AUTH"),
+            http_client=pooled_twilio_http_client(timeout=SIDE_EFFECT_TIMEOUT)
+        )
+    return _twilio_client
 
-app = FastAPI()
-twilio_client = Client(os.getenv("TWILIO_SID"), os.getenv("TWILIO_AUTH"))
+def upstream_ssl_context():
+    # One context for every upstream dial instead of loading the CA store per connect
+    global _upstream_ssl
+    if _upstream_ssl is None:
+        _upstream_ssl = ssl.create_default_context()
+    return _upstream_ssl
+
+side_effects = SideEffectService(
+    max_concurrency=SIDE_EFFECT_CONCURRENCY,
+    timeout=SIDE_EFFECT_TIMEOUT,
+    retries=SIDE_EFFECT_RETRIES,
+)
 
 if not OPENAI_API_KEY:
     raise ValueError('Missing the OpenAI API key. Please set it in the .env file.')
 
+async def connect_openai():
+    secure = OPENAI_WS_URL.startswith("wss:")
+    return await websockets.connect(
+        OPENAI_WS_URL,
+        additional_headers=[
+            ("Authorization", f"Bearer {OPENAI_API_KEY}"),
+            ("OpenAI-Beta", "realtime=v1")
+        ],
+        **({"ssl": upstream_ssl_context()} if secure else {}),
+    )
+
+async def warm_up(started):
+    """Resolve + handshake the upstream host and build the lazy clients, off the call path.
+
+    Retries until it succeeds; /ready reports ready once it has and the session pool
+    holds its first session.
+    """
+    url = urlparse(OPENAI_WS_URL)
+    secure = url.scheme == "wss"
+    while True:
+        t0 = time.perf_counter()
+        try:
+            ctx = await asyncio.to_thread(upstream_ssl_context) if secure else None
+            _, writer = await asyncio.wait_for(asyncio.open_connection(
+                url.hostname, url.port or (443 if secure else 80), ssl=ctx), timeout=10)
+            writer.close()
+            startup["upstream_warm_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+            startup.pop("warm_error", None)
+            break
+        except Exception as e:
+            startup["warm_error"] = repr(e)
+            log.warning("❌ upstream warm-up failed, retrying: %r", e)
+            await asyncio.sleep(5)
+    await asyncio.to_thread(build_lazy_clients)
+    while SESSION_POOL_SIZE and not session_pool.snapshot()["idle"] and not session_pool.stats["hits"]:
+        await asyncio.sleep(0.05)
+    startup["ready_s"] = round(time.perf_counter() - started, 3)
+    log.info("✅ Ready", extra=startup)
+
+def build_lazy_clients():
+    twilio_client()
+    side_effects.http
+    if LOCAL_VAD:
+        import vad
+    if PCM16:
+        import audio
+
+# System prompt: serialized once per version, reloaded when prompt.txt changes
+session_config = SessionConfigCache(
+    os.path.join(dir_path, "prompt.txt"),
+    check_interval=PROMPT_CHECK_INTERVAL_S,
+    on_change=lambda version: on_prompt_change(),
+)
+
+# The business above answers any number TENANTS_FILE does not list
+default_tenant = Tenant(
+    os.getenv("TWILIO_NUMBER"),
+    name="Mark's Properties",
+    prompt_path=session_config.prompt_path,
+    voice=VOICE,
+    greeting=GREETING,
+    greeting_voice=GREETING_VOICE,
+    forward_number=FORWARD_NUMBER,
+    booking_url=os.getenv("FORMSPREE_URL"),
+    session_config=session_config,
+)
+tenants = TenantRegistry(TENANTS_FILE, default_tenant, max_loaded=TENANT_CACHE_SIZE,
+                         check_interval=PROMPT_CHECK_INTERVAL_S)
+
+session_pool = RealtimeSessionPool(
+    connect=connect_openai,
+    initialize=lambda ws: initialize_session(ws),
+    confirm=lambda ws: wait_for_session_updated(ws),
+    size=SESSION_POOL_SIZE,
+    ttl=SESSION_POOL_TTL,
+    on_idle=lambda: capacity_freed(),
+)
+speculative_sessions = SpeculativeSessions(session_pool.acquire, timeout=SPECULATIVE_TIMEOUT)
+call_state = open_call_state()      # CallSid -> caller/stream record shared across workers
+
+# The store is best-effort on the call path: with SQLite or Redis down or busy, a call
+# still connects, it just loses what another worker would have told it.
+async def load_call(call_sid):
+    try:
+        async with asyncio.timeout(CALL_STATE_TIMEOUT_S):
+            return await call_state.get(call_sid) or {}
+    except Exception as e:
+        log.warning("❌ could not read call state: %r", e, extra={"callSid": call_sid})
+        return {}
+
+async def save_call(call_sid, **fields):
+    try:
+        async with asyncio.timeout(CALL_STATE_TIMEOUT_S):
+            await call_state.update(call_sid, **fields)
+    except Exception as e:
+        log.warning("❌ could not record call state: %r", e, extra={"callSid": call_sid, "fields": list(fields)})
+
+async def acquire_session(tenant):
+    # One pool for every tenant; its idle sessions carry the default tenant's prompt and voice.
+    # A tenant that shares the prompt but not the voice still needs its own session.update.
+    ws, pooled = await session_pool.acquire(initialize=lambda ws: initialize_session(ws, tenant))
+    if not tenant.session_config.configured(ws, tenant.voice, **session_settings()):
+        await initialize_session(ws, tenant)
+        pooled = False
+    return ws, pooled
+
+async def synthesize_opening(key, tenant):
+    ws = await connect_openai()
+    try:
+        await initialize_session(ws, tenant)
+        if greeting_cache.key(tenant.session_config.version_of(ws), tenant.voice) != key:
+            raise RuntimeError("prompt changed while synthesizing the greeting")
+        clip, transcript = await synthesize_greeting(ws)
+        if PCM16:
+            from audio import Pcm16ToTwilio
+            clip = Pcm16ToTwilio().process(clip)    # clips are stored as Twilio plays them
+        return clip, transcript
+    finally:
+        await ws.close()
+
+# Opening line synthesized once per prompt version + voice, then streamed from disk
+greeting_cache = GreetingCache(GREETING_CACHE_DIR, synthesize_opening) if GREETING_CACHE else None
+
+async def place_campaign_call(lead):
+    stream_url = (f"wss://{PUBLIC_HOST}/media-stream"
+                  f"?caller={quote_plus(lead['number'])}&to={quote_plus(lead['from_number'])}&lead={lead['id']}")
+    call = await side_effects.run(
+        "campaign-dial",
+        twilio_client().calls.create,
+        to=lead['number'],
+        from_=lead['from_number'],
+        twiml=twiml.STREAM.render(stream_url=stream_url),
+        status_callback=f"https://{PUBLIC_HOST}/campaign-status",
+        retries=0,      # the dialer retries the lead later; a 429 has to reach it to slow down
+    )
+    opening = lead['opening'] + (f" Their name is {lead['name']}." if lead.get('name') else "")
+    await save_call(call.sid, caller=lead['number'], to=lead['from_number'], lead=lead['id'],
+                            campaign=lead['campaign'], opening=opening, status="dialing")
+    return call.sid
+
+# Whether a new call can get a working upstream session (rate_limits.updated, active calls)
+capacity = CapacityGovernor(
+    max_calls=CAPACITY_MAX_CALLS,
+    requests_per_call=CAPACITY_REQUESTS_PER_CALL,
+    tokens_per_call=CAPACITY_TOKENS_PER_CALL,
+    cooldown_s=CAPACITY_COOLDOWN_S,
+    pending_ttl=SPECULATIVE_TIMEOUT,
+)
+
+# Outbound call-back campaigns: leads in SQLite, paced by CampaignDialer
+campaign_leads = LeadStore(CAMPAIGN_DB) if CAMPAIGNS else None
+campaign_dialer = CampaignDialer(
+    campaign_leads, place_campaign_call, max_concurrent=CAMPAIGN_MAX_CONCURRENT, cps=CAMPAIGN_CPS,
+    headroom=lambda: campaign_dialer.active + inbound_headroom(),     # inbound calls come first
+) if CAMPAIGNS else None
+
+def inbound_headroom():
+    # Nothing for campaigns while callers are on hold
+    return 0 if hold_queue is not None and len(hold_queue) else capacity.headroom()
+
+def capacity_freed():
+    if hold_queue is not None:
+        hold_queue.wake()
+
+def stream_twiml(tenant, ws_url):
+    if greeting_for(tenant) is not None:
+        # The cached greeting plays the moment the stream starts; no Polly intro needed
+        return twiml.STREAM.render(stream_url=ws_url)
+    return twiml.CONNECT_STREAM.render(
+        voice=tenant.greeting_voice, greeting=tenant.greeting, pause=0.5, stream_url=ws_url)
+
+async def connect_from_hold(entry):
+    tenant = tenants.get(entry.to)
+    speculative_sessions.start(entry.call_sid, lambda: acquire_session(tenant))
+    try:
+        # New TwiML takes the call out of the <Enqueue>
+        await side_effects.run("dequeue", twilio_client().calls(entry.call_sid).update,
+                               twiml=stream_twiml(tenant, entry.stream_url))
+    except Exception:
+        capacity.cancel(entry.call_sid)
+        raise
+    await save_call(entry.call_sid, status="greeting")
+
+async def overflow_from_hold(entry):
+    await side_effects.run("hold-timeout", twilio_client().calls(entry.call_sid).update,
+                           twiml=overflow_twiml(tenants.get(entry.to)))
+
+# Callers waiting for capacity, released by priority (see hold_queue.py)
+hold_queue = HoldQueue(
+    connect_from_hold, overflow_from_hold,
+    admit=lambda call_sid: capacity.headroom() >= 1 and capacity.admit(call_sid) is None,
+    max_size=HOLD_QUEUE_SIZE, max_wait_s=HOLD_MAX_WAIT_S, repeat_bonus_s=HOLD_REPEAT_BONUS_S,
+) if HOLD_QUEUE else None
+
+async def queue_callback(tenant, from_number):
+    if campaign_leads is not None and from_number:
+        await campaign_leads.add_callback(tenant.number, from_number)
+        campaign_dialer.wake()
+
+def overflow_twiml(tenant):
+    # Relative actions resolve against this webhook's URL
+    if OVERFLOW_ACTION == 'voicemail':
+        return twiml.OVERFLOW_VOICEMAIL.render(
+            voice=tenant.greeting_voice, message=OVERFLOW_VOICEMAIL_MESSAGE, action="/voicemail", max_length=120)
+    return twiml.OVERFLOW_FORWARD.render(
+        voice=tenant.greeting_voice, message=OVERFLOW_FORWARD_MESSAGE, action="/missed-call",
+        caller_id=tenant.number, timeout=20, number=tenant.forward_number)
+
+# Answers to FAQ intents (hours, pricing, ...) replayed instead of generated again
+faq_cache = FaqCache(max_entries=FAQ_CACHE_SIZE, ttl=FAQ_CACHE_TTL) if FAQ_CACHE else None
+
+def greeting_for(tenant):
+    if greeting_cache is None:
+        return None
+    key = greeting_cache.key(tenant.session_config.version, tenant.voice)
+    clip = greeting_cache.get(key)
+    if clip is None:
+        greeting_cache.ensure(key, tenant)     # first call since the tenant loaded or its prompt changed
+    return clip
+
+def on_prompt_change():
+    session_pool.invalidate()
+    if faq_cache is not None:
+        faq_cache.invalidate()
+    greeting_for(default_tenant)
+
+# Playback trackers of live calls, summed into the mark-backlog gauge at scrape time
+active_playbacks = set()
+MARK_BACKLOG.set_function(lambda: sum(p.backlog for p in active_playbacks))
+SIDE_EFFECTS_OUTSTANDING.set_function(lambda: side_effects.outstanding)
+
 @app.get("/", response_class=JSONResponse)
 async def index_page():
     return {"message": "Twilio Media Stream Server is running!"}
 
+@app.get("/ready", response_class=JSONResponse)
+async def readiness():
+    # Liveness is "/"; this says whether a call arriving now gets a warm upstream
+    ready = "ready_s" in startup
+    return JSONResponse({"ready": ready, **startup}, status_code=200 if ready else 503)
+
+@app.get("/session-pool", response_class=JSONResponse)
+async def session_pool_stats():
+    return {
+        **session_pool.snapshot(),
+        "speculative": speculative_sessions.snapshot(),
+        "prompt_version": session_config.version,
+    }
+
+@app.get("/logging", response_class=JSONResponse)
+async def logging_settings():
+    return logging_snapshot()
+
+@app.post("/logging", response_class=JSONResponse)
+async def update_logging(request: Request):
+    # e.g. {"level": "DEBUG", "sample_rates": {"response.audio.delta": 0.05}}
+    # Changes what every call logs (and how much): admins only
+    require_bearer(request, ADMIN_TOKEN, "ADMIN_TOKEN")
+    body = await request.json()
+    return configure_logging(level=body.get("level"), sample_rates=body.get("sample_rates"))
+
+@app.get("/tenants", response_class=JSONResponse)
+async def tenant_stats():
+    return tenants.snapshot()
+
+@app.get("/capacity", response_class=JSONResponse)
+async def capacity_stats():
+    return capacity.snapshot()
+
+@app.get("/hold-queue", response_class=JSONResponse)
+async def hold_queue_stats():
+    if hold_queue is None:
+        raise HTTPException(404, "hold queue is off (HOLD_QUEUE=1)")
+    return hold_queue.snapshot()
+
+@app.get("/faq-cache", response_class=JSONResponse)
+async def faq_cache_stats():
+    return faq_cache.snapshot() if faq_cache is not None else {"enabled": False}
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.get("/side-effects", response_class=JSONResponse)
+async def side_effect_stats():
+    return side_effects.snapshot()
+
+def campaigns_enabled(request):
+    # These routes place calls billed to the account: closed unless the admin token is set and sent
+    if campaign_dialer is None:
+        raise HTTPException(status_code=404, detail="campaigns are disabled (CAMPAIGNS=1 enables them)")
+    require_bearer(request, CAMPAIGN_ADMIN_TOKEN, "CAMPAIGN_ADMIN_TOKEN")
+
+def require_bearer(request, expected, setting):
+    if not expected:
+        raise HTTPException(status_code=403, detail=f"set {setting} to use this endpoint")
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(token.encode(), expected.encode()):
+        raise HTTPException(status_code=401, detail="bad or missing bearer token",
+                            headers={"WWW-Authenticate": "Bearer"})
+
+@app.post("/campaigns/{name}", response_class=JSONResponse)
+async def save_campaign(name: str, request: Request):
+    # {"from_number": "+1...", "opening": "...", "max_attempts": 3, "retry_after_s": 1800,
+    #  "leads": ["+1...", {"number": "+1...", "name": "..."}]}
+    campaigns_enabled(request)
+    body = await request.json()
+    current = await campaign_leads.campaign(name) or {}
+    from_number = body.get("from_number") or current.get("from_number") or default_tenant.number
+    if not valid_number(from_number):
+        raise HTTPException(status_code=422, detail=f"from_number is not an E.164 phone number: {from_number!r}")
+    try:
+        # Leads are only dialed once their campaign row exists, so a rejected list changes nothing
+        added = await campaign_leads.add_leads(name, body.get("leads", []))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    settings = {key: body.get(key, current.get(key)) for key in ("opening", "max_attempts", "retry_after_s")}
+    await campaign_leads.save_campaign(
+        name, from_number,
+        **{key: value for key, value in settings.items() if value is not None},
+        status=body.get("status", current.get("status", "running")),
+    )
+    campaign_dialer.wake()
+    return {"added": added, "leads": await campaign_leads.stats(name)}
+
+@app.post("/campaigns/{name}/{action}", response_class=JSONResponse)
+async def control_campaign(name: str, action: str, request: Request):
+    campaigns_enabled(request)
+    if action not in ("pause", "resume"):
+        raise HTTPException(status_code=404)
+    await campaign_leads.set_status(name, "paused" if action == "pause" else "running")
+    campaign_dialer.wake()
+    return {"status": "paused" if action == "pause" else "running"}
+
+@app.get("/campaigns/{name}", response_class=JSONResponse)
+async def campaign_stats(name: str, request: Request):
+    campaigns_enabled(request)
+    campaign = await campaign_leads.campaign(name)
+    if campaign is None:
+        raise HTTPException(status_code=404)
+    return {**campaign, "leads": await campaign_leads.stats(name), "dialer": campaign_dialer.snapshot()}
+
+@app.post("/campaign-status")
+async def campaign_status(request: Request):
+    form = await read_form(request)
+    if campaign_dialer is not None and form.get("CallSid"):
+        await campaign_dialer.on_status(form["CallSid"], form.get("CallStatus"))
+    return Response(status_code=204)
+
 @app.api_route("/incoming-call", methods=["GET", "POST"])
 async def handle_incoming_call(request: Request):
-    form = await request.form()
+    form = await read_form(request)
     from_number = form.get("From")
-    print("🔔 [DEBUG] /incoming-call, got From =", repr(from_number))
-    response = VoiceResponse()
-    response.say("You've reached Mark's Properties. We're connecting you now.", voice="Polly.Matthew")  # or your preferred voice
-    response.pause(length=0.5)
+    call_sid = form.get("CallSid")
+    tenant = tenants.get(form.get("To"))
+    log.debug("🔔 /incoming-call", extra={"caller": from_number, "callSid": call_sid, "tenant": tenant.number})
+
+    ws_url = (f"wss://{request.url.hostname}/media-stream"
+              f"?caller={quote_plus(from_number or '')}&to={quote_plus(form.get('To') or '')}")
+    repeat = hold_queue.seen(from_number) if hold_queue is not None else False
+
+    # A stream the upstream cannot serve is dead air: hold the caller, or hand them to a
+    # person or voicemail. Callers already on hold go first, in the hold queue's order.
+    if hold_queue is not None and len(hold_queue):
+        reason = "callers_on_hold"
+    else:
+        reason = capacity.admit(call_sid)
+    if reason is not None:
+        if hold_queue is not None and hold_queue.add(call_sid, from_number, form.get("To"), ws_url, repeat=repeat):
+            if call_sid:
+                await save_call(call_sid, caller=from_number, to=form.get("To"), status="on_hold")
+            content = twiml.ENQUEUE.render(action="/hold-left", wait_url="/hold", queue=HOLD_QUEUE_NAME)
+            return HTMLResponse(content=content, media_type="application/xml")
+        log.warning("🚦 no capacity for the call, sending it to overflow", extra={
+            "caller": from_number, "callSid": call_sid, "reason": reason, "overflow": OVERFLOW_ACTION})
+        if call_sid:
+            await save_call(call_sid, caller=from_number, to=form.get("To"), status="overflow")
+        return HTMLResponse(content=overflow_twiml(tenant), media_type="application/xml")
+
+    # Open the upstream session while Twilio plays the greeting; /media-stream adopts it
+    speculative_sessions.start(call_sid, lambda: acquire_session(tenant))
+    if call_sid:
+        await save_call(call_sid, caller=from_number, to=form.get("To"), status="greeting")
+    log.debug("🔔 /incoming-call streaming", extra={"callSid": call_sid, "ws_url": ws_url})
+    return HTMLResponse(content=stream_twiml(tenant, ws_url), media_type="application/xml")
 
-    ws_url = f"wss://{request.url.hostname}/media-stream?caller={quote_plus(from_number)}"
-    print("🔔 [DEBUG] /incoming-call, streaming to", ws_url)
+@app.post("/hold")
+async def hold_music(request: Request):
+    # <Enqueue> waitUrl: replayed by Twilio for as long as the caller waits
+    form = await read_form(request)
+    tenant = tenants.get(form.get("To"))
+    position = hold_queue.position(form.get("CallSid")) if hold_queue is not None else None
+    message = (f"You are number {position} in line. " if position else "") + "Thanks for holding."
+    content = twiml.HOLD.render(voice=tenant.greeting_voice, message=message, music_url=HOLD_MUSIC_URL)
+    return HTMLResponse(content=content, media_type="application/xml")
 
-    connect = Connect()
-    connect.stream(url=ws_url)
-    response.append(connect)
-    return HTMLResponse(content=str(response), media_type="application/xml")
+@app.post("/hold-left")
+async def hold_left(request: Request):
+    # <Enqueue> action: hung up, or left the queue some way other than our redirect
+    form = await read_form(request)
+    result = form.get("QueueResult")
+    if hold_queue is not None:
+        hold_queue.left(form.get("CallSid"), result)
+    if result in ("hangup", "redirected", "bridged"):
+        return Response(status_code=204)
+    return HTMLResponse(content=overflow_twiml(tenants.get(form.get("To"))), media_type="application/xml")
 
 @app.post("/missed-call")
 async def missed_call(request: Request):
-    form = await request.form()
+    form = await read_form(request)
     from_number = form.get("From")
     status = form.get("DialCallStatus") or form.get("CallStatus")
-    print(f"🏷️  missed_call webhook hit — From={from_number}, DialCallStatus={status!r}")
+    call_sid = form.get("CallSid")
+    tenant = tenants.get(form.get("To"))
+    if call_sid:
+        await save_call(call_sid, dial_status=status)
+        if not from_number:
+            from_number = (await load_call(call_sid)).get("caller")
+    log.info("🏷️  missed_call webhook hit", extra={
+        "caller": from_number, "dial_status": status, "tenant": tenant.number})
 
     if status in ("busy", "no-answer", "failed"):
         try:
-            print("✅  Condition met, sending SMS…")
-            twilio_client.messages.create(
+            log.info("✅  Condition met, sending SMS…", extra={"caller": from_number})
+            await side_effects.run(
+                "missed-call-sms",
+                twilio_client().messages.create,
                 body="Hey! Sorry we missed your call. How can we help today?",
-                from_=os.getenv("TWILIO_NUMBER"),
-                to=from_number
+                from_=tenant.number,
+                to=from_number,
+                retries=0,      # a timed-out send may still be delivered; never text twice
             )
         except Exception as e:
-            print("❌ Failed to send SMS:", e)
+            log.error("❌ Failed to send SMS: %r", e, extra={"caller": from_number})
+        await queue_callback(tenant, from_number)
     return Response(status_code=204)
 
+@app.post("/voicemail")
+async def voicemail(request: Request):
+    form = await read_form(request)
+    from_number = form.get("From")
+    call_sid = form.get("CallSid")
+    tenant = tenants.get(form.get("To"))
+    log.info("📼 voicemail recorded", extra={
+        "caller": from_number, "callSid": call_sid, "tenant": tenant.number,
+        "recording_url": form.get("RecordingUrl"), "duration_s": form.get("RecordingDuration")})
+    if call_sid:
+        await save_call(call_sid, status="voicemail", recording_url=form.get("RecordingUrl"))
+    await queue_callback(tenant, from_number)
+    return HTMLResponse(content=twiml.HANGUP.render(), media_type="application/xml")
+
 @app.post("/forward-call")
 async def forward_call(request: Request):
-    form = await request.form()
-    response = VoiceResponse()
-    dial = response.dial(
+    form = await read_form(request)
+    call_sid = form.get("CallSid")
+    number = request.query_params.get("tenant")
+    if call_sid:
+        await save_call(call_sid, status="transferred")
+        if not number:
+            # The record's `to` is the business number for inbound and campaign calls alike
+            number = (await load_call(call_sid)).get("to")
+    tenant = tenants.get(number or form.get("To"))
+    content = twiml.FORWARD.render(
         timeout=20,  # how many seconds to ring before giving up
-        caller_id=os.getenv("TWILIO_NUMBER")  # shows your Twilio number as caller ID
+        caller_id=tenant.number,  # shows the dialed Twilio number as caller ID
+        number=tenant.forward_number,
     )
-    dial.number("+13232108697")  # 👈 Put the real number you want to forward to here
-    return HTMLResponse(content=str(response), media_type="application/xml")
+    return HTMLResponse(content=content, media_type="application/xml")
 
 @app.websocket("/media-stream")
 async def handle_media_stream(websocket: WebSocket):
     # Debug entry
-    print("🌐 [DEBUG] WebSocket handler invoked; headers =", dict(websocket.headers))
+    log.debug("🌐 WebSocket handler invoked", extra={"headers": dict(websocket.headers)})
     try:
         subp = websocket.headers.get("sec-websocket-protocol")
         await websocket.accept(subprotocol=subp)
-        print(f"✅ [DEBUG] WebSocket accepted (subprotocol={subp})")
+        log.debug("✅ WebSocket accepted", extra={"subprotocol": subp})
     except Exception as e:
-        print("❌ [ERROR] WebSocket.accept() failed:", e)
+        log.exception("❌ WebSocket.accept() failed")
         raise
 
-    # Connect to OpenAI
-    WS_URL = "wss://api.openai.com/v1/realtime?model=gpt-4o-realtime-preview-2024-12-17"
+    # Twilio sends `connected` then `start`; the start event carries the CallSid
+    # that /incoming-call may already have opened an upstream session for.
     try:
-        print("🔔 [DEBUG] Connecting to OpenAI at", WS_URL)
-        openai_ws = await websockets.connect(
-            WS_URL,
-            additional_headers=[
-                ("Authorization", f"Bearer {OPENAI_API_KEY}"),
-                ("OpenAI-Beta", "realtime=v1")
-            ]
-        )
-        print("✅ [DEBUG] Connected to OpenAI")
+        start_data = await wait_for_start(websocket)
+    except WebSocketDisconnect:
+        log.warning("❌ Twilio disconnected before the start event")
+        return
+
+    stream_sid = start_data['start']['streamSid']
+    call_sid = start_data['start']['callSid']
+    stream_started = time.perf_counter()
+    playback = PlaybackTracker(mark_every_ms=PLAYBACK_MARK_MS)
+    twilio_frames = TwilioFrameEncoder(stream_sid)
+    # caller.wav / assistant.wav / transcript.jsonl, written by the recorder's own task
+    recorder = CallRecorder(os.path.join(RECORDINGS_DIR, call_sid or stream_sid)).start() if RECORD_CALLS else None
+    readers = []        # the two read loops; cancelling them ends the call
+
+    async def abort_call():
+        for task in readers:
+            task.cancel()
+
+    # Each direction gets its own bounded queue and writer task so a slow peer never
+    # stalls reading from the other one; see bridge.Outbox for the drop/merge policies.
+    # Downstream audio is released in real time, so a barge-in has little to clear.
+    if PLAYBACK_LEAD_MS > 0:
+        downstream = PacedOutbox(
+            "downstream", websocket.send_text, twilio_frames.media,
+            lead_ms=PLAYBACK_LEAD_MS, frame_ms=PLAYBACK_FRAME_MS, max_queued_ms=PLAYBACK_QUEUE_MAX_MS,
+            maxsize=BRIDGE_QUEUE_MAX, stall_timeout=BRIDGE_STALL_TIMEOUT_S, on_stall=abort_call,
+        ).start()
+    else:
+        downstream = Outbox(
+            "downstream", websocket.send_text, twilio_frames.media,
+            maxsize=BRIDGE_QUEUE_MAX, stall_timeout=BRIDGE_STALL_TIMEOUT_S, on_stall=abort_call,
+        ).start()
+
+    caller = websocket.query_params.get("caller")
+    to = websocket.query_params.get("to")
+    outbound = websocket.query_params.get("lead") is not None   # a campaign call; we speak first
+    opening = None
+    if not caller or not to or outbound:
+        # /incoming-call may have been served by another worker
+        record = await load_call(call_sid)
+        caller, to = caller or record.get("caller"), to or record.get("to")
+        opening = record.get("opening")
+    tenant = tenants.get(to)
+
+    # A cached greeting starts playing now, while the upstream session is still being adopted.
+    # It answers an inbound call, so campaign calls open live instead.
+    greeting = greeting_for(tenant) if not outbound else None
+    if greeting is not None:
+        if recorder is not None:
+            recorder.transcript("assistant", greeting.transcript, item_id=GREETING_ITEM)
+        for payload in greeting.payloads:
+            downstream.put_audio(payload)
+            if recorder is not None:
+                recorder.assistant_audio(payload)
+            mark = playback.on_audio(GREETING_ITEM, payload)
+            if mark:
+                downstream.put(twilio_frames.mark(mark), droppable=True)
+        mark = playback.end_of_response()
+        if mark:
+            downstream.put(twilio_frames.mark(mark), droppable=True)
+        FIRST_AUDIO.observe(time.perf_counter() - stream_started)
+
+    # Adopt the speculative session, else take a pre-warmed one, else dial
+    try:
+        openai_ws = await speculative_sessions.adopt(call_sid)
+        pooled = True
+        if openai_ws is not None:
+            log.info("✅ Adopted speculative OpenAI session")
+        else:
+            openai_ws, pooled = await acquire_session(tenant)
+            log.info("✅ Connected to OpenAI", extra={"pooled": pooled, "pool": session_pool.snapshot()})
+        # Dialed on the call path: time its session.update when session.updated comes back
+        session_init_started = None if pooled else time.perf_counter()
+        if outbound and campaign_dialer is not None:
+            campaign_dialer.connected(call_sid)
     except Exception as e:
-        print("❌ [ERROR] Failed to connect to OpenAI WebSocket:", e)
+        log.exception("❌ Failed to connect to OpenAI WebSocket")
+        capacity.upstream_failed(call_sid)
+        if outbound and campaign_dialer is not None:
+            campaign_dialer.upstream_failed(call_sid)
+        await downstream.close()
+        if recorder is not None:
+            await recorder.close()
         await websocket.close()
         return
 
-    # Initialize session
     try:
-        await initialize_session(openai_ws)
-        print("✅ [DEBUG] initialize_session succeeded")
-
-        await openai_ws.send(json.dumps({
-        "type": "response.create",
-        "response": {
-            "modalities": ["text", "audio"]
-        }
-        }))
-        print("🔔 [DEBUG] Sent initial response.create to start AI turn")
-        
+        if greeting is not None:
+            # The caller already hears the greeting; make the model's history match it
+            await openai_ws.send(greeting.seed_event())
+            log.debug("🔔 Seeded conversation with the cached greeting")
+        else:
+            if opening:
+                # Campaign call: tell the model why it is calling before its first turn
+                await openai_ws.send(json.dumps({
+                    "type": "conversation.item.create",
+                    "item": {"type": "message", "role": "system",
+                             "content": [{"type": "input_text", "text": opening}]},
+                }))
+            # Start the AI turn
+            await openai_ws.send(json.dumps({
+            "type": "response.create",
+            "response": {
+                "modalities": ["text", "audio"]
+            }
+            }))
+            log.debug("🔔 Sent initial response.create to start AI turn")
+
     except Exception as e:
-        print("❌ [ERROR] initialize_session raised:", e)
+        log.error("❌ initial response.create failed: %r", e)
+
+    # pcm16 upstream: everything on this side of the bridge (caches, recorder, VAD,
+    # playback marks) still sees Twilio's mu-law; conversion happens at the two edges
+    upstream_codec, downstream_codec = make_pcm16_codecs()
+    if upstream_codec is not None:
+        # Batched mu-law is upsampled in order by the upstream writer, one conversion per append
+        encode_upstream = lambda audio: encode_append_audio(upstream_codec.process(audio))
+    else:
+        encode_upstream = encode_append_audio
 
     # Shared state
-    stream_sid = None
-    call_sid = None
+    prompt_version = tenant.session_config.version_of(openai_ws)
+    bind_call(callSid=call_sid, streamSid=stream_sid, caller=caller, tenant=tenant.number,
+              prompt_version=prompt_version)
+    await save_call(call_sid, stream_sid=stream_sid, status="streaming")
+    log.info("📞 Media stream started", extra={"greeting": greeting is not None})
     latest_media_timestamp = 0
-    last_assistant_item = None
-    mark_queue = []
-    response_start_timestamp_twilio = None
+    last_assistant_item = GREETING_ITEM if greeting is not None else None
+    upstream = Outbox(
+        "upstream", openai_ws.send, encode_upstream,
+        maxsize=BRIDGE_QUEUE_MAX, merge_audio=True, stall_timeout=BRIDGE_STALL_TIMEOUT_S,
+        on_stall=abort_call, lag_histogram=TWILIO_TO_UPSTREAM_LAG,
+    ).start()
+    inbound_audio = InboundAudioBatcher(upstream.put_audio, batch_ms=INBOUND_BATCH_MS)
+    local_vad = make_local_vad()
+    barge_in = None     # (item_id, audio_end_ms) cleared locally, awaiting server speech_started
+    control_tokens = ControlTokenScanner()
+    after_playback = []     # hangup/transfer seen in this response, run once its audio has played
+    turn_started = None     # perf_counter() at speech_stopped, until the reply's first audio
+    first_audio_pending = greeting is None
+    response_id = None          # live response in progress
+    response_payloads = []      # its audio, kept in case it answers an FAQ
+    response_items = []         # its output item ids, so a cancel can drop their deltas
+    response_actions = False    # it carried control tokens; never cache those
+    turn_audio_sent = False     # live audio already forwarded for the caller's last turn
+    faq_intent = None           # FAQ asked in the caller's last turn, answer not cached yet
+    suppressed = set()          # response / item ids replaced by a cached FAQ answer
+    suppress_next_response = False
+    active_playbacks.add(playback)
+    ACTIVE_CALLS.inc()
+    capacity.started(call_sid)
 
     async def receive_from_twilio():
         nonlocal stream_sid, call_sid, latest_media_timestamp
         try:
             async for message in websocket.iter_text():
+                media = parse_twilio_media(message)
+                if media is not None:
+                    latest_media_timestamp, payload = media
+                    handle_inbound_audio(payload)
+                    continue
+
                 data = json.loads(message)
                 event = data.get('event')
 
                 if event == 'start':
                     stream_sid = data['start']['streamSid']
                     call_sid = data['start']['callSid']
-                    print(f"[DEBUG][receive] Captured streamSid={stream_sid}, callSid={call_sid}")
+                    log.debug("Captured new streamSid", extra={"new_streamSid": stream_sid})
                     latest_media_timestamp = 0
                     
                 elif event == 'media':
                     latest_media_timestamp = int(data['media']['timestamp'])
-                    await openai_ws.send(json.dumps({
-                        "type": "input_audio_buffer.append",
-                        "audio": data['media']['payload']
-                    }))
+                    handle_inbound_audio(data['media']['payload'])
                 elif event == 'mark':
-                    if mark_queue:
-                        mark_queue.pop(0)
+                    inbound_audio.flush()
+                    playback.on_mark(data['mark']['name'])
+                elif event == 'stop':
+                    inbound_audio.flush()
+                    log.info("📴 Twilio stream stopped", extra={
+                        "frames_in": inbound_audio.frames_in, "appends_out": inbound_audio.appends_out,
+                        "marks_sent": playback.marks_sent})
         except WebSocketDisconnect:
-            if not openai_ws.closed:
-                await openai_ws.close()
+            pass
+        except Exception as e:
+            log.error("❌ receive_from_twilio crashed: %r", e)
+            raise
 
     async def send_to_twilio():
-        nonlocal last_assistant_item, response_start_timestamp_twilio
+        nonlocal barge_in, turn_started, session_init_started, response_id, response_payloads
+        nonlocal response_actions, response_items, turn_audio_sent, faq_intent, suppress_next_response
         try:
             async for raw in openai_ws:
+                delta = parse_audio_delta(raw)
+                if delta is not None:
+                    log_event(log, 'response.audio.delta', "⏱️  EVENT")
+                    forward_audio(*delta)
+                    continue
+
                 evt = json.loads(raw)
                 etype = evt.get('type')
-                print("⏱️  EVENT:", etype)
+                log_event(log, etype, "⏱️  EVENT")
+
+                if etype == 'response.created':
+                    response_id = evt['response']['id']
+                    response_payloads, response_actions, response_items = [], False, []
+                    if suppress_next_response:
+                        # Answered from the FAQ cache before this response even started
+                        suppress_next_response = False
+                        suppress_response(response_id)
+                elif etype == 'rate_limits.updated':
+                    capacity.on_rate_limits(evt.get('rate_limits', []))
+                    capacity_freed()
+                elif etype == 'error' and (evt.get('error') or {}).get('code') == 'rate_limit_exceeded':
+                    capacity.upstream_error('rate_limit_exceeded')
+                elif etype == 'response.output_item.added':
+                    # Audio deltas take the fast path and carry only their item id
+                    if evt.get('response_id') == response_id:
+                        response_items.append(evt['item']['id'])
+                    if evt.get('response_id') in suppressed:
+                        suppressed.add(evt['item']['id'])
+                elif etype == 'conversation.item.input_audio_transcription.completed':
+                    if recorder is not None:
+                        recorder.transcript("caller", evt.get('transcript', '').strip(), item_id=evt.get('item_id'))
+                    if faq_cache is not None:
+                        on_caller_transcript(evt.get('transcript', ''))
+
+                if evt.get('response_id') in suppressed:
+                    continue
+                if etype == 'response.done' and evt['response'].get('id') in suppressed:
+                    # The cached answer was seeded in its place; drop the cancelled items
+                    for item in evt['response'].get('output', []):
+                        upstream.put(json.dumps({'type': 'conversation.item.delete', 'item_id': item['id']}))
+                    response_id = None
+                    continue
+
+                if etype == 'input_audio_buffer.speech_stopped':
+                    turn_started = time.perf_counter()
+                elif etype == 'session.updated' and session_init_started is not None:
+                    SESSION_INIT.observe(time.perf_counter() - session_init_started)
+                    session_init_started = None
+
+                if etype in ('response.audio_transcript.delta', 'response.text.delta'):
+                    if recorder is not None:
+                        recorder.transcript("assistant", evt.get('delta', ''), item_id=evt.get('item_id'), delta=True)
+                    for action, data in control_tokens.feed(evt.get('delta', '')):
+                        on_control_action(action, data)
 
                 if etype == 'response.done':
                     outputs = evt['response'].get('output', [])
@@ -187,109 +924,289 @@ async def handle_media_stream(websocket: WebSocket):
                                 elif 'text' in chunk:
                                     pieces.append(chunk['text'])
                         text = ''.join(pieces).strip()
-                        print("📝  FINAL TEXT:", repr(text))
-
-                        if '<<' in text.lower() or text.endswith('<<'):
-                            try:
-                                json_part = text.split('<<')[-1].strip()
-                                booking_data = json.loads(json_part)
-                                print("📬 Booking data parsed:", booking_data)
-                                send_booking_to_formspree(booking_data)
-                            except Exception as e:
-                                print("❌ Failed to parse booking JSON:", e)
-
-                        if ('>>' in text or text.endswith('>>')) and etype == 'response.done':
-                            print("📴  HANGUP signal received, closing WS")
-                            await send_mark(websocket, stream_sid)
-                            await asyncio.sleep(2)
-                            await websocket.close()
-                            return
-                                            
-                        if '^^' in text or text.endswith('^^'):
-                            print(f"[DEBUG][send] Booking marker detected; callSid={call_sid!r}")
-                            await send_mark(websocket, stream_sid)
-                            await asyncio.sleep(5)
-                            if not call_sid:
-                                print("[ERROR][send] No call_sid! Cannot fetch call.")
-                            else:
-                                twilio_client.calls(call_sid).update(
-                                method="POST",
-                                url="https://ai-phone-voice.onrender.com/forward-call"
-                            )
+                        log.info("📝  FINAL TEXT", extra={"text": text})
+                        if recorder is not None:
+                            recorder.transcript("assistant", text, response_id=evt['response'].get('id'),
+                                                status=evt['response'].get('status'))
+                        if not control_tokens.text_seen:
+                            for action, data in control_tokens.feed(text):
+                                on_control_action(action, data)
+
+                    for action, data in control_tokens.finish():
+                        on_control_action(action, data)
+                    if (faq_intent and outputs and not response_actions
+                            and evt['response'].get('status') == 'completed'):
+                        faq_cache.put(prompt_version, faq_intent, response_payloads, text)
+                        faq_intent = None
+                    response_id, response_payloads = None, []
+                    if after_playback:
+                        actions = list(after_playback)
+                        after_playback.clear()
+                        send_mark(playback.end_of_response())
+                        asyncio.create_task(run_after_playback(actions))
 
                 if etype in LOG_EVENT_TYPES and SHOW_TIMING_MATH:
-                    print(f"Event: {etype}", evt)
+                    log.info("Event: %s", etype, extra={"evt": evt})
                 if etype == 'response.audio.delta' and 'delta' in evt:
-                    payload = evt['delta']
-                    await websocket.send_json({
-                        'event': 'media',
-                        'streamSid': stream_sid,
-                        'media': {'payload': payload}
-                    })
-                    if response_start_timestamp_twilio is None:
-                        response_start_timestamp_twilio = latest_media_timestamp
-                    if evt.get('item_id'):
-                        last_assistant_item = evt['item_id']
-                    await send_mark(websocket, stream_sid)
-
-                if etype == 'input_audio_buffer.speech_started' and last_assistant_item:
-                    elapsed = latest_media_timestamp - response_start_timestamp_twilio
-                    await openai_ws.send(json.dumps({
-                        'type': 'conversation.item.truncate',
-                        'item_id': last_assistant_item,
-                        'content_index': 0,
-                        'audio_end_ms': elapsed
-                    }))
-                    await websocket.send_json({
-                        'event': 'clear',
-                        'streamSid': stream_sid
-                    })
+                    forward_audio(evt.get('item_id'), evt['delta'])
+
+                if etype == 'response.audio.done':
+                    send_mark(playback.end_of_response())
+
+                if etype == 'input_audio_buffer.speech_started':
+                    inbound_audio.flush()
+                    turn_audio_sent, faq_intent, suppress_next_response = False, None, False
+
+                if etype == 'input_audio_buffer.speech_started' and barge_in:
+                    # Twilio was already cleared by the local detector; commit its truncation
+                    confirmed, barge_in = barge_in, None
+                    truncate_item(*confirmed)
+                    if SHOW_TIMING_MATH:
+                        log.info("Local barge-in confirmed by server VAD",
+                                 extra={"item_id": confirmed[0], "audio_end_ms": confirmed[1]})
+
+                elif etype == 'input_audio_buffer.speech_started' and last_assistant_item and playback.is_playing:
+                    audio_end_ms = playback.item_played_ms()
+                    truncate_item(last_assistant_item, audio_end_ms)
+                    clear_playback()
+                    if SHOW_TIMING_MATH:
+                        log.info("Truncated assistant item", extra={
+                            "item_id": last_assistant_item, "audio_end_ms": audio_end_ms,
+                            "marks_sent": playback.marks_sent})
         except Exception as e:
-            print("❌ [ERROR] send_to_twilio crashed:", e)
+            log.error("❌ send_to_twilio crashed: %r", e)
             raise
 
-    async def send_mark(connection, stream_sid):
-        mark_event = {"event": "mark", "streamSid": stream_sid, "mark": {"name": "responsePart"}}
-        await connection.send_json(mark_event)
-        mark_queue.append('responsePart')
+    def on_control_action(action, data):
+        nonlocal response_actions
+        response_actions = True
+        if action == 'booking':
+            log.info("📬 Booking data parsed", extra={"booking": data})
+            side_effects.submit("formspree", send_booking_to_formspree, tenant.booking_url, data)
+        elif action == 'hangup':
+            log.info("📴  HANGUP signal received, closing WS once playback finishes")
+            after_playback.append(action)
+        elif action == 'transfer':
+            log.info("Transfer marker detected")
+            after_playback.append(action)
+
+    async def run_after_playback(actions):
+        # The end-of-response mark comes back when the caller has heard the last word
+        drained = await playback.wait_drained(timeout=playback.buffered_ms / 1000 + PLAYBACK_DRAIN_GRACE_S)
+        if not drained:
+            log.warning("Playback-complete mark not seen in time; continuing")
+        if 'transfer' in actions:
+            if not call_sid:
+                log.error("No call_sid! Cannot transfer call.")
+            else:
+                # On a campaign call Twilio's `To` is the lead, so the tenant rides in the URL
+                side_effects.submit(
+                    "transfer",
+                    twilio_client().calls(call_sid).update,
+                    method="POST",
+                    url=f"https://{PUBLIC_HOST}/forward-call?tenant={quote_plus(tenant.number or '')}"
+                )
+        if 'hangup' in actions:
+            try:
+                await websocket.close()
+            except Exception as e:
+                log.warning("❌ closing Twilio WebSocket failed: %r", e)
+
+    def handle_inbound_audio(payload):
+        if recorder is not None:
+            recorder.caller_audio(payload)
+        if local_vad is None:
+            inbound_audio.add(payload)
+            return
+        audio = base64.b64decode(payload)
+        inbound_audio.add_audio(audio)
+        if local_vad.process(audio) == 'start' and last_assistant_item and playback.is_playing and not barge_in:
+            local_barge_in()
+
+    def local_barge_in():
+        # Stop playback now instead of waiting ~300 ms for the server's speech_started
+        nonlocal barge_in
+        inbound_audio.flush()
+        barge_in = (last_assistant_item, playback.item_played_ms())
+        clear_playback()
+        asyncio.create_task(expire_barge_in(barge_in))
+
+    def clear_playback():
+        # Audio still queued for Twilio is what the caller just talked over
+        downstream.drop_stale()
+        downstream.put(twilio_frames.clear)
+        playback.on_clear()
+        if recorder is not None:
+            recorder.assistant_cleared()
 
-    print("🔔 [DEBUG] Entering asyncio.gather")
+    async def expire_barge_in(state):
+        # Server VAD never heard speech (cough, line noise): commit what the caller
+        # heard and let the model pick up from there.
+        nonlocal barge_in
+        await asyncio.sleep(LOCAL_VAD_CONFIRM_MS / 1000)
+        if barge_in is not state:
+            return
+        barge_in = None
+        log.info("Local barge-in not confirmed; resuming", extra={"item_id": state[0]})
+        upstream.put(json.dumps({'type': 'response.cancel'}))
+        truncate_item(*state)
+        upstream.put(json.dumps({'type': 'response.create', 'response': {'modalities': ['text', 'audio']}}))
+
+    def truncate_item(item_id, audio_end_ms):
+        if item_id.startswith(CACHED_ITEM):
+            return      # cached clips are seeded as text upstream; nothing to truncate
+        upstream.put(json.dumps({
+            'type': 'conversation.item.truncate',
+            'item_id': item_id,
+            'content_index': 0,
+            'audio_end_ms': audio_end_ms
+        }))
+
+    def forward_audio(item_id, payload):
+        nonlocal last_assistant_item, turn_started, first_audio_pending, turn_audio_sent
+        if barge_in and item_id == barge_in[0]:
+            return      # rest of the response the caller talked over
+        if item_id in suppressed:
+            return
+        cached = (item_id or "").startswith(CACHED_ITEM)
+        if downstream_codec is not None and not cached:
+            # Cached clips are stored already converted, as Twilio plays them
+            if item_id != last_assistant_item:
+                downstream_codec.reset()
+            payload = base64.b64encode(downstream_codec.process(base64.b64decode(payload))).decode("ascii")
+            if not payload:
+                return
+        if faq_cache is not None and not cached:
+            turn_audio_sent = True
+            response_payloads.append(payload)
+        if first_audio_pending:
+            FIRST_AUDIO.observe(time.perf_counter() - stream_started)
+            first_audio_pending = False
+        if turn_started is not None:
+            latency = time.perf_counter() - turn_started
+            TURN_LATENCY.observe(latency)
+            log.info("⏱️  turn latency", extra={"turn_latency_ms": round(latency * 1000, 1)})
+            turn_started = None
+        downstream.put_audio(payload)
+        if recorder is not None:
+            recorder.assistant_audio(payload)
+        if item_id:
+            last_assistant_item = item_id
+        send_mark(playback.on_audio(item_id, payload))
+
+    def on_caller_transcript(transcript):
+        nonlocal faq_intent, suppress_next_response
+        intent = faq_cache.intent(transcript)
+        if intent is None or prompt_version is None:
+            return
+        result, clip = faq_cache.lookup(prompt_version, intent, late=turn_audio_sent)
+        if result == 'miss':
+            faq_intent = intent     # cache the live answer once it completes
+        if clip is None:
+            return
+        log.info("💾 FAQ answered from cache", extra={"intent": intent, "duration_ms": clip.duration_ms})
+        if recorder is not None:
+            recorder.transcript("assistant", clip.transcript, item_id=CACHED_ITEM + "faq:" + intent)
+        if response_id is not None:
+            suppress_response(response_id)
+        else:
+            suppress_next_response = True
+        upstream.put(clip.seed_event())
+        for payload in clip.payloads:
+            forward_audio(CACHED_ITEM + "faq:" + intent, payload)
+        send_mark(playback.end_of_response())
+
+    def suppress_response(rid):
+        suppressed.add(rid)
+        if rid == response_id:
+            suppressed.update(response_items)   # items announced before the FAQ hit
+        upstream.put(json.dumps({'type': 'response.cancel'}))
+
+    def send_mark(name):
+        if name:
+            downstream.put(twilio_frames.mark(name), droppable=True)
+
+    # Whichever side ends first (Twilio hangup, upstream close, stalled peer) ends the call
+    log.debug("🔔 Starting bridge")
+    readers.extend((asyncio.create_task(receive_from_twilio()), asyncio.create_task(send_to_twilio())))
     try:
-        await asyncio.gather(receive_from_twilio(), send_to_twilio())
-    except Exception as e:
-        print("❌ [ERROR] asyncio.gather returned:", e)
+        await asyncio.wait(readers, return_when=asyncio.FIRST_COMPLETED)
     finally:
-        print("🔔 [DEBUG] WebSocket handler exiting")
-
-async def initialize_session(openai_ws):
-    session_update = {
-        "type": "session.update",
-        "session": {
-            "turn_detection": {"type": "server_vad"},
-            "input_audio_format": "g711_ulaw",
-            "output_audio_format": "g711_ulaw",
-            "voice": VOICE,
-            "instructions": SYSTEM_MESSAGE,
-            "modalities": ["text", "audio"],
-            "temperature": 0.8,
-        }
-    }
-    print('🔔 [DEBUG] Sending session update')
-    await openai_ws.send(json.dumps(session_update))
+        for task in readers:
+            task.cancel()
+        await asyncio.gather(*readers, return_exceptions=True)
+        await upstream.close()
+        await downstream.close()
+        await openai_ws.close()
+        if recorder is not None:
+            await recorder.close()
+        active_playbacks.discard(playback)
+        ACTIVE_CALLS.dec()
+        capacity.ended()
+        capacity_freed()
+        await save_call(call_sid, status="ended")
+        log.info("🔔 WebSocket handler exiting", extra={
+            "upstream": upstream.snapshot(), "downstream": downstream.snapshot()})
 
+def make_pcm16_codecs():
+    """Per-call (caller -> upstream, upstream -> Twilio) converters, or (None, None) for g711_ulaw."""
+    if not PCM16:
+        return None, None
+    from audio import GainNormalizer, Pcm16ToTwilio, TwilioToPcm16     # numpy; imported by warm_up()
+    return TwilioToPcm16(GainNormalizer() if INBOUND_GAIN_NORMALIZE else None), Pcm16ToTwilio()
 
-def send_booking_to_formspree(data: dict):
+def make_local_vad():
+    if not LOCAL_VAD:
+        return None
+    from vad import UlawEnergyVad       # numpy; imported by warm_up() before the first call
     try:
-        form_url = os.getenv("FORMSPREE_URL")
-        if not form_url:
-            print("❌ FORMSPREE_URL not set in .env")
-            return
+        return UlawEnergyVad(
+            threshold_db=LOCAL_VAD_THRESHOLD_DB,
+            attack_ms=LOCAL_VAD_ATTACK_MS,
+            hangover_ms=LOCAL_VAD_HANGOVER_MS,
+        )
+    except RuntimeError as e:
+        log.error("❌ Local VAD disabled: %s", e)
+        return None
 
-        # Prepare the payload in a standard way
-        response = httpx.post(form_url, data=data)
-        print(f"✅ Booking info sent to Formspree: {response.status_code}")
-    except Exception as e:
-        print("❌ Failed to send booking form:", e)
+async def wait_for_start(websocket):
+    while True:
+        data = json.loads(await websocket.receive_text())
+        if data.get('event') == 'start':
+            return data
+
+async def wait_for_session_updated(openai_ws, timeout=10):
+    async def _wait():
+        async for raw in openai_ws:
+            evt = json.loads(raw)
+            if evt.get('type') == 'session.updated':
+                return
+            if evt.get('type') == 'error':
+                raise RuntimeError(f"session.update rejected: {evt.get('error')}")
+        raise ConnectionError("upstream closed before session.updated")
+    await asyncio.wait_for(_wait(), timeout)
+
+async def initialize_session(openai_ws, tenant=None):
+    tenant = tenant or default_tenant
+    config = tenant.session_config
+    log.debug('🔔 Sending session update', extra={"prompt_version": config.version, "tenant": tenant.number})
+    await config.send(openai_ws, tenant.voice, **session_settings())
+
+def session_settings():
+    # Caller transcripts are only needed to recognise FAQ questions and for recordings
+    transcribe = TRANSCRIBE_MODEL if faq_cache is not None or RECORD_CALLS else None
+    return {"temperature": TEMPERATURE, "transcribe": transcribe, "audio_format": UPSTREAM_AUDIO_FORMAT}
+
+
+async def send_booking_to_formspree(form_url, data: dict):
+    if not form_url:
+        log.error("❌ No booking URL: set FORMSPREE_URL in .env or booking_url for the tenant")
+        return
+
+    # Prepare the payload in a standard way
+    response = await side_effects.http.post(form_url, data=data)
+    response.raise_for_status()
+    log.info("✅ Booking info sent to Formspree", extra={"status": response.status_code})
 
 if __name__ == "__main__":
     import uvicorn
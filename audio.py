@@ -0,0 +1,225 @@
+try:
+    import numpy as np
+    from numpy.lib.stride_tricks import as_strided
+except ImportError:     # only needed for pcm16 upstream audio and local VAD
+    np = None
+
+# Twilio media streams are 8 kHz G.711 mu-law; the realtime API's pcm16 is 24 kHz
+# little-endian PCM16. Everything here works on whole frames as NumPy arrays:
+# mu-law goes through lookup tables (256 entries to decode, 65536 to encode) and
+# the 3x rate change is a polyphase FIR evaluated as one matrix product per frame.
+
+TWILIO_RATE = 8000
+PCM16_RATE = 24000
+RATIO = PCM16_RATE // TWILIO_RATE
+ULAW_BIAS = 0x84
+ULAW_CLIP = 32635
+
+_DECODE = None
+_ENCODE = None
+_FILTER = None
+
+
+def _require_numpy():
+    if np is None:
+        raise RuntimeError("numpy is required for audio conversion")
+
+
+def ulaw_decode_table():
+    """G.711 mu-law byte -> linear PCM16 for all 256 codes."""
+    _require_numpy()
+    u = ~np.arange(256, dtype=np.int32) & 0xFF
+    exponent = (u >> 4) & 0x07
+    mantissa = u & 0x0F
+    magnitude = (((mantissa << 3) + ULAW_BIAS) << exponent) - ULAW_BIAS
+    return np.where(u & 0x80, -magnitude, magnitude).astype(np.int16)
+
+
+def ulaw_encode_table():
+    """Linear PCM16 (indexed as uint16) -> G.711 mu-law byte for all 65536 values."""
+    _require_numpy()
+    s = np.arange(65536, dtype=np.int32)
+    s = np.where(s >= 32768, s - 65536, s)
+    sign = np.where(s < 0, 0x80, 0)
+    magnitude = np.minimum(np.abs(s), ULAW_CLIP) + ULAW_BIAS
+    # frexp's exponent is the bit length; magnitude >= 0x84 has at least 8 bits
+    exponent = np.clip(np.frexp(magnitude)[1] - 8, 0, 7)
+    mantissa = (magnitude >> (exponent + 3)) & 0x0F
+    return (~(sign | (exponent << 4) | mantissa) & 0xFF).astype(np.uint8)
+
+
+def _tables():
+    global _DECODE, _ENCODE
+    if _ENCODE is None:
+        _DECODE, _ENCODE = ulaw_decode_table(), ulaw_encode_table()
+    return _DECODE, _ENCODE
+
+
+def ulaw_decode(data):
+    """mu-law bytes -> int16 samples."""
+    return _tables()[0][np.frombuffer(data, dtype=np.uint8)]
+
+
+def ulaw_encode(samples):
+    """int16 samples -> mu-law bytes."""
+    return _tables()[1][np.asarray(samples, dtype=np.int16).view(np.uint16)].tobytes()
+
+
+def lowpass_filter(taps_per_phase=16, cutoff_hz=3600, beta=8.0):
+    """Kaiser-windowed sinc at 24 kHz, RATIO * taps_per_phase long, unity DC gain.
+
+    The cutoff sits below 4 kHz (the 8 kHz Nyquist) so it both removes the images
+    of upsampling and band-limits before decimation; telephone audio ends at 3.4 kHz.
+    """
+    _require_numpy()
+    n = RATIO * taps_per_phase
+    t = np.arange(n) - (n - 1) / 2
+    fc = cutoff_hz / PCM16_RATE
+    h = 2 * fc * np.sinc(2 * fc * t) * np.kaiser(n, beta)
+    return (h / h.sum()).astype(np.float32)
+
+
+def _filter():
+    global _FILTER
+    if _FILTER is None:
+        _FILTER = lowpass_filter()
+    return _FILTER
+
+
+def _to_int16(y):
+    return np.clip(np.rint(y), -32768, 32767).astype(np.int16)
+
+
+def _windows(x, width, step=1):
+    """Read-only (n, width) view of overlapping windows of the contiguous float32 `x`.
+
+    as_strided directly: sliding_window_view's argument checks cost as much as the
+    product itself at 20 ms frame sizes.
+    """
+    n = (len(x) - width) // step + 1
+    return as_strided(x, (n, width), (x.strides[0] * step, x.strides[0]), writeable=False)
+
+
+class Upsampler:
+    """8 kHz -> 24 kHz, streaming: keeps the filter history between frames.
+
+    Each output sample is one of RATIO polyphase branches of the low-pass over the
+    last `taps_per_phase` inputs, so a frame is a (samples x taps) window view times
+    a (taps x RATIO) matrix, interleaved by ravel().
+    """
+
+    def __init__(self, h=None):
+        _require_numpy()
+        h = _filter() if h is None else h
+        self.taps = len(h) // RATIO
+        # branch p uses h[p], h[p + RATIO], ...; reversed for a dot product with the window
+        self._phases = (np.stack([h[p::RATIO][::-1] for p in range(RATIO)], axis=1) * RATIO).astype(np.float32)
+        self._history = np.zeros(self.taps - 1, dtype=np.float32)
+
+    def process(self, samples):
+        x = np.concatenate((self._history, samples.astype(np.float32)))
+        self._history = x[len(x) - (self.taps - 1):]
+        return _to_int16((_windows(x, self.taps) @ self._phases).ravel())
+
+    def reset(self):
+        self._history[:] = 0
+
+
+class Downsampler:
+    """24 kHz -> 8 kHz, streaming: low-pass, keeping every RATIO-th output.
+
+    Only the kept outputs are computed (a strided window view times the filter).
+    Inputs that do not complete an output yet stay in the history, so frame sizes
+    need not be multiples of RATIO.
+    """
+
+    def __init__(self, h=None):
+        _require_numpy()
+        h = _filter() if h is None else h
+        self._h = h[::-1].astype(np.float32).copy()
+        self._history = np.zeros(len(h) - 1, dtype=np.float32)
+
+    def process(self, samples):
+        x = np.concatenate((self._history, samples.astype(np.float32)))
+        n = len(self._h)
+        if len(x) < n:
+            self._history = x
+            return np.zeros(0, dtype=np.int16)
+        windows = _windows(x, n, RATIO)
+        self._history = x[len(windows) * RATIO:]
+        return _to_int16(windows @ self._h)
+
+    def reset(self):
+        self._history = np.zeros(len(self._h) - 1, dtype=np.float32)
+
+
+class GainNormalizer:
+    """Frame-level automatic gain towards `target_dbfs` RMS.
+
+    The gain is bounded by `max_gain_db` (so silence and line noise are not pumped
+    up), frames quieter than `floor_dbfs` keep the current gain, and changes are
+    smoothed per frame (`attack` when lowering, `release` when raising) and ramped
+    linearly across the frame, so there are no steps at frame boundaries.
+    """
+
+    def __init__(self, target_dbfs=-20.0, max_gain_db=18.0, floor_dbfs=-50.0, attack=0.5, release=0.05):
+        _require_numpy()
+        self.target = 10 ** (target_dbfs / 20) * 32768
+        self.max_gain = 10 ** (max_gain_db / 20)
+        self.floor = 10 ** (floor_dbfs / 20) * 32768
+        self.attack = attack
+        self.release = release
+        self.gain = 1.0
+        self._ramps = {}        # frame length -> 0..1 ramp
+
+    def process(self, samples):
+        x = samples.astype(np.float32)
+        if not len(x):
+            return samples
+        rms = float(np.sqrt(np.mean(np.square(x))))
+        previous = self.gain
+        if rms > self.floor:
+            wanted = min(self.target / rms, self.max_gain)
+            rate = self.attack if wanted < previous else self.release
+            self.gain = previous + (wanted - previous) * rate
+        # never clip: a loud peak pulls the gain down at once
+        peak = float(np.max(np.abs(x)))
+        if peak * self.gain > 32767:
+            self.gain = 32767 / peak
+        ramp = self._ramps.get(len(x))
+        if ramp is None:
+            ramp = self._ramps[len(x)] = np.linspace(0, 1, len(x), dtype=np.float32)
+        return _to_int16(x * (previous + (self.gain - previous) * ramp))
+
+
+class TwilioToPcm16:
+    """Inbound Twilio mu-law 8 kHz -> pcm16 24 kHz bytes for input_audio_buffer.append."""
+
+    def __init__(self, normalize=None):
+        self._up = Upsampler()
+        self._gain = normalize          # optional GainNormalizer, applied at 8 kHz
+
+    def process(self, ulaw):
+        samples = ulaw_decode(ulaw)
+        if self._gain is not None:
+            samples = self._gain.process(samples)
+        return self._up.process(samples).astype("<i2").tobytes()
+
+
+class Pcm16ToTwilio:
+    """Outbound pcm16 24 kHz (response.audio.delta) -> Twilio mu-law 8 kHz."""
+
+    def __init__(self):
+        self._down = Downsampler()
+        self._odd = b""                 # half a sample left over from the previous chunk
+
+    def process(self, pcm):
+        pcm = self._odd + pcm
+        whole = len(pcm) & ~1
+        self._odd = pcm[whole:]
+        return ulaw_encode(self._down.process(np.frombuffer(pcm, dtype="<i2", count=whole // 2)))
+
+    def reset(self):
+        """Start a new response without the previous one's filter tail."""
+        self._down.reset()
+        self._odd = b""
@@ -0,0 +1,48 @@
+import time
+import base64
+
+ULAW_BYTES_PER_MS = 8       # 8 kHz, 1 byte per sample
+
+
+class InboundAudioBatcher:
+    """Merges consecutive Twilio media payloads into one input_audio_buffer.append.
+
+    Twilio delivers 20 ms frames; sending each one upstream costs a json.dumps and a
+    websocket write, 50 times a second per call. Frames are buffered until `batch_ms`
+    of audio is pending; callers flush() early on stop/mark events and on barge-in so
+    latency-sensitive audio never waits for a full batch. batch_ms <= 20 disables
+    batching.
+    """
+
+    def __init__(self, sink, batch_ms=80):
+        self.sink = sink                    # (audio bytes, arrival times) -> None, e.g. Outbox.put_audio
+        self.batch_bytes = max(1, int(batch_ms * ULAW_BYTES_PER_MS))
+        self._chunks = []
+        self._arrivals = []
+        self._pending = 0
+        self.frames_in = 0
+        self.appends_out = 0
+
+    @property
+    def pending_ms(self):
+        return self._pending / ULAW_BYTES_PER_MS
+
+    def add(self, payload):
+        self.add_audio(base64.b64decode(payload))
+
+    def add_audio(self, audio):
+        self._chunks.append(audio)
+        self._arrivals.append(time.monotonic())
+        self._pending += len(audio)
+        self.frames_in += 1
+        if self._pending >= self.batch_bytes:
+            self.flush()
+
+    def flush(self):
+        if not self._chunks:
+            return
+        chunks, self._chunks, self._pending = self._chunks, [], 0
+        arrivals, self._arrivals = self._arrivals, []
+        audio = chunks[0] if len(chunks) == 1 else b"".join(chunks)
+        self.appends_out += 1
+        self.sink(audio, arrivals)
@@ -0,0 +1,106 @@
+"""Benchmark: audio.py codec / resampler throughput in 20 ms frames per second per core.
+
+    python -m bench.audio [--frame-ms 20] [--number 20000]
+
+Each stage runs on one core (BLAS threads pinned to 1) over `--frame-ms` chunks of
+speech-like audio and is reported as 20 ms frames per CPU second; a bridged call
+needs 50 of them per second in each direction. Where the stdlib's audioop is still
+available (Python < 3.13) its equivalents are timed alongside; its ratecv is linear
+interpolation without an anti-aliasing filter, so it is the cheap-but-worse baseline.
+"""
+import os
+
+for _var in ("OPENBLAS_NUM_THREADS", "OMP_NUM_THREADS", "MKL_NUM_THREADS"):
+    os.environ.setdefault(_var, "1")
+
+import timeit          # noqa: E402
+import argparse        # noqa: E402
+import warnings        # noqa: E402
+
+import numpy as np     # noqa: E402
+
+from audio import (    # noqa: E402
+    Downsampler, GainNormalizer, Pcm16ToTwilio, TwilioToPcm16, Upsampler, ulaw_decode, ulaw_encode,
+)
+
+try:
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", DeprecationWarning)
+        import audioop
+except ImportError:
+    audioop = None
+
+
+def speech_like(samples, rate, seed=3):
+    """Band-limited noise with a syllable-rate envelope, int16."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(samples) / rate
+    tone = sum(np.sin(2 * np.pi * f * t + rng.uniform(0, 6)) for f in (180, 420, 900, 1700, 2600))
+    envelope = 0.55 + 0.45 * np.sin(2 * np.pi * 4 * t)
+    return (3000 * tone * envelope + rng.normal(0, 200, samples)).astype(np.int16)
+
+
+def main(frame_ms, number):
+    pcm8 = speech_like(8 * frame_ms, 8000)
+    pcm24 = speech_like(24 * frame_ms, 24000)
+    ulaw = ulaw_encode(pcm8)
+    pcm8_bytes, pcm24_bytes = pcm8.tobytes(), pcm24.tobytes()
+
+    if audioop is not None:
+        assert audioop.ulaw2lin(ulaw, 2) == ulaw_decode(ulaw).tobytes()
+
+    up, down, gain = Upsampler(), Downsampler(), GainNormalizer()
+    inbound, inbound_agc, outbound = TwilioToPcm16(), TwilioToPcm16(GainNormalizer()), Pcm16ToTwilio()
+    cases = [
+        ("mu-law decode", lambda: ulaw_decode(ulaw)),
+        ("mu-law encode", lambda: ulaw_encode(pcm8)),
+        ("upsample 8k -> 24k", lambda: up.process(pcm8)),
+        ("downsample 24k -> 8k", lambda: down.process(pcm24)),
+        ("gain normalize", lambda: gain.process(pcm8)),
+        ("inbound: mu-law -> pcm16 24k", lambda: inbound.process(ulaw)),
+        ("inbound with gain", lambda: inbound_agc.process(ulaw)),
+        ("outbound: pcm16 24k -> mu-law", lambda: outbound.process(pcm24_bytes)),
+    ]
+    baselines = {}
+    if audioop is not None:
+        state = {"up": None, "down": None}
+
+        def audioop_inbound():
+            lin = audioop.ulaw2lin(ulaw, 2)
+            out, state["up"] = audioop.ratecv(lin, 2, 1, 8000, 24000, state["up"])
+            return out
+
+        def audioop_outbound():
+            lin, state["down"] = audioop.ratecv(pcm24_bytes, 2, 1, 24000, 8000, state["down"])
+            return audioop.lin2ulaw(lin, 2)
+
+        baselines = {
+            "mu-law decode": lambda: audioop.ulaw2lin(ulaw, 2),
+            "mu-law encode": lambda: audioop.lin2ulaw(pcm8_bytes, 2),
+            "inbound: mu-law -> pcm16 24k": audioop_inbound,
+            "outbound: pcm16 24k -> mu-law": audioop_outbound,
+        }
+
+    frames = frame_ms / 20
+    print(f"{frame_ms} ms chunks, one core\n")
+    print(f"{'stage':<32}{'us/chunk':>10}{'frames/s':>12}{'audioop frames/s':>18}")
+    for name, fn in cases:
+        baseline = baselines.get(name)
+        per = min(timeit.repeat(fn, number=number, repeat=5)) / number
+        line = f"{name:<32}{per * 1e6:>10.1f}{frames / per:>12,.0f}"
+        if baseline is not None:
+            b = min(timeit.repeat(baseline, number=number, repeat=5)) / number
+            line += f"{frames / b:>18,.0f}"
+        print(line)
+
+    both = (min(timeit.repeat(lambda: inbound.process(ulaw), number=number, repeat=5))
+            + min(timeit.repeat(lambda: outbound.process(pcm24_bytes), number=number, repeat=5))) / number
+    print(f"\npcm16 upstream, both directions: {frames / both / 50:,.0f} concurrent calls per core")
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--frame-ms", type=int, default=20)
+    p.add_argument("--number", type=int, default=20000)
+    args = p.parse_args()
+    main(args.frame_ms, args.number)
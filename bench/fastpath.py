@@ -0,0 +1,92 @@
+"""Microbenchmark: media_codec fast paths vs. the json.loads / send_json path.
+
+    python -m bench.fastpath [--number 200000]
+"""
+import os
+import json
+import base64
+import timeit
+import argparse
+
+from media_codec import TwilioFrameEncoder, parse_audio_delta, parse_twilio_media
+
+STREAM_SID = "MZ18ad3ab5a668481ce02b83e7395059f0"
+
+
+def twilio_media_frame(seq):
+    return json.dumps({
+        "event": "media",
+        "sequenceNumber": str(seq),
+        "media": {"track": "inbound", "chunk": str(seq), "timestamp": str(seq * 20),
+                  "payload": base64.b64encode(os.urandom(160)).decode("ascii")},
+        "streamSid": STREAM_SID,
+    }, separators=(",", ":"))
+
+
+def audio_delta_event(ms=100):
+    return json.dumps({
+        "type": "response.audio.delta",
+        "event_id": "event_4d3b0c5f1a2e4b6c",
+        "response_id": "resp_7a1e9f3c2b",
+        "item_id": "item_9c2d4e1f0a",
+        "output_index": 0,
+        "content_index": 0,
+        "delta": base64.b64encode(os.urandom(8 * ms)).decode("ascii"),
+    }, separators=(",", ":"))
+
+
+def send_json_equivalent(data):
+    # what starlette's WebSocket.send_json does before writing the text frame
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False)
+
+
+def main(number):
+    frame = twilio_media_frame(42)
+    delta = audio_delta_event()
+    payload = json.loads(delta)["delta"]
+    enc = TwilioFrameEncoder(STREAM_SID)
+
+    # Same answers from both paths before timing them
+    data = json.loads(frame)
+    assert parse_twilio_media(frame) == (int(data["media"]["timestamp"]), data["media"]["payload"])
+    evt = json.loads(delta)
+    assert parse_audio_delta(delta) == (evt["item_id"], evt["delta"])
+    assert enc.media(payload) == send_json_equivalent({"event": "media", "streamSid": STREAM_SID,
+                                                       "media": {"payload": payload}})
+    assert enc.mark("responsePart") == send_json_equivalent({"event": "mark", "streamSid": STREAM_SID,
+                                                             "mark": {"name": "responsePart"}})
+
+    def inbound_generic():
+        d = json.loads(frame)
+        if d.get("event") == "media":
+            return int(d["media"]["timestamp"]), d["media"]["payload"]
+
+    def upstream_generic():
+        e = json.loads(delta)
+        if e.get("type") == "response.audio.delta":
+            return e.get("item_id"), e["delta"]
+
+    def outbound_generic():
+        send_json_equivalent({"event": "media", "streamSid": STREAM_SID, "media": {"payload": payload}})
+        send_json_equivalent({"event": "mark", "streamSid": STREAM_SID, "mark": {"name": "responsePart"}})
+
+    def outbound_fast():
+        enc.media(payload)
+        enc.mark("responsePart")
+
+    cases = [
+        ("inbound Twilio media parse", inbound_generic, lambda: parse_twilio_media(frame)),
+        ("upstream audio.delta parse", upstream_generic, lambda: parse_audio_delta(delta)),
+        ("outbound media+mark encode", outbound_generic, outbound_fast),
+    ]
+    print(f"{'path':<30}{'generic ns/op':>16}{'fast ns/op':>14}{'speedup':>10}")
+    for name, generic, fast in cases:
+        g = min(timeit.repeat(generic, number=number, repeat=5)) / number * 1e9
+        f = min(timeit.repeat(fast, number=number, repeat=5)) / number * 1e9
+        print(f"{name:<30}{g:>16.0f}{f:>14.0f}{g / f:>9.1f}x")
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--number", type=int, default=200000)
+    main(p.parse_args().number)
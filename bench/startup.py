@@ -0,0 +1,134 @@
+"""Benchmark: cold start of the bridge, import time and time to the first webhook.
+
+    python -m bench.startup [--runs 5] [--entry main|uvicorn]
+
+Import time of app5 is measured in fresh interpreters (median of --runs), followed
+by its largest imports according to `python -X importtime`. The cold start spawns
+the server against a local fake realtime endpoint and polls until /incoming-call
+answers (time to first webhook) and until /ready does (upstream warmed, first
+pooled session open). `--entry uvicorn` starts `uvicorn app5:app` instead of main.py.
+"""
+import os
+import sys
+import time
+import socket
+import asyncio
+import argparse
+import statistics
+import subprocess
+
+import httpx
+
+from loadtest.fake_realtime import FakeRealtimeServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMPORT_SNIPPET = "import time; t = time.perf_counter(); import app5; print(time.perf_counter() - t)"
+
+
+def base_env(**extra):
+    return {
+        **os.environ, "OPENAI_API_KEY": "bench", "TWILIO_SID": "ACbench", "TWILIO_AUTH": "bench",
+        "GREETING_CACHE": "0", "LOG_LEVEL": "WARNING", **extra,
+    }
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def import_times(runs, env):
+    out = []
+    for _ in range(runs):
+        proc = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], cwd=ROOT, env=env,
+                              capture_output=True, text=True, check=True)
+        out.append(float(proc.stdout.strip().splitlines()[-1]))
+    return out
+
+
+def largest_imports(env, top=8):
+    """(module, cumulative ms) of app5's direct imports, largest first."""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app5"], cwd=ROOT, env=env,
+                          capture_output=True, text=True, check=True)
+    direct = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue        # header
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 0:
+            if name.strip() == "app5":
+                break
+            direct = []     # children of an earlier top-level import (site, encodings, ...)
+        elif depth == 1:
+            direct.append((name.strip(), int(cumulative) / 1000))
+    return sorted(direct, key=lambda d: -d[1])[:top]
+
+
+async def cold_start(entry, env):
+    port = free_port()
+    if entry == "main":
+        cmd = [sys.executable, "main.py"]
+    else:
+        cmd = [sys.executable, "-m", "uvicorn", "app5:app", "--port", str(port), "--no-access-log"]
+    base = f"http://127.0.0.1:{port}"
+    started = time.perf_counter()
+    proc = subprocess.Popen(cmd, cwd=ROOT, env={**env, "PORT": str(port)},
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    first_webhook = ready = None
+    try:
+        async with httpx.AsyncClient(timeout=2) as http:
+            while ready is None and time.perf_counter() - started < 30:
+                try:
+                    if first_webhook is None:
+                        r = await http.post(f"{base}/incoming-call",
+                                            data={"From": "+15550001111", "CallSid": "CAbench"})
+                        if r.status_code == 200:
+                            first_webhook = time.perf_counter() - started
+                    else:
+                        r = await http.get(f"{base}/ready")
+                        if r.status_code == 200:
+                            ready = time.perf_counter() - started
+                            reported = r.json()
+                except httpx.TransportError:
+                    pass
+                await asyncio.sleep(0.005)
+    finally:
+        proc.terminate()
+        proc.wait()
+    if ready is None:
+        raise RuntimeError(f"{entry} did not become ready within 30 s")
+    return first_webhook, ready, reported
+
+
+async def main(runs, entry):
+    fake = await FakeRealtimeServer().start()
+    env = base_env(OPENAI_WS_URL=fake.url)
+    try:
+        times = import_times(runs, env)
+        print(f"import app5: median {statistics.median(times) * 1000:.0f} ms "
+              f"(min {min(times) * 1000:.0f}, max {max(times) * 1000:.0f}, {runs} runs)")
+        print(f"\n{'largest direct imports':<30}{'cumulative ms':>15}")
+        for name, ms in largest_imports(env):
+            print(f"{name:<30}{ms:>15.1f}")
+
+        results = [await cold_start(entry, env) for _ in range(runs)]
+        print(f"\n{'cold start (' + entry + ')':<30}{'median ms':>12}{'min ms':>10}{'max ms':>10}")
+        for label, values in (("spawn -> first webhook", [r[0] for r in results]),
+                              ("spawn -> /ready", [r[1] for r in results])):
+            print(f"{label:<30}{statistics.median(values) * 1000:>12.0f}"
+                  f"{min(values) * 1000:>10.0f}{max(values) * 1000:>10.0f}")
+        print(f"\nlast /ready: {results[-1][2]}")
+    finally:
+        await fake.stop()
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--runs", type=int, default=5)
+    p.add_argument("--entry", choices=("main", "uvicorn"), default="main")
+    args = p.parse_args()
+    asyncio.run(main(args.runs, args.entry))
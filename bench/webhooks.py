@@ -0,0 +1,165 @@
+"""Benchmark: TwiML templates + raw form parsing vs. VoiceResponse + request.form().
+
+    python -m bench.webhooks [--number 20000] [--requests 5000]
+
+Prints per-op cost of building the TwiML and of parsing a Twilio webhook body, then
+end-to-end /incoming-call throughput through FastAPI (in-process ASGI, no sockets).
+"""
+import time
+import timeit
+import asyncio
+import argparse
+from urllib.parse import quote_plus, urlencode
+
+from fastapi import FastAPI, Request
+from fastapi.responses import HTMLResponse
+from starlette.requests import Request as StarletteRequest
+from twilio.twiml.voice_response import VoiceResponse, Connect
+
+import twiml
+from twiml import read_form
+
+HOST = "voice.example.com"
+GREETING = "You've reached Mark's Properties. We're connecting you now."
+
+# A real Twilio voice webhook body is ~25 fields
+WEBHOOK_FORM = {
+    "AccountSid": "AC" + "0" * 32, "ApiVersion": "2010-04-01", "CallSid": "CA" + "1" * 32,
+    "CallStatus": "ringing", "Called": "+15550001111", "CalledCity": "", "CalledCountry": "US",
+    "CalledState": "CA", "CalledZip": "", "Caller": "+15552223333", "CallerCity": "LOS ANGELES",
+    "CallerCountry": "US", "CallerState": "CA", "CallerZip": "90012", "Direction": "inbound",
+    "From": "+15552223333", "FromCity": "LOS ANGELES", "FromCountry": "US", "FromState": "CA",
+    "FromZip": "90012", "To": "+15550001111", "ToCity": "", "ToCountry": "US", "ToState": "CA",
+    "ToZip": "",
+}
+BODY = urlencode(WEBHOOK_FORM).encode()
+
+
+def stream_url(from_number):
+    return f"wss://{HOST}/media-stream?caller={quote_plus(from_number)}"
+
+
+def incoming_voiceresponse(from_number):
+    response = VoiceResponse()
+    response.say(GREETING, voice="Polly.Matthew")
+    response.pause(length=0.5)
+    connect = Connect()
+    connect.stream(url=stream_url(from_number))
+    response.append(connect)
+    return str(response)
+
+
+def incoming_template(from_number):
+    return twiml.CONNECT_STREAM.render(
+        voice="Polly.Matthew", greeting=GREETING, pause=0.5, stream_url=stream_url(from_number))
+
+
+def forward_voiceresponse():
+    response = VoiceResponse()
+    dial = response.dial(timeout=15, action="/missed-call", caller_id="+15550001111",
+                         record="record-from-answer", recording_status_callback="/check-recording",
+                         recording_status_callback_event="completed")
+    dial.number("+15554445555")
+    return str(response)
+
+
+def forward_template():
+    return twiml.FORWARD_RECORDED.render(timeout=15, action="/missed-call", caller_id="+15550001111",
+                                         recording_callback="/check-recording", number="+15554445555")
+
+
+def make_request(body=BODY):
+    scope = {
+        "type": "http", "method": "POST", "path": "/incoming-call", "query_string": b"",
+        "headers": [(b"content-type", b"application/x-www-form-urlencoded"),
+                    (b"content-length", str(len(body)).encode()), (b"host", HOST.encode())],
+        "server": (HOST, 443), "scheme": "https",
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    return scope, receive
+
+
+def build_app():
+    app = FastAPI()
+
+    @app.post("/voiceresponse")
+    async def voiceresponse(request: Request):
+        form = await request.form()
+        return HTMLResponse(content=incoming_voiceresponse(form.get("From")), media_type="application/xml")
+
+    @app.post("/template")
+    async def template(request: Request):
+        form = await read_form(request)
+        return HTMLResponse(content=incoming_template(form.get("From")), media_type="application/xml")
+
+    return app
+
+
+async def time_async(fn, number):
+    start = time.perf_counter()
+    for _ in range(number):
+        await fn()
+    return (time.perf_counter() - start) / number
+
+
+async def main(number, requests):
+    # Same documents from both paths before timing them
+    for caller in ("+15552223333", 'a&b<c>"d\''):
+        assert incoming_template(caller) == incoming_voiceresponse(caller)
+    assert forward_template() == forward_voiceresponse()
+
+    async def form_starlette():
+        scope, receive = make_request()
+        form = await StarletteRequest(scope, receive).form()
+        return form.get("From")
+
+    async def form_raw():
+        scope, receive = make_request()
+        return (await read_form(StarletteRequest(scope, receive))).get("From")
+
+    assert await form_starlette() == await form_raw() == WEBHOOK_FORM["From"]
+
+    print(f"{'step':<30}{'VoiceResponse/form() us':>26}{'template/raw us':>18}{'speedup':>10}")
+    for name, slow, fast in [
+        ("incoming-call TwiML", lambda: incoming_voiceresponse("+15552223333"),
+         lambda: incoming_template("+15552223333")),
+        ("forward-call TwiML", forward_voiceresponse, forward_template),
+    ]:
+        s = min(timeit.repeat(slow, number=number, repeat=5)) / number * 1e6
+        f = min(timeit.repeat(fast, number=number, repeat=5)) / number * 1e6
+        print(f"{name:<30}{s:>26.2f}{f:>18.2f}{s / f:>9.1f}x")
+
+    s = min([await time_async(form_starlette, number // 4) for _ in range(3)]) * 1e6
+    f = min([await time_async(form_raw, number // 4) for _ in range(3)]) * 1e6
+    print(f"{'webhook form parse':<30}{s:>26.2f}{f:>18.2f}{s / f:>9.1f}x")
+
+    app = build_app()
+
+    async def hit(path):
+        scope, receive = make_request()
+        scope = {**scope, "path": path, "raw_path": path.encode()}
+        status = []
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                status.append(message["status"])
+
+        await app(scope, receive, send)
+        assert status == [200], status
+
+    print(f"\n{'endpoint (in-process ASGI)':<30}{'req/s':>12}")
+    for path in ("/voiceresponse", "/template"):
+        await hit(path)     # warm up route matching / dependency caches
+        per = min([await time_async(lambda: hit(path), requests) for _ in range(3)])
+        print(f"{path:<30}{1 / per:>12.0f}")
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--number", type=int, default=20000)
+    p.add_argument("--requests", type=int, default=5000)
+    args = p.parse_args()
+    asyncio.run(main(args.number, args.requests))
@@ -0,0 +1,262 @@
+import time
+import asyncio
+from collections import deque
+
+from logs import get_logger
+from metrics import (
+    BRIDGE_DROPPED, BRIDGE_MERGED, BRIDGE_QUEUE_DEPTH, BRIDGE_STALLED, TWILIO_BUFFERED, TWILIO_BUFFERED_MS,
+)
+from playback import ULAW_BYTES_PER_MS, ulaw_b64_ms
+
+log = get_logger(__name__)
+
+CONTROL, DROPPABLE, AUDIO = 0, 1, 2
+
+_open = set()       # live outboxes, summed into the queue-depth gauge at scrape time
+
+for _direction in ("upstream", "downstream"):
+    BRIDGE_QUEUE_DEPTH.labels(_direction).set_function(
+        lambda d=_direction: sum(len(o) for o in _open if o.direction == d))
+TWILIO_BUFFERED_MS.set_function(
+    lambda: max((o.buffered_ms for o in _open if isinstance(o, PacedOutbox)), default=0))
+
+
+class Outbox:
+    """One direction of the call bridge: a bounded queue drained by its own writer task.
+
+    put()/put_audio() never await, so the loop reading the other peer keeps reading
+    while this peer is slow. Policies:
+      - merge: with merge_audio, audio queued behind audio that is still waiting
+        becomes one message (a slow upstream gets fewer, larger appends);
+      - drop: drop_stale() discards queued audio and droppable messages (playback
+        the caller talked over); when the queue is full the oldest audio goes first;
+      - disconnect: a send that does not complete within stall_timeout means the
+        peer stopped draining; the outbox gives up and calls on_stall().
+    Control messages are never dropped or reordered. Once a send fails the outbox is
+    closed and further puts are ignored, so end-of-call races do not raise.
+    """
+
+    def __init__(self, direction, send, encode_audio, maxsize=256, merge_audio=False,
+                 stall_timeout=5.0, on_stall=None, lag_histogram=None):
+        self.direction = direction
+        self.send = send                    # async (str) -> None
+        self.encode_audio = encode_audio    # audio data -> str message
+        self.maxsize = maxsize
+        self.merge_audio = merge_audio
+        self.stall_timeout = stall_timeout
+        self.on_stall = on_stall            # async () -> None, e.g. close the peer
+        self.lag_histogram = lag_histogram  # observes arrival -> sent per audio chunk
+        self.closed = False
+        self._queue = deque()               # [kind, data, arrival times]
+        self._ready = asyncio.Event()
+        self._task = None
+        self._dropped = BRIDGE_DROPPED.labels(direction, "overflow")
+        self._dropped_stale = BRIDGE_DROPPED.labels(direction, "barge_in")
+        self._merged = BRIDGE_MERGED.labels(direction)
+        self.stats = {"sent": 0, "merged": 0, "dropped": 0, "max_depth": 0}
+
+    def __len__(self):
+        return len(self._queue)
+
+    def start(self):
+        _open.add(self)
+        self._task = asyncio.create_task(self._run())
+        return self
+
+    async def close(self):
+        self.closed = True
+        _open.discard(self)
+        if self._task and self._task is not asyncio.current_task():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._queue.clear()
+
+    def put(self, msg, droppable=False):
+        self._push([DROPPABLE if droppable else CONTROL, msg, None])
+
+    def put_audio(self, data, arrivals=None):
+        if self.merge_audio and self._queue and self._queue[-1][0] == AUDIO:
+            tail = self._queue[-1]
+            tail[1] += data
+            if arrivals:
+                tail[2].extend(arrivals)
+            self.stats["merged"] += 1
+            self._merged.inc()
+            return
+        self._push([AUDIO, data, list(arrivals) if arrivals else []])
+
+    def drop_stale(self):
+        """Forget queued audio and droppable messages; returns how many were dropped."""
+        before = len(self._queue)
+        self._queue = deque(item for item in self._queue if item[0] == CONTROL)
+        dropped = before - len(self._queue)
+        if dropped:
+            self.stats["dropped"] += dropped
+            self._dropped_stale.inc(dropped)
+        return dropped
+
+    def snapshot(self):
+        return {**self.stats, "depth": len(self._queue)}
+
+    def _push(self, item):
+        if self.closed or not self._admit(item):
+            return
+        self._queue.append(item)
+        if len(self._queue) > self.stats["max_depth"]:
+            self.stats["max_depth"] = len(self._queue)
+        self._ready.set()
+
+    def _admit(self, item):
+        """Make room for `item` if the queue is full; False drops it instead."""
+        if len(self._queue) >= self.maxsize and not self._drop_oldest_audio() and item[0] != CONTROL:
+            self.stats["dropped"] += 1
+            self._dropped.inc()
+            return False
+        return True
+
+    def _drop_oldest_audio(self):
+        for i, item in enumerate(self._queue):
+            if item[0] != CONTROL:
+                del self._queue[i]
+                self.stats["dropped"] += 1
+                self._dropped.inc()
+                return True
+        return False
+
+    async def _run(self):
+        try:
+            while True:
+                if not self._queue:
+                    self._ready.clear()
+                    await self._ready.wait()
+                    continue
+                delay = self._hold()
+                if delay > 0:
+                    # Re-checked on every put: a drop_stale() may have emptied the queue
+                    self._ready.clear()
+                    try:
+                        async with asyncio.timeout(delay):
+                            await self._ready.wait()
+                    except TimeoutError:
+                        pass
+                    continue
+                kind, data, arrivals = self._take()
+                msg = self.encode_audio(data) if kind == AUDIO else data
+                try:
+                    # asyncio.timeout rather than wait_for: no extra task per message
+                    async with asyncio.timeout(self.stall_timeout):
+                        await self.send(msg)
+                except TimeoutError:
+                    BRIDGE_STALLED.labels(self.direction).inc()
+                    log.warning("🐢 %s peer stopped draining; disconnecting", self.direction,
+                                extra={"depth": len(self._queue), "stall_timeout": self.stall_timeout})
+                    self.closed = True
+                    if self.on_stall:
+                        await self.on_stall()
+                    return
+                self.stats["sent"] += 1
+                if kind == AUDIO:
+                    self._audio_sent(data)
+                if arrivals and self.lag_histogram:
+                    sent = time.monotonic()
+                    for arrived in arrivals:
+                        self.lag_histogram.observe(sent - arrived)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Peer went away mid-send; the reader on that side sees the close and ends the call
+            log.debug("%s outbox closed: %r", self.direction, e)
+        finally:
+            self.closed = True
+            _open.discard(self)
+
+    # --- hooks for PacedOutbox ------------------------------------------------
+
+    def _hold(self):
+        """Seconds the head of the queue has to wait before it may be sent."""
+        return 0
+
+    def _take(self):
+        return self._queue.popleft()
+
+    def _audio_sent(self, data):
+        pass
+
+
+class PacedOutbox(Outbox):
+    """Downstream outbox that keeps at most about `lead_ms` of audio buffered at Twilio.
+
+    Twilio buffers whatever it is sent, and the model produces audio faster than real
+    time, so an unpaced bridge hands over a whole response seconds ahead of playback.
+    A barge-in `clear` then throws all of that away, and the position Twilio reports
+    lags what the caller heard. Here audio leaves in ~`frame_ms` slices of the queued
+    base64 payload, cut on 4-character boundaries so nothing is re-encoded. A monotonic
+    play clock decides when: a slice goes once the audio already sent will finish
+    playing within `lead_ms`. Marks queued behind audio wait their turn, so they still
+    follow the audio they measure, and everything not yet released is dropped locally
+    by drop_stale(). drop_stale() also restarts the clock, because a clear follows it.
+
+    Holding a whole response here is the point, so the queue is bounded by queued
+    audio time (`max_queued_ms`) instead of `maxsize` items, and marks and control
+    messages are never dropped for room. Audio beyond the bound is refused as it
+    arrives: the reply's tail is cut rather than a gap opened in what plays next.
+    """
+
+    def __init__(self, direction, send, encode_audio, lead_ms=300, frame_ms=20, max_queued_ms=120_000, **kwargs):
+        super().__init__(direction, send, encode_audio, **kwargs)
+        self.lead = lead_ms / 1000
+        self.max_queued_ms = max_queued_ms
+        self._slice_chars = max(4, frame_ms * ULAW_BYTES_PER_MS // 3 * 4)
+        self._play_until = 0.0          # monotonic time the audio sent so far finishes playing
+        self._queued_ms = 0.0           # audio held in the queue, not released yet
+
+    @property
+    def buffered_ms(self):
+        """Audio sent to the peer that it has not played yet."""
+        return max(0.0, self._play_until - time.monotonic()) * 1000
+
+    def drop_stale(self):
+        self._play_until = 0.0
+        self._queued_ms = 0.0
+        return super().drop_stale()
+
+    def snapshot(self):
+        return {**super().snapshot(), "buffered_ms": round(self.buffered_ms), "queued_ms": round(self._queued_ms)}
+
+    def _admit(self, item):
+        if item[0] != AUDIO:
+            return True         # marks come at most one per mark interval of audio
+        ms = ulaw_b64_ms(item[1])
+        if self._queued_ms + ms > self.max_queued_ms:
+            self.stats["dropped"] += 1
+            self._dropped.inc()
+            return False
+        self._queued_ms += ms
+        return True
+
+    def _hold(self):
+        if self._queue[0][0] != AUDIO:
+            return 0
+        return self._play_until - time.monotonic() - self.lead
+
+    def _take(self):
+        head = self._queue[0]
+        if head[0] != AUDIO:
+            return self._queue.popleft()
+        if len(head[1]) <= self._slice_chars:
+            item = self._queue.popleft()
+        else:
+            data, n = head[1], self._slice_chars
+            head[1] = data[n:]
+            arrivals, head[2] = head[2], []
+            item = AUDIO, data[:n], arrivals
+        self._queued_ms = max(0.0, self._queued_ms - ulaw_b64_ms(item[1]))
+        return item
+
+    def _audio_sent(self, data):
+        now = time.monotonic()
+        self._play_until = max(self._play_until, now) + ulaw_b64_ms(data) / 1000
+        TWILIO_BUFFERED.observe(self._play_until - now)
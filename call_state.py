@@ -0,0 +1,287 @@
+import os
+import json
+import time
+import asyncio
+import sqlite3
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlparse
+
+from logs import get_logger
+
+log = get_logger(__name__)
+
+# Per-call state shared by the webhooks and the media stream, keyed by CallSid.
+# Twilio may deliver /incoming-call, /media-stream, /missed-call and the recording
+# callback to different uvicorn workers, so anything one of them needs from another
+# goes through a store selected by CALL_STATE_URL:
+#   memory://?max=10000            per-process LRU (single worker, dev)
+#   sqlite:///calls.db             shared file in WAL mode (several workers, one host;
+#                                  four slashes for an absolute path)
+#   redis://host:6379/0            any Redis-protocol server (several hosts)
+# Records are small dicts of JSON values; update() merges fields and refreshes the TTL.
+
+DEFAULT_TTL = 6 * 3600      # recording callbacks can arrive well after the call ends
+
+
+class MemoryCallState:
+    """In-process LRU with TTL; O(1) get/update/delete on an OrderedDict."""
+
+    def __init__(self, max_entries=10000, ttl=DEFAULT_TTL, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self._calls = OrderedDict()     # call_sid -> (expires_at, fields)
+
+    async def get(self, call_sid):
+        entry = self._calls.get(call_sid)
+        if entry is None:
+            return None
+        if entry[0] <= self.clock():
+            del self._calls[call_sid]
+            return None
+        self._calls.move_to_end(call_sid)
+        return dict(entry[1])
+
+    async def update(self, call_sid, **fields):
+        now = self.clock()
+        entry = self._calls.pop(call_sid, None)
+        current = entry[1] if entry and entry[0] > now else {}
+        self._calls[call_sid] = (now + self.ttl, {**current, **fields})
+        self._evict(now)
+
+    async def delete(self, call_sid):
+        self._calls.pop(call_sid, None)
+
+    async def close(self):
+        self._calls.clear()
+
+    def __len__(self):
+        return len(self._calls)
+
+    def _evict(self, now):
+        calls = self._calls
+        while len(calls) > self.max_entries:
+            calls.popitem(last=False)
+        # Least recently touched first, so expired entries collect at the front
+        while calls:
+            sid, (expires_at, _) = next(iter(calls.items()))
+            if expires_at > now:
+                break
+            del calls[sid]
+
+
+class SqliteCallState:
+    """One row per CallSid (primary-key lookup) in a WAL-mode file shared by all workers.
+
+    sqlite3 calls run on a dedicated thread so a writer holding the lock never blocks
+    the event loop; busy_timeout covers the other workers' short write transactions.
+    """
+
+    PURGE_EVERY = 500       # writes between deletes of expired rows
+
+    def __init__(self, path, ttl=DEFAULT_TTL):
+        self.ttl = ttl
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="call-state")
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("PRAGMA busy_timeout=5000")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS call_state ("
+            " call_sid TEXT PRIMARY KEY, fields TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS call_state_expiry ON call_state (expires_at)")
+        self._writes = 0
+
+    async def get(self, call_sid):
+        return await self._run(self._get, call_sid)
+
+    async def update(self, call_sid, **fields):
+        await self._run(self._update, call_sid, fields)
+
+    async def delete(self, call_sid):
+        await self._run(self._db.execute, "DELETE FROM call_state WHERE call_sid = ?", (call_sid,))
+
+    async def close(self):
+        await self._run(self._db.close)
+        self._executor.shutdown(wait=False)
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def _get(self, call_sid):
+        row = self._db.execute(
+            "SELECT fields FROM call_state WHERE call_sid = ? AND expires_at > ?", (call_sid, time.time())
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _update(self, call_sid, fields):
+        now = time.time()
+        # BEGIN IMMEDIATE takes the write lock up front so the read-merge-write is atomic
+        # across workers.
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            row = self._db.execute(
+                "SELECT fields FROM call_state WHERE call_sid = ? AND expires_at > ?", (call_sid, now)
+            ).fetchone()
+            merged = {**(json.loads(row[0]) if row else {}), **fields}
+            self._db.execute(
+                "INSERT OR REPLACE INTO call_state (call_sid, fields, expires_at) VALUES (?, ?, ?)",
+                (call_sid, json.dumps(merged), now + self.ttl),
+            )
+            self._writes += 1
+            if self._writes % self.PURGE_EVERY == 0:
+                self._db.execute("DELETE FROM call_state WHERE expires_at <= ?", (now,))
+            self._db.execute("COMMIT")
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+
+
+class RedisCallState:
+    """One hash per call ("call:<CallSid>") with EXPIRE, over a minimal RESP client.
+
+    Field values are JSON-encoded, so update() is a server-side HSET merge plus an
+    EXPIRE, pipelined on one connection. No client library needed; see
+    loadtest/fake_redis.py for a local stand-in.
+    """
+
+    def __init__(self, host="127.0.0.1", port=6379, db=0, password=None, ttl=DEFAULT_TTL, prefix="call:"):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.ttl = ttl
+        self.prefix = prefix
+        self._reader = None
+        self._writer = None
+        self._lock = asyncio.Lock()
+
+    async def get(self, call_sid):
+        (flat,) = await self._execute(("HGETALL", self.prefix + call_sid))
+        if not flat:
+            return None
+        return {flat[i].decode(): json.loads(flat[i + 1]) for i in range(0, len(flat), 2)}
+
+    async def update(self, call_sid, **fields):
+        if not fields:
+            return
+        key = self.prefix + call_sid
+        args = ["HSET", key]
+        for name, value in fields.items():
+            args += [name, json.dumps(value)]
+        await self._execute(args, ("EXPIRE", key, str(int(self.ttl))))
+
+    async def delete(self, call_sid):
+        await self._execute(("DEL", self.prefix + call_sid))
+
+    async def close(self):
+        self._drop()
+
+    def _drop(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._reader = self._writer = None
+
+    async def _execute(self, *commands):
+        async with self._lock:
+            try:
+                return await self._pipeline(commands)
+            except asyncio.CancelledError:
+                # Cancelled mid-pipeline (a caller's timeout): unread replies would be
+                # taken as the next command's, so this connection cannot be reused
+                self._drop()
+                raise
+
+    async def _pipeline(self, commands):
+        for attempt in (1, 2):
+            try:
+                if self._writer is None:
+                    await self._connect()
+                self._writer.write(b"".join(_encode(c) for c in commands))
+                await self._writer.drain()
+                replies = [await _read_reply(self._reader) for _ in commands]
+                break
+            except (ConnectionError, asyncio.IncompleteReadError) as e:
+                # Server restarted or idle connection dropped; reconnect once
+                log.warning("call-state Redis connection lost: %r", e)
+                await self.close()
+                if attempt == 2:
+                    raise
+        # Errors are raised only after every pipelined reply is read, keeping the stream in sync
+        for reply in replies:
+            if isinstance(reply, RedisError):
+                raise reply
+        return replies
+
+    async def _connect(self):
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        setup = []
+        if self.password:
+            setup.append(("AUTH", self.password))
+        if self.db:
+            setup.append(("SELECT", str(self.db)))
+        if setup:
+            self._writer.write(b"".join(_encode(c) for c in setup))
+            await self._writer.drain()
+            for _ in setup:
+                reply = await _read_reply(self._reader)
+                if isinstance(reply, RedisError):
+                    await self.close()
+                    raise reply
+
+
+class RedisError(Exception):
+    pass
+
+
+def _encode(args):
+    out = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        data = arg if isinstance(arg, bytes) else str(arg).encode()
+        out.append(b"$%d\r\n%s\r\n" % (len(data), data))
+    return b"".join(out)
+
+
+async def _read_reply(reader):
+    line = (await reader.readuntil(b"\r\n"))[:-2]
+    kind, rest = line[:1], line[1:]
+    if kind == b"+":
+        return rest.decode()
+    if kind == b"-":
+        return RedisError(rest.decode())
+    if kind == b":":
+        return int(rest)
+    if kind == b"$":
+        size = int(rest)
+        if size < 0:
+            return None
+        return (await reader.readexactly(size + 2))[:-2]
+    if kind == b"*":
+        size = int(rest)
+        if size < 0:
+            return None
+        return [await _read_reply(reader) for _ in range(size)]
+    raise RedisError(f"unexpected reply {line[:40]!r}")
+
+
+def open_call_state(url=None, ttl=None):
+    """Build the store named by `url` (default CALL_STATE_URL, else in-memory)."""
+    url = url or os.getenv("CALL_STATE_URL", "memory://")
+    ttl = float(ttl or os.getenv("CALL_STATE_TTL", DEFAULT_TTL))
+    parsed = urlparse(url)
+    if parsed.scheme == "memory":
+        options = parse_qs(parsed.query)
+        return MemoryCallState(max_entries=int(options.get("max", [10000])[0]), ttl=ttl)
+    if parsed.scheme == "sqlite":
+        return SqliteCallState(parsed.path[1:] or ":memory:", ttl=ttl)
+    if parsed.scheme == "redis":
+        return RedisCallState(
+            host=parsed.hostname or "127.0.0.1",
+            port=parsed.port or 6379,
+            db=int(parsed.path.lstrip("/") or 0),
+            password=parsed.password,
+            ttl=ttl,
+        )
+    raise ValueError(f"Unsupported CALL_STATE_URL: {url}")
@@ -0,0 +1,351 @@
+import re
+import time
+import asyncio
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+from logs import get_logger
+from metrics import CAMPAIGN_ACTIVE, CAMPAIGN_CALLS
+
+log = get_logger(__name__)
+
+# Outbound call-back campaigns. Leads live in a SQLite file (WAL, shared with the
+# webhook apps that enqueue missed callers); CampaignDialer claims due leads, places
+# the calls and records every outcome, so a restart resumes where it stopped.
+#
+# Lead lifecycle: pending -> dialing -> done (answered) | pending again after
+# retry_after_s * attempts (busy, no answer, ...) | failed (max_attempts spent).
+
+FINAL_STATUSES = {"completed", "busy", "no-answer", "failed", "canceled"}
+
+# Every stored number is dialed at the account's expense: only E.164 gets in
+E164 = re.compile(r"\+[1-9]\d{7,14}")
+
+DEFAULT_OPENING = (
+    "You are calling this person back: they called recently and nobody answered. "
+    "Say who you are, that you're returning their call, and ask how you can help."
+)
+
+
+def valid_number(number):
+    return isinstance(number, str) and E164.fullmatch(number) is not None
+
+
+class LeadStore:
+    """Campaigns and their leads in one SQLite file; sqlite3 runs on a dedicated thread."""
+
+    def __init__(self, path):
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="campaigns")
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("PRAGMA busy_timeout=5000")
+        self._db.executescript(
+            "CREATE TABLE IF NOT EXISTS campaigns ("
+            " name TEXT PRIMARY KEY, from_number TEXT NOT NULL, opening TEXT NOT NULL,"
+            " max_attempts INTEGER NOT NULL, retry_after_s REAL NOT NULL, status TEXT NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS leads ("
+            " id INTEGER PRIMARY KEY, campaign TEXT NOT NULL, number TEXT NOT NULL, name TEXT,"
+            " status TEXT NOT NULL DEFAULT 'pending', attempts INTEGER NOT NULL DEFAULT 0,"
+            " next_attempt_at REAL NOT NULL DEFAULT 0, call_sid TEXT, outcome TEXT, updated_at REAL,"
+            " UNIQUE (campaign, number));"
+            "CREATE INDEX IF NOT EXISTS leads_due ON leads (status, next_attempt_at);"
+            "CREATE INDEX IF NOT EXISTS leads_call ON leads (call_sid);"
+        )
+
+    async def save_campaign(self, name, from_number, opening=None, max_attempts=3, retry_after_s=1800.0,
+                            status="running"):
+        await self._run(
+            self._db.execute,
+            "INSERT INTO campaigns (name, from_number, opening, max_attempts, retry_after_s, status)"
+            " VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (name) DO UPDATE SET from_number = excluded.from_number,"
+            " opening = excluded.opening, max_attempts = excluded.max_attempts,"
+            " retry_after_s = excluded.retry_after_s, status = excluded.status",
+            (name, from_number, opening or DEFAULT_OPENING, max_attempts, retry_after_s, status),
+        )
+
+    async def ensure_campaign(self, name, from_number, **settings):
+        """Create the campaign with these settings unless it already exists."""
+        if await self.campaign(name) is None:
+            await self.save_campaign(name, from_number, **settings)
+
+    async def campaign(self, name):
+        row = await self._run(lambda: self._db.execute(
+            "SELECT * FROM campaigns WHERE name = ?", (name,)).fetchone())
+        return dict(row) if row else None
+
+    async def set_status(self, name, status):
+        await self._run(self._db.execute, "UPDATE campaigns SET status = ? WHERE name = ?", (status, name))
+
+    async def add_leads(self, campaign, leads):
+        """Queue leads (numbers or {"number", "name"} dicts); numbers already in the campaign are skipped.
+
+        Raises ValueError, storing nothing, if any number is not E.164.
+        """
+        rows = [(campaign, lead.get("number"), lead.get("name")) if isinstance(lead, dict) else (campaign, lead, None)
+                for lead in leads]
+        invalid = [number for _, number, _ in rows if not valid_number(number)]
+        if invalid:
+            raise ValueError(f"not E.164 phone numbers: {invalid[:10]}")
+        return await self._run(self._add, rows)
+
+    async def add_callback(self, from_number, caller):
+        """Queue a missed caller in the call-back campaign of the number they dialed.
+
+        Withheld or malformed caller IDs ("anonymous", short codes) are not queued.
+        """
+        if not valid_number(caller) or not valid_number(from_number):
+            return 0
+        name = f"callbacks:{from_number}"
+        await self.ensure_campaign(name, from_number)
+        return await self.add_leads(name, [caller])
+
+    async def claim(self, limit):
+        """Mark up to `limit` due leads of running campaigns as dialing and return them."""
+        return await self._run(self._claim, limit, time.time())
+
+    async def dialed(self, lead_id, call_sid):
+        await self._run(self._db.execute, "UPDATE leads SET call_sid = ?, updated_at = ? WHERE id = ?",
+                        (call_sid, time.time(), lead_id))
+
+    async def finish(self, lead_id, outcome):
+        """Record a call's outcome; returns the lead's new status."""
+        return await self._run(self._finish, lead_id, outcome, time.time())
+
+    async def lead_for_call(self, call_sid):
+        row = await self._run(lambda: self._db.execute(
+            "SELECT id FROM leads WHERE call_sid = ? AND status = 'dialing'", (call_sid,)).fetchone())
+        return row[0] if row else None
+
+    async def recover(self, older_than):
+        """Return leads stuck in dialing (the process died mid-call) to pending; returns how many."""
+        cur = await self._run(self._db.execute,
+                              "UPDATE leads SET status = 'pending' WHERE status = 'dialing' AND updated_at < ?",
+                              (older_than,))
+        return cur.rowcount
+
+    async def stats(self, campaign):
+        rows = await self._run(lambda: self._db.execute(
+            "SELECT status, COUNT(*) FROM leads WHERE campaign = ? GROUP BY status", (campaign,)).fetchall())
+        return {status: n for status, n in rows}
+
+    async def close(self):
+        await self._run(self._db.close)
+        self._executor.shutdown(wait=False)
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def _add(self, rows):
+        before = self._db.total_changes
+        self._db.execute("BEGIN")
+        self._db.executemany("INSERT OR IGNORE INTO leads (campaign, number, name) VALUES (?, ?, ?)", rows)
+        self._db.execute("COMMIT")
+        return self._db.total_changes - before
+
+    def _claim(self, limit, now):
+        # BEGIN IMMEDIATE: select + update is atomic against another dialer on the same file
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            rows = self._db.execute(
+                "SELECT l.id, l.number, l.name, l.attempts, l.campaign, c.from_number, c.opening"
+                " FROM leads l JOIN campaigns c ON c.name = l.campaign"
+                " WHERE l.status = 'pending' AND l.next_attempt_at <= ? AND c.status = 'running'"
+                " ORDER BY l.next_attempt_at, l.id LIMIT ?",
+                (now, limit),
+            ).fetchall()
+            self._db.executemany(
+                "UPDATE leads SET status = 'dialing', attempts = attempts + 1, call_sid = NULL, updated_at = ?"
+                " WHERE id = ?", [(now, row["id"]) for row in rows])
+            self._db.execute("COMMIT")
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        return [dict(row, attempts=row["attempts"] + 1) for row in rows]
+
+    def _finish(self, lead_id, outcome, now):
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            row = self._db.execute(
+                "SELECT l.attempts, c.max_attempts, c.retry_after_s FROM leads l"
+                " JOIN campaigns c ON c.name = l.campaign WHERE l.id = ?", (lead_id,)).fetchone()
+            if row is None:
+                self._db.execute("COMMIT")
+                return None
+            if outcome == "completed":
+                status, next_at = "done", 0
+            elif row["attempts"] >= row["max_attempts"]:
+                status, next_at = "failed", 0
+            else:
+                status, next_at = "pending", now + row["retry_after_s"] * row["attempts"]
+            self._db.execute(
+                "UPDATE leads SET status = ?, outcome = ?, next_attempt_at = ?, updated_at = ? WHERE id = ?",
+                (status, outcome, next_at, now, lead_id))
+            self._db.execute("COMMIT")
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        return status
+
+
+class CampaignDialer:
+    """Claims due leads and places their calls as fast as the tightest limit allows.
+
+      - max_concurrent: campaign calls dialing, ringing or in progress;
+      - cps: calls placed per second (Twilio's outbound API rate), paced evenly;
+      - window: what upstream is observed to take. It grows by one for every campaign
+        call that gets its realtime session and halves when one does not, or when
+        Twilio answers 429 (AIMD, like a TCP congestion window);
+      - headroom(): optional app callback, e.g. capacity left after inbound calls.
+
+    `place_call(lead) -> CallSid` dials; the app reports back through connected(),
+    upstream_failed() and on_status() (Twilio's status callback). Calls whose final
+    status never arrives are given up on after `call_timeout` seconds, and leads left
+    dialing that long by a process that died (or never got a CallSid) go back to pending.
+    """
+
+    def __init__(self, store, place_call, max_concurrent=10, cps=1.0, headroom=None,
+                 call_timeout=900.0, poll_interval=1.0, initial_window=2):
+        self.store = store
+        self.place_call = place_call        # async (lead dict) -> call_sid
+        self.max_concurrent = max_concurrent
+        self.cps = cps
+        self.headroom = headroom            # () -> int, or None for no extra limit
+        self.call_timeout = call_timeout
+        self.poll_interval = poll_interval
+        self.window = min(initial_window, max_concurrent)
+        self._dialing = 0
+        self._calls = {}                    # call_sid -> (lead_id, placed_at)
+        self._next_dial_at = 0.0
+        self._recovered_at = None
+        self._wake = asyncio.Event()
+        self._task = None
+        self._dials = set()
+        CAMPAIGN_ACTIVE.set_function(lambda: self.active)
+        self.stats = {"placed": 0, "dial_failed": 0, "completed": 0, "unanswered": 0, "timed_out": 0}
+
+    @property
+    def active(self):
+        return self._dialing + len(self._calls)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+        return self
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, *self._dials, return_exceptions=True)
+            self._task = None
+
+    def wake(self):
+        self._wake.set()
+
+    def snapshot(self):
+        return {**self.stats, "active": self.active, "window": self.window,
+                "max_concurrent": self.max_concurrent, "cps": self.cps}
+
+    # --- reports from the app -------------------------------------------------
+
+    def connected(self, call_sid):
+        if call_sid in self._calls:
+            self.window = min(self.window + 1, self.max_concurrent)
+            self.wake()
+
+    def upstream_failed(self, call_sid):
+        if call_sid in self._calls:
+            self._shrink("upstream session failed")
+
+    async def on_status(self, call_sid, status):
+        """Twilio status callback; final statuses free the slot and record the outcome."""
+        if status not in FINAL_STATUSES:
+            return
+        entry = self._calls.pop(call_sid, None)
+        lead_id = entry[0] if entry else await self.store.lead_for_call(call_sid)
+        if lead_id is None:
+            return
+        self._outcome(status)
+        await self.store.finish(lead_id, status)
+        self.wake()
+
+    # --- scheduler --------------------------------------------------------------
+
+    def _free(self):
+        limit = min(self.max_concurrent, self.window)
+        if self.headroom is not None:
+            limit = min(limit, self.headroom())
+        return limit - self.active
+
+    def _shrink(self, reason):
+        previous, self.window = self.window, max(1, self.window // 2)
+        log.warning("📉 campaign window shrunk", extra={"reason": reason, "window": self.window,
+                                                      "previous_window": previous})
+
+    def _outcome(self, status):
+        key = "completed" if status == "completed" else "unanswered"
+        self.stats[key] += 1
+        CAMPAIGN_CALLS.labels(status).inc()
+
+    async def _run(self):
+        while True:
+            await self._expire()
+            await self._recover()
+            leads = await self.store.claim(1) if self._free() > 0 else []
+            if not leads:
+                self._wake.clear()
+                try:
+                    async with asyncio.timeout(self.poll_interval):
+                        await self._wake.wait()
+                except TimeoutError:
+                    pass
+                continue
+            # Even spacing keeps the account under its calls-per-second limit
+            now = time.monotonic()
+            self._next_dial_at = max(self._next_dial_at, now)
+            await asyncio.sleep(self._next_dial_at - now)
+            self._next_dial_at += 1 / self.cps
+            self._dialing += 1
+            task = asyncio.create_task(self._dial(leads[0]))
+            self._dials.add(task)
+            task.add_done_callback(self._dials.discard)
+
+    async def _dial(self, lead):
+        try:
+            call_sid = await self.place_call(lead)
+        except Exception as e:
+            self._dialing -= 1
+            self.stats["dial_failed"] += 1
+            if getattr(e, "status", None) == 429:
+                self._shrink("Twilio rate limited")
+                self._next_dial_at = time.monotonic() + 5 / self.cps
+            log.error("❌ campaign call failed to dial: %r", e, extra={"lead": lead["id"], "campaign": lead["campaign"]})
+            CAMPAIGN_CALLS.labels("dial_failed").inc()
+            await self.store.finish(lead["id"], "dial_failed")
+            return
+        self._dialing -= 1
+        self._calls[call_sid] = (lead["id"], time.monotonic())
+        self.stats["placed"] += 1
+        await self.store.dialed(lead["id"], call_sid)
+        log.info("📞 campaign call placed", extra={
+            "lead": lead["id"], "campaign": lead["campaign"], "callSid": call_sid, "attempt": lead["attempts"]})
+
+    async def _recover(self):
+        # At startup, then every call_timeout: a restart inside the timeout leaves leads
+        # claimed by the old process that only become old enough to recover later
+        now = time.monotonic()
+        if self._recovered_at is not None and now - self._recovered_at < self.call_timeout:
+            return
+        self._recovered_at = now
+        recovered = await self.store.recover(time.time() - self.call_timeout)
+        if recovered:
+            log.info("📞 stuck campaign leads returned to pending", extra={"leads": recovered})
+
+    async def _expire(self):
+        cutoff = time.monotonic() - self.call_timeout
+        for call_sid, (lead_id, placed_at) in list(self._calls.items()):
+            if placed_at < cutoff:
+                del self._calls[call_sid]
+                self.stats["timed_out"] += 1
+                await self.store.finish(lead_id, "timed_out")
@@ -0,0 +1,129 @@
+import time
+
+from logs import get_logger
+from metrics import CAPACITY_HEADROOM, CAPACITY_REJECTED
+
+log = get_logger(__name__)
+
+RATE_LIMITS = ("requests", "tokens")
+
+
+class CapacityGovernor:
+    """Process-wide admission control: can a new call get a working upstream session?
+
+    Fed by the upstream's `rate_limits.updated` events (any call's session reports
+    the account's remaining requests / tokens), by the number of bridged calls and
+    by upstream failures. Between updates a limit is assumed to refill linearly
+    towards its maximum over its `reset_seconds`.
+
+    headroom() is the number of further calls that fit under every limit: each call
+    is budgeted `requests_per_call` / `tokens_per_call`, and calls admitted by
+    /incoming-call but not streaming yet are counted against it, so a burst of
+    webhooks between two updates cannot all take the last slot. A rate-limit error
+    or a failed connect closes admission for `cooldown_s`.
+    """
+
+    def __init__(self, max_calls=0, requests_per_call=1, tokens_per_call=2000,
+                 cooldown_s=15.0, pending_ttl=30.0, clock=time.monotonic):
+        self.max_calls = max_calls                  # 0 = no limit on concurrent calls
+        self.per_call = {"requests": requests_per_call, "tokens": tokens_per_call}
+        self.cooldown_s = cooldown_s
+        self.pending_ttl = pending_ttl              # an admitted call that never streams stops counting
+        self.clock = clock
+        self.active = 0
+        self._pending = {}                          # call_sid -> admitted at
+        self._limits = {}                           # name -> (limit, remaining, reset_seconds, seen at)
+        self._cooldown_until = 0.0
+        self.stats = {"admitted": 0, "rejected": 0, "rate_limit_updates": 0, "upstream_errors": 0}
+        CAPACITY_HEADROOM.set_function(self.headroom)
+
+    # --- inputs ------------------------------------------------------------------
+
+    def on_rate_limits(self, rate_limits):
+        now = self.clock()
+        for rl in rate_limits:
+            if rl.get("name") in RATE_LIMITS:
+                self._limits[rl["name"]] = (rl["limit"], rl["remaining"], rl.get("reset_seconds", 0), now)
+        self.stats["rate_limit_updates"] += 1
+
+    def upstream_error(self, reason):
+        """Rate-limited or could not connect: turn new calls away for a while."""
+        self.stats["upstream_errors"] += 1
+        if self.clock() >= self._cooldown_until:
+            log.warning("🚦 upstream failing, admission paused", extra={"reason": reason, "cooldown_s": self.cooldown_s})
+        self._cooldown_until = self.clock() + self.cooldown_s
+
+    def started(self, call_sid):
+        self._pending.pop(call_sid, None)
+        self.active += 1
+
+    def ended(self):
+        self.active -= 1
+
+    def cancel(self, call_sid):
+        """An admitted call will not stream after all."""
+        self._pending.pop(call_sid, None)
+
+    def upstream_failed(self, call_sid, reason="connect failed"):
+        self._pending.pop(call_sid, None)
+        self.upstream_error(reason)
+
+    # --- decisions ------------------------------------------------------------------
+
+    def remaining(self, name):
+        """Estimated remaining `name` ("requests" / "tokens") now, or None if never reported."""
+        entry = self._limits.get(name)
+        if entry is None:
+            return None
+        limit, remaining, reset_s, seen = entry
+        elapsed = self.clock() - seen
+        if reset_s <= 0 or elapsed >= reset_s:
+            return limit
+        return remaining + (limit - remaining) * elapsed / reset_s
+
+    def headroom(self):
+        """Further calls that fit under every limit right now (inf if nothing limits)."""
+        return self._check()[0]
+
+    def admit(self, call_sid):
+        """None if a new call may stream, else the reason it should be turned away."""
+        free, reason = self._check()
+        if free < 1:
+            self.stats["rejected"] += 1
+            CAPACITY_REJECTED.labels(reason).inc()
+            return reason
+        self.stats["admitted"] += 1
+        if call_sid:
+            self._pending[call_sid] = self.clock()
+        return None
+
+    def snapshot(self):
+        free, reason = self._check()
+        return {
+            **self.stats,
+            "active": self.active,
+            "pending": len(self._pending),
+            "headroom": None if free == float("inf") else free,
+            "limited_by": reason,
+            "remaining": {name: self.remaining(name) for name in self._limits},
+        }
+
+    def _check(self):
+        now = self.clock()
+        for call_sid, admitted in list(self._pending.items()):
+            if now - admitted > self.pending_ttl:
+                del self._pending[call_sid]
+        if now < self._cooldown_until:
+            return 0, "upstream_errors"
+        pending = len(self._pending)
+        free, reason = float("inf"), None
+        if self.max_calls:
+            free, reason = self.max_calls - self.active - pending, "max_calls"
+        for name in RATE_LIMITS:
+            remaining, per_call = self.remaining(name), self.per_call[name]
+            if remaining is None or not per_call:
+                continue
+            fits = int(remaining // per_call) - pending
+            if fits < free:
+                free, reason = fits, name
+        return max(0, free), reason
@@ -0,0 +1,88 @@
+import json
+
+from logs import get_logger
+
+log = get_logger(__name__)
+
+BOOKING = "<<"      # followed by the booking JSON object
+HANGUP = ">>"
+TRANSFER = "^^"
+MARKERS = (BOOKING, HANGUP, TRANSFER)
+_MARKER_CHARS = {m[0] for m in MARKERS}
+
+
+class ControlTokenScanner:
+    """Finds the prompt's control markers in a streaming transcript.
+
+    feed() takes response.audio_transcript.delta / response.text.delta chunks and
+    returns the actions completed so far: ("hangup", None), ("transfer", None) or
+    ("booking", dict) once the JSON object after `<<` closes. Markers split across
+    chunks are handled; each action fires at most once per response. finish() ends
+    the response and flushes a booking whose JSON never closed.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self._tail = ""
+        self._booking = None        # text captured after `<<`, None when not capturing
+        self._depth = 0
+        self._fired = set()
+        self.text_seen = False
+
+    def feed(self, text):
+        self.text_seen = True
+        actions = []
+        buf = self._tail + text
+        self._tail = ""
+        i = 0
+        while i < len(buf):
+            if self._booking is not None:
+                i = self._capture_booking(buf, i, actions)
+                continue
+            hits = [(buf.find(m, i), m) for m in MARKERS]
+            hit = min(((pos, m) for pos, m in hits if pos >= 0), default=None)
+            if hit is None:
+                if buf[-1] in _MARKER_CHARS:
+                    self._tail = buf[-1]        # may be the first half of a marker
+                break
+            pos, marker = hit
+            i = pos + len(marker)
+            if marker == BOOKING:
+                if BOOKING not in self._fired:
+                    self._booking = ""
+                    self._depth = 0
+            elif marker not in self._fired:
+                self._fired.add(marker)
+                actions.append(("hangup" if marker == HANGUP else "transfer", None))
+        return actions
+
+    def finish(self):
+        actions = []
+        if self._booking:
+            self._emit_booking(self._booking.strip(), actions)
+        self.reset()
+        return actions
+
+    def _capture_booking(self, buf, i, actions):
+        for j in range(i, len(buf)):
+            ch = buf[j]
+            if ch == "{":
+                self._depth += 1
+            elif ch == "}" and self._depth:
+                self._depth -= 1
+                if self._depth == 0:
+                    self._booking += buf[i:j + 1]
+                    self._emit_booking(self._booking.strip(), actions)
+                    return j + 1
+        self._booking += buf[i:]
+        return len(buf)
+
+    def _emit_booking(self, raw, actions):
+        self._booking = None
+        self._fired.add(BOOKING)
+        try:
+            actions.append(("booking", json.loads(raw)))
+        except ValueError as e:
+            log.error("❌ Failed to parse booking JSON: %s", e)
@@ -0,0 +1,149 @@
+import re
+import time
+from collections import OrderedDict
+
+from greeting_cache import AudioClip
+from metrics import FAQ_LOOKUPS
+
+# Questions prompt.txt answers with fixed facts. A hit cancels the live answer, so a
+# match has to be unambiguous: the turn must be framed as a question (it ends in "?"
+# or opens with a question word), and one of an intent's rules must match, i.e. every
+# word group of the rule has a word in the normalized transcript and none of the
+# intent's `exclude` words appear. Every rule pairs the topic with a second group (a
+# question word or what is being asked about it), so a topic word alone never hits.
+# A transcript matching zero or several intents is not an FAQ.
+_WHAT = {"what", "what's", "whats"}
+_ASK_SERVICE = _WHAT | {"free", "cost", "get", "offer", "include", "how", "do", "does"}
+
+DEFAULT_INTENTS = {
+    "hours": {
+        "rules": [
+            [{"hours"}, _WHAT | {"your", "business", "office", "opening"}],
+            [{"when", "time"}, {"open", "close", "closes", "closing"}],
+        ],
+        "exclude": {"house", "houses", "negotiate", "negotiating", "negotiable", "offer", "offers", "price",
+                    "idea", "ideas", "suggestions"},
+    },
+    "staging_price": {
+        "rules": [
+            [{"staging", "stage"}, {"cost", "costs", "price", "pricing", "charge", "fee", "fees"}],
+            [{"staging", "stage"}, {"how"}, {"much"}],
+        ],
+    },
+    "cma": {
+        "rules": [
+            [{"cma", "cmas"}, _ASK_SERVICE],
+            [{"market"}, {"evaluation", "analysis"}, _ASK_SERVICE],
+        ],
+    },
+    "photography": {
+        "rules": [
+            [{"photography", "photographer", "photos", "photo", "pictures"},
+             {"professional", "include", "included", "includes", "provide", "offer", "offers"}],
+        ],
+        "exclude": {"send", "see", "show", "look"},
+    },
+    "commission": {
+        "rules": [
+            [{"commission", "commissions"}, _WHAT | {"your", "how", "much", "charge", "rate"}],
+            [{"your"}, {"fee", "fees", "percent", "percentage", "rate"}, _WHAT | {"how"}],
+        ],
+        "exclude": {"staging", "stage", "photography", "photos", "normal", "agent's", "my"},
+    },
+}
+
+# A turn that opens with one of these (after filler words) is asking something
+QUESTION_WORDS = _WHAT | {
+    "when", "when's", "how", "how's", "do", "does", "are", "is", "can", "could", "would", "will",
+    "tell", "i'd", "wondering", "which", "where",
+}
+
+FILLER_WORDS = {
+    "um", "uh", "erm", "hmm", "so", "like", "hi", "hello", "hey", "please", "just",
+    "okay", "ok", "yeah", "well", "actually", "basically",
+}
+
+_WORDS = re.compile(r"[a-z0-9']+")
+
+
+def normalize(transcript):
+    return " ".join(w for w in _WORDS.findall(transcript.lower().replace("’", "'")) if w not in FILLER_WORDS)
+
+
+class FaqCache:
+    """Assistant answers to FAQ intents, replayed instead of generating them again.
+
+    Keyed by (prompt version, intent) so an answer is only reused with the prompt that
+    produced it; invalidate() drops everything when prompt.txt changes. LRU-evicted
+    past `max_entries`, and entries expire after `ttl` seconds so a wording change in
+    how the model answers eventually makes it into the cache.
+    """
+
+    def __init__(self, intents=None, max_entries=64, ttl=24 * 3600, max_words=16, clock=time.monotonic):
+        self.intents = DEFAULT_INTENTS if intents is None else intents
+        for name, spec in self.intents.items():
+            if any(len(rule) < 2 for rule in spec["rules"]):
+                raise ValueError(f"FAQ intent {name!r}: every rule needs at least two word groups")
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_words = max_words      # longer turns usually ask more than the FAQ
+        self.clock = clock
+        self._answers = OrderedDict()   # (version, intent) -> (expires_at, AudioClip)
+        self.stats = {"hit": 0, "miss": 0, "late": 0, "stored": 0, "evicted": 0}
+
+    def intent(self, transcript):
+        """The FAQ intent of a caller turn, or None when it is not confidently one."""
+        words = normalize(transcript).split()
+        if not words or len(words) > self.max_words:
+            return None
+        if not transcript.rstrip().endswith("?") and words[0] not in QUESTION_WORDS:
+            return None
+        tokens = set(words)
+        matched = [
+            name for name, spec in self.intents.items()
+            if not tokens & spec.get("exclude", set())
+            and any(all(tokens & group for group in rule) for rule in spec["rules"])
+        ]
+        return matched[0] if len(matched) == 1 else None
+
+    def lookup(self, version, intent, late=False):
+        """("hit", clip), ("miss", None) or ("late", None).
+
+        "late" means the answer is cached but the live one is already playing.
+        """
+        key = (version, intent)
+        entry = self._answers.get(key)
+        if entry is not None and entry[0] <= self.clock():
+            del self._answers[key]
+            entry = None
+        if entry is None:
+            result, clip = "miss", None
+        elif late:
+            result, clip = "late", None
+        else:
+            self._answers.move_to_end(key)
+            result, clip = "hit", entry[1]
+        self.stats[result] += 1
+        FAQ_LOOKUPS.labels(result).inc()
+        return result, clip
+
+    def put(self, version, intent, payloads, transcript):
+        if not payloads or not transcript:
+            return
+        self._answers[(version, intent)] = (self.clock() + self.ttl, AudioClip.from_payloads(payloads, transcript))
+        self._answers.move_to_end((version, intent))
+        self.stats["stored"] += 1
+        while len(self._answers) > self.max_entries:
+            self._answers.popitem(last=False)
+            self.stats["evicted"] += 1
+
+    def invalidate(self):
+        self._answers.clear()
+
+    def snapshot(self):
+        lookups = self.stats["hit"] + self.stats["miss"] + self.stats["late"]
+        return {
+            **self.stats,
+            "entries": [f"{intent}@{version}" for version, intent in self._answers],
+            "hit_rate": round(self.stats["hit"] / lookups, 3) if lookups else None,
+        }
@@ -0,0 +1,152 @@
+import os
+import json
+import base64
+import asyncio
+import hashlib
+
+from logs import get_logger
+
+log = get_logger(__name__)
+
+CHUNK_BYTES = 800       # 100 ms of 8 kHz mu-law per Twilio media frame
+
+
+class AudioClip:
+    """Assistant audio to replay (mu-law) plus the transcript the model said with it."""
+
+    def __init__(self, audio, transcript):
+        self.audio = audio
+        self.transcript = transcript
+        # Pre-encoded Twilio payloads, so playing the clip is only enqueueing strings
+        self.payloads = [
+            base64.b64encode(audio[i:i + CHUNK_BYTES]).decode("ascii")
+            for i in range(0, len(audio), CHUNK_BYTES)
+        ]
+
+    @classmethod
+    def from_payloads(cls, payloads, transcript):
+        return cls(b"".join(base64.b64decode(p) for p in payloads), transcript)
+
+    @property
+    def duration_ms(self):
+        return len(self.audio) / 8
+
+    def seed_event(self):
+        """conversation.item.create that makes the model believe it already said this."""
+        return json.dumps({
+            "type": "conversation.item.create",
+            "item": {
+                "type": "message",
+                "role": "assistant",
+                "content": [{"type": "text", "text": self.transcript}],
+            },
+        })
+
+
+class GreetingCache:
+    """Greeting clips keyed by hash(prompt version, voice), persisted under `directory`.
+
+    get() never blocks the call path: a missing clip returns None (the caller falls back
+    to a live response.create) and ensure() synthesizes it once in the background via
+    `synthesize(key, *args) -> (audio bytes, transcript)`.
+    """
+
+    def __init__(self, directory, synthesize):
+        self.directory = directory
+        self.synthesize = synthesize
+        self._clips = {}            # key -> AudioClip
+        self._pending = {}          # key -> asyncio.Task
+
+    @staticmethod
+    def key(prompt_version, voice):
+        return hashlib.sha256(f"{prompt_version}:{voice}".encode()).hexdigest()[:16]
+
+    def get(self, key):
+        clip = self._clips.get(key)
+        if clip is None:
+            clip = self._load(key)
+            if clip is not None:
+                self._clips[key] = clip
+        return clip
+
+    def ensure(self, key, *args):
+        if self.get(key) is not None or key in self._pending:
+            return
+        task = asyncio.create_task(self._generate(key, *args))
+        self._pending[key] = task
+        task.add_done_callback(lambda _: self._pending.pop(key, None))
+
+    def snapshot(self):
+        return {"cached": sorted(self._clips), "generating": sorted(self._pending)}
+
+    async def close(self):
+        for task in list(self._pending.values()):
+            task.cancel()
+        await asyncio.gather(*self._pending.values(), return_exceptions=True)
+
+    async def _generate(self, key, *args):
+        try:
+            audio, transcript = await self.synthesize(key, *args)
+        except Exception as e:
+            log.error("❌ greeting synthesis failed: %r", e, extra={"greeting_key": key})
+            return
+        if not audio or not transcript:
+            log.warning("Greeting synthesis returned no audio/transcript", extra={"greeting_key": key})
+            return
+        self._clips[key] = clip = AudioClip(audio, transcript)
+        try:
+            await asyncio.to_thread(self._save, key, clip)
+        except OSError as e:
+            log.warning("❌ could not persist greeting: %r", e, extra={"greeting_key": key})
+        log.info("🎙️ greeting cached", extra={
+            "greeting_key": key, "duration_ms": clip.duration_ms, "transcript": transcript})
+
+    def _paths(self, key):
+        base = os.path.join(self.directory, key)
+        return base + ".ulaw", base + ".json"
+
+    def _load(self, key):
+        audio_path, meta_path = self._paths(key)
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                transcript = json.load(f)["transcript"]
+            with open(audio_path, "rb") as f:
+                audio = f.read()
+        except (OSError, ValueError, KeyError):
+            return None
+        return AudioClip(audio, transcript)
+
+    def _save(self, key, clip):
+        os.makedirs(self.directory, exist_ok=True)
+        audio_path, meta_path = self._paths(key)
+        # Audio first, metadata last: _load only trusts a clip whose .json exists
+        for path, data, mode in ((audio_path, clip.audio, "wb"),
+                                 (meta_path, json.dumps({"transcript": clip.transcript}), "w")):
+            tmp = path + ".tmp"
+            with open(tmp, mode, **({} if mode == "wb" else {"encoding": "utf-8"})) as f:
+                f.write(data)
+            os.replace(tmp, path)
+
+
+async def synthesize_greeting(ws, timeout=30):
+    """Ask a configured realtime session for its opening line; returns (mu-law audio, transcript)."""
+    await ws.send(json.dumps({"type": "response.create", "response": {"modalities": ["text", "audio"]}}))
+    audio = []
+    transcript = ""
+
+    async def collect():
+        nonlocal transcript
+        async for raw in ws:
+            evt = json.loads(raw)
+            etype = evt.get("type")
+            if etype == "response.audio.delta":
+                audio.append(base64.b64decode(evt["delta"]))
+            elif etype == "response.audio_transcript.delta":
+                transcript += evt.get("delta", "")
+            elif etype == "error":
+                raise RuntimeError(f"greeting response failed: {evt.get('error')}")
+            elif etype == "response.done":
+                return
+
+    await asyncio.wait_for(collect(), timeout)
+    return b"".join(audio), transcript.strip()
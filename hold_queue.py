@@ -0,0 +1,185 @@
+import time
+import heapq
+import asyncio
+from collections import OrderedDict, deque
+
+from logs import get_logger
+from metrics import HOLD_QUEUE_LENGTH, HOLD_QUEUE_RESULTS, HOLD_QUEUE_WAIT
+
+log = get_logger(__name__)
+
+
+class HoldEntry:
+    __slots__ = ("call_sid", "caller", "to", "stream_url", "enqueued_at", "repeat", "rank")
+
+    def __init__(self, call_sid, caller, to, stream_url, enqueued_at, repeat, rank):
+        self.call_sid = call_sid
+        self.caller = caller
+        self.to = to
+        self.stream_url = stream_url    # where /incoming-call would have connected the call
+        self.enqueued_at = enqueued_at
+        self.repeat = repeat
+        self.rank = rank
+
+    def __lt__(self, other):
+        return self.rank < other.rank
+
+
+class HoldQueue:
+    """Callers on hold in a Twilio <Enqueue>, released by a local priority scheduler.
+
+    Twilio only plays the hold music; the order is decided here. The caller who
+    has waited longest goes first, and a repeat caller (one who called within
+    `repeat_window_s`) counts as having waited `repeat_bonus_s` longer, so an
+    already frustrated caller jumps ahead without starving first-time callers.
+
+    The scheduler releases callers while `admit(call_sid)` lets them in, whenever it is
+    woken (a call ended, a pooled session became idle, limits were updated) or
+    every `poll_interval`. `connect(entry)` moves the call from the queue to its
+    media stream; callers still waiting after `max_wait_s` go to `give_up(entry)`.
+    """
+
+    def __init__(self, connect, give_up, admit, max_size=50, max_wait_s=300.0,
+                 repeat_bonus_s=60.0, repeat_window_s=7 * 86400, max_callers_seen=10_000,
+                 poll_interval=1.0, clock=time.monotonic):
+        self.connect = connect              # async (HoldEntry) -> None
+        self.give_up = give_up              # async (HoldEntry) -> None
+        self.admit = admit                  # (call_sid) -> bool, reserves a slot if there is one
+        self.max_size = max_size
+        self.max_wait_s = max_wait_s
+        self.repeat_bonus_s = repeat_bonus_s
+        self.repeat_window_s = repeat_window_s
+        self.max_callers_seen = max_callers_seen
+        self.poll_interval = poll_interval
+        self.clock = clock
+        self._heap = []                     # HoldEntry by rank; removed entries are skipped lazily
+        self._entries = {}                  # call_sid -> HoldEntry still waiting
+        self._seen = OrderedDict()          # caller -> last call (wall clock), LRU
+        self._waits = deque(maxlen=500)     # recent waits of connected callers, seconds
+        self._wake = asyncio.Event()
+        self._task = None
+        self._moving = set()
+        self.stats = {"enqueued": 0, "connected": 0, "abandoned": 0, "timed_out": 0, "full": 0}
+        HOLD_QUEUE_LENGTH.set_function(lambda: len(self._entries))
+
+    def __len__(self):
+        return len(self._entries)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+        return self
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, *self._moving, return_exceptions=True)
+            self._task = None
+
+    def wake(self):
+        self._wake.set()
+
+    # --- webhooks ----------------------------------------------------------------
+
+    def seen(self, caller):
+        """Remember a caller, so their next call within the window counts as a repeat."""
+        if not caller:
+            return False
+        now = time.time()
+        last = self._seen.pop(caller, None)
+        self._seen[caller] = now
+        while len(self._seen) > self.max_callers_seen:
+            self._seen.popitem(last=False)
+        return last is not None and now - last < self.repeat_window_s
+
+    def add(self, call_sid, caller, to, stream_url, repeat=False):
+        """Put a caller on hold; False if the queue is full."""
+        if call_sid in self._entries:
+            return True
+        if len(self._entries) >= self.max_size:
+            self.stats["full"] += 1
+            return False
+        now = self.clock()
+        entry = HoldEntry(call_sid, caller, to, stream_url, now, repeat,
+                          now - (self.repeat_bonus_s if repeat else 0))
+        self._entries[call_sid] = entry
+        heapq.heappush(self._heap, entry)
+        self.stats["enqueued"] += 1
+        log.info("⏳ caller on hold", extra={"callSid": call_sid, "caller": caller, "repeat": repeat,
+                                            "position": self.position(call_sid), "waiting": len(self._entries)})
+        self.wake()
+        return True
+
+    def position(self, call_sid):
+        """1-based place in line, or None if not waiting."""
+        entry = self._entries.get(call_sid)
+        if entry is None:
+            return None
+        return 1 + sum(1 for other in self._entries.values() if other.rank < entry.rank)
+
+    def left(self, call_sid, result):
+        """Twilio's <Enqueue> action: the caller left the queue without us moving them."""
+        entry = self._entries.pop(call_sid, None)
+        if entry is not None:
+            self.stats["abandoned"] += 1
+            HOLD_QUEUE_RESULTS.labels("abandoned").inc()
+            log.info("⏳ caller left the hold queue", extra={
+                "callSid": call_sid, "result": result, "waited_s": round(self.clock() - entry.enqueued_at, 1)})
+
+    def snapshot(self):
+        now = self.clock()
+        waits = sorted(self._waits)
+        return {
+            **self.stats,
+            "waiting": len(self._entries),
+            "longest_wait_s": round(max((now - e.enqueued_at for e in self._entries.values()), default=0), 1),
+            "wait_p50_s": round(waits[len(waits) // 2], 1) if waits else None,
+            "wait_p95_s": round(waits[int(len(waits) * 0.95)], 1) if waits else None,
+        }
+
+    # --- scheduler -------------------------------------------------------------------
+
+    def _first(self):
+        heap = self._heap
+        while heap and self._entries.get(heap[0].call_sid) is not heap[0]:
+            heapq.heappop(heap)         # left or timed out since it was pushed
+        return heap[0] if heap else None
+
+    async def _run(self):
+        while True:
+            self._wake.clear()
+            self._expire()
+            while (entry := self._first()) is not None and self.admit(entry.call_sid):
+                heapq.heappop(self._heap)
+                del self._entries[entry.call_sid]
+                self._move(entry, self.connect, "connected")
+            try:
+                async with asyncio.timeout(self.poll_interval):
+                    await self._wake.wait()
+            except TimeoutError:
+                pass
+
+    def _expire(self):
+        cutoff = self.clock() - self.max_wait_s
+        for entry in [e for e in self._entries.values() if e.enqueued_at < cutoff]:
+            del self._entries[entry.call_sid]
+            self._move(entry, self.give_up, "timed_out")
+
+    def _move(self, entry, action, outcome):
+        waited = self.clock() - entry.enqueued_at
+        self.stats[outcome] += 1
+        HOLD_QUEUE_RESULTS.labels(outcome).inc()
+        if outcome == "connected":
+            self._waits.append(waited)
+            HOLD_QUEUE_WAIT.observe(waited)
+        log.info("⏳ caller released from hold", extra={
+            "callSid": entry.call_sid, "outcome": outcome, "waited_s": round(waited, 1), "repeat": entry.repeat})
+        task = asyncio.create_task(self._call(action, entry))
+        self._moving.add(task)
+        task.add_done_callback(self._moving.discard)
+
+    async def _call(self, action, entry):
+        try:
+            await action(entry)
+        except Exception as e:
+            log.error("❌ could not move caller off hold: %r", e, extra={"callSid": entry.call_sid})
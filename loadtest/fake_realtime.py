@@ -0,0 +1,201 @@
+import json
+import uuid
+import base64
+import random
+import asyncio
+from collections import defaultdict
+
+import websockets
+
+from loadtest.probes import make_frame, read_probes
+
+
+class FakeRealtimeServer:
+    """Local stand-in for the OpenAI realtime endpoint.
+
+    Answers session.update, times every probe it finds in input_audio_buffer.append,
+    and plays a scripted conversation: an assistant turn of `turn_audio_ms` audio sent
+    as `delta_ms` chunks at `realtime_factor` x real time, then `caller_turn_s` of
+    "caller speech" (speech_started / speech_stopped) before the next turn. A
+    `barge_in_rate` fraction of turns is interrupted half way through. With
+    `caller_transcript` set, sessions that enable input_audio_transcription also get
+    it as the transcript of every caller turn; with `transcript_late` it arrives only
+    after the reply's response.output_item.added, as it often does live. Responses are
+    numbered (the number is in every frame of their audio) and the ones a client
+    cancels with response.cancel are kept in `cancelled`. `rate_limits` (a list like
+    the real event's) is reported in a rate_limits.updated after every response.done.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, turn_audio_ms=3000, delta_ms=100,
+                 realtime_factor=4.0, caller_turn_s=2.0, barge_in_rate=0.2, seed=7,
+                 script="Thanks for calling, we can help with that.", caller_transcript=None,
+                 transcript_late=False, rate_limits=None):
+        self.host = host
+        self.port = port
+        self.turn_audio_ms = turn_audio_ms
+        self.delta_ms = delta_ms
+        self.realtime_factor = realtime_factor
+        self.caller_turn_s = caller_turn_s
+        self.barge_in_rate = barge_in_rate
+        self.script = script            # assistant transcript, one word per audio delta
+        self.caller_transcript = caller_transcript
+        self.transcript_late = transcript_late
+        self.rate_limits = rate_limits
+        self.random = random.Random(seed)
+        self._server = None
+
+        self.upstream_latency = defaultdict(list)   # call_idx -> [ms]
+        self.append_messages = 0
+        self.sessions = 0
+        self.responses = 0
+        self.cancelled = set()      # response numbers cancelled by the client
+
+    @property
+    def url(self):
+        return f"ws://{self.host}:{self.port}/v1/realtime"
+
+    async def start(self):
+        self._server = await websockets.serve(self._handle, self.host, self.port, max_size=None)
+        self.port = next(iter(self._server.sockets)).getsockname()[1]
+        return self
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+
+    def reset_stats(self):
+        self.upstream_latency.clear()
+        self.append_messages = 0
+        self.cancelled.clear()
+
+    async def _handle(self, ws, *_):
+        self.sessions += 1
+        session = _Session(self, ws)
+        await session.send({"type": "session.created", "session": {"id": f"sess_{uuid.uuid4().hex[:12]}"}})
+        try:
+            async for raw in ws:
+                await session.on_message(json.loads(raw))
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            session.stop()
+
+
+class _Session:
+    def __init__(self, server, ws):
+        self.server = server
+        self.ws = ws
+        self.call_idx = 0
+        self.turn = None
+        self.transcribe = False
+        self.response = None            # number of the response being played
+        self.late_transcript = None     # sent with the next response
+
+    async def send(self, evt):
+        # The real wire format: compact, `type` then `event_id` first, which is what the
+        # bridge's fast paths (media_codec.parse_audio_delta) look for
+        evt = {"type": evt["type"], "event_id": f"event_{uuid.uuid4().hex[:12]}", **evt}
+        await self.ws.send(json.dumps(evt, separators=(",", ":")))
+
+    def stop(self):
+        if self.turn:
+            self.turn.cancel()
+
+    async def on_message(self, msg):
+        mtype = msg.get("type")
+        if mtype == "input_audio_buffer.append":
+            self.server.append_messages += 1
+            audio = base64.b64decode(msg["audio"])
+            for call_idx, ms in read_probes(audio):
+                self.call_idx = call_idx
+                self.server.upstream_latency[call_idx].append(ms)
+        elif mtype == "session.update":
+            self.transcribe = "input_audio_transcription" in msg.get("session", {})
+            await self.send({"type": "session.updated", "session": msg.get("session", {})})
+        elif mtype == "response.create":
+            if self.turn is None or self.turn.done():
+                self.turn = asyncio.create_task(self._conversation())
+        elif mtype == "conversation.item.create":
+            item = msg.get("item", {})
+            await self.send({"type": "conversation.item.created", "item": item})
+            if item.get("role") == "assistant" and (self.turn is None or self.turn.done()):
+                # Seeded greeting: the caller speaks first, then the usual turns
+                self.turn = asyncio.create_task(self._conversation(caller_first=True))
+        elif mtype == "response.cancel":
+            if self.response is not None:
+                self.server.cancelled.add(self.response)
+            self.stop()
+        elif mtype == "conversation.item.truncate":
+            await self.send({"type": "conversation.item.truncated", "item_id": msg.get("item_id"),
+                             "content_index": msg.get("content_index", 0),
+                             "audio_end_ms": msg.get("audio_end_ms")})
+
+    async def _conversation(self, caller_first=False):
+        try:
+            while True:
+                if not caller_first:
+                    await self._assistant_turn()
+                caller_first = False
+                await asyncio.sleep(self.server.caller_turn_s / 2)
+                await self.send({"type": "input_audio_buffer.speech_started", "audio_start_ms": 0,
+                                 "item_id": f"item_{uuid.uuid4().hex[:12]}"})
+                await asyncio.sleep(self.server.caller_turn_s / 2)
+                item_id = f"item_{uuid.uuid4().hex[:12]}"
+                await self.send({"type": "input_audio_buffer.speech_stopped", "audio_end_ms": 0})
+                await self.send({"type": "input_audio_buffer.committed", "item_id": item_id})
+                if self.transcribe and self.server.caller_transcript:
+                    transcript = {"type": "conversation.item.input_audio_transcription.completed",
+                                  "item_id": item_id, "content_index": 0,
+                                  "transcript": self.server.caller_transcript}
+                    if self.server.transcript_late:
+                        self.late_transcript = transcript
+                    else:
+                        await self.send(transcript)
+        except (asyncio.CancelledError, websockets.ConnectionClosed):
+            pass
+
+    async def _assistant_turn(self):
+        srv = self.server
+        response_id = f"resp_{uuid.uuid4().hex[:12]}"
+        item_id = f"item_{uuid.uuid4().hex[:12]}"
+        srv.responses += 1
+        self.response = srv.responses
+        chunks = srv.turn_audio_ms // srv.delta_ms
+        barge_at = chunks // 2 if srv.random.random() < srv.barge_in_rate else None
+        words = self.server.script.split()
+        transcript = []
+        status = "completed"
+
+        await self.send({"type": "response.created", "response": {"id": response_id, "status": "in_progress"}})
+        await self.send({"type": "response.output_item.added", "response_id": response_id, "output_index": 0,
+                         "item": {"id": item_id, "type": "message", "role": "assistant", "content": []}})
+        if self.late_transcript is not None:
+            # Its first audio delta follows at once, before any cancel can come back
+            await self.send(self.late_transcript)
+            self.late_transcript = None
+        for i in range(chunks):
+            if i == barge_at:
+                await self.send({"type": "input_audio_buffer.speech_started", "audio_start_ms": 0,
+                                 "item_id": f"item_{uuid.uuid4().hex[:12]}"})
+                status = "cancelled"
+                break
+            audio = b"".join(make_frame(self.call_idx, response=self.response) for _ in range(srv.delta_ms // 20))
+            await self.send({"type": "response.audio.delta", "response_id": response_id,
+                             "item_id": item_id, "output_index": 0, "content_index": 0,
+                             "delta": base64.b64encode(audio).decode("ascii")})
+            if i < len(words):
+                transcript.append(words[i] + " ")
+                await self.send({"type": "response.audio_transcript.delta", "response_id": response_id,
+                                 "item_id": item_id, "delta": words[i] + " "})
+            await asyncio.sleep(srv.delta_ms / 1000 / srv.realtime_factor)
+
+        self.response = None
+        await self.send({"type": "response.audio.done", "response_id": response_id, "item_id": item_id})
+        await self.send({"type": "response.done", "response": {
+            "id": response_id, "status": status,
+            "output": [{"id": item_id, "type": "message", "role": "assistant",
+                        "content": [{"type": "audio", "transcript": "".join(transcript).strip()}]}],
+        }})
+        if srv.rate_limits is not None:
+            await self.send({"type": "rate_limits.updated", "rate_limits": srv.rate_limits})
@@ -0,0 +1,118 @@
+"""Tiny Redis-protocol server for trying CALL_STATE_URL=redis://... without Redis.
+
+Implements just what call_state.RedisCallState uses (PING, AUTH, SELECT, HSET,
+HGETALL, EXPIRE, TTL, DEL) with lazy expiry. One keyspace, no persistence.
+
+    python -m loadtest.fake_redis --port 6390
+    CALL_STATE_URL=redis://127.0.0.1:6390/0 uvicorn app5:app --workers 4
+"""
+import time
+import argparse
+import asyncio
+
+
+class FakeRedisServer:
+    def __init__(self, host="127.0.0.1", port=0):
+        self.host = host
+        self.port = port
+        self._data = {}         # key -> dict of field -> bytes
+        self._expires = {}      # key -> monotonic deadline
+        self._server = None
+        self.commands = 0
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                args = await _read_command(reader)
+                if args is None:
+                    break
+                self.commands += 1
+                writer.write(self._dispatch(args))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def _live(self, key):
+        deadline = self._expires.get(key)
+        if deadline is not None and deadline <= time.monotonic():
+            self._data.pop(key, None)
+            self._expires.pop(key, None)
+        return self._data.get(key)
+
+    def _dispatch(self, args):
+        cmd, args = args[0].upper(), args[1:]
+        if cmd in (b"PING", b"AUTH", b"SELECT", b"CLIENT"):
+            return b"+PONG\r\n" if cmd == b"PING" else b"+OK\r\n"
+        if cmd == b"HSET" and len(args) >= 3 and len(args) % 2 == 1:
+            fields = self._live(args[0])
+            if fields is None:
+                fields = self._data[args[0]] = {}
+            added = 0
+            for i in range(1, len(args), 2):
+                added += args[i] not in fields
+                fields[args[i]] = args[i + 1]
+            return b":%d\r\n" % added
+        if cmd == b"HGETALL" and len(args) == 1:
+            fields = self._live(args[0]) or {}
+            flat = [v for pair in fields.items() for v in pair]
+            return b"*%d\r\n" % len(flat) + b"".join(_bulk(v) for v in flat)
+        if cmd == b"EXPIRE" and len(args) == 2:
+            if self._live(args[0]) is None:
+                return b":0\r\n"
+            self._expires[args[0]] = time.monotonic() + int(args[1])
+            return b":1\r\n"
+        if cmd == b"TTL" and len(args) == 1:
+            if self._live(args[0]) is None:
+                return b":-2\r\n"
+            deadline = self._expires.get(args[0])
+            return b":%d\r\n" % (-1 if deadline is None else int(deadline - time.monotonic()))
+        if cmd == b"DEL":
+            removed = 0
+            for key in args:
+                removed += self._live(key) is not None
+                self._data.pop(key, None)
+                self._expires.pop(key, None)
+            return b":%d\r\n" % removed
+        return b"-ERR unknown command '%s'\r\n" % cmd
+
+
+def _bulk(value):
+    return b"$%d\r\n%s\r\n" % (len(value), value)
+
+
+async def _read_command(reader):
+    line = await reader.readline()
+    if not line:
+        return None
+    if not line.startswith(b"*"):
+        return line.split()        # inline command, e.g. from redis-cli / telnet
+    args = []
+    for _ in range(int(line[1:])):
+        size = int((await reader.readline())[1:])
+        args.append((await reader.readexactly(size + 2))[:-2])
+    return args
+
+
+async def main(args):
+    server = await FakeRedisServer(args.host, args.port).start()
+    print(f"fake redis listening on {server.host}:{server.port}")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=6390)
+    asyncio.run(main(p.parse_args()))
@@ -0,0 +1,169 @@
+import json
+import time
+import base64
+import asyncio
+
+import httpx
+import websockets
+
+from collections import Counter
+
+from loadtest.probes import FRAME_BYTES, make_frame, read_probes, read_responses, summarize
+
+
+class FakeTwilioCall:
+    """Plays the Twilio side of one call against the bridge under test.
+
+    Optionally hits /incoming-call first (so speculative connects are exercised), then
+    opens /media-stream, sends connected/start and a 20 ms mu-law frame every 20 ms on
+    a monotonic schedule. Outbound media is "played" in real time: marks are echoed
+    back only once the audio queued before them would have finished playing, and a
+    `clear` drops whatever is still queued, like Twilio does.
+
+    Downstream latency is taken from audio that starts playback (it arrives with the
+    play buffer empty): later audio of a response is meant to arrive just ahead of
+    its play time when the bridge paces it, so its age says nothing about the bridge.
+    `buffered_ms` samples the play buffer at every arrival, and `responses_heard`
+    counts the frames received from each fake response.
+    """
+
+    def __init__(self, base_url, call_idx, duration_s, hit_webhook=True, greeting_s=0.5, to=None):
+        self.base_url = base_url.rstrip("/")
+        self.to = to                    # dialed number, selects the tenant
+        self.call_idx = call_idx
+        self.duration_s = duration_s
+        self.hit_webhook = hit_webhook
+        self.greeting_s = greeting_s
+        self.call_sid = f"CA{call_idx:032x}"
+        self.stream_sid = f"MZ{call_idx:032x}"
+
+        self.downstream_latency = []
+        self.buffered_ms = []           # audio queued "at Twilio" after each arrival
+        self.responses_heard = Counter()    # fake response number -> frames received
+        self._bytes_received = 0
+        self.send_lag = []              # how late each frame left vs. its 20 ms slot
+        self.frames_sent = 0
+        self.frames_received = 0
+        self.marks_echoed = 0
+        self.clears = 0
+        self.hung_up = False            # the bridge closed the stream (e.g. a `>>` hangup)
+        self.error = None
+
+        self._played_until = 0.0
+        self._mark_tasks = set()
+        self._seq = 0
+
+    async def run(self, http=None):
+        try:
+            if self.hit_webhook and http is not None:
+                form = {"From": f"+1555{self.call_idx:07d}", "CallSid": self.call_sid}
+                if self.to:
+                    form["To"] = self.to
+                await http.post(f"{self.base_url}/incoming-call", data=form)
+                await asyncio.sleep(self.greeting_s)
+            ws_url = self.base_url.replace("http", "ws", 1) + f"/media-stream?caller=%2B1555{self.call_idx:07d}"
+            async with websockets.connect(ws_url, max_size=None) as ws:
+                await self._send(ws, {"event": "connected", "protocol": "Call", "version": "1.0.0"})
+                await self._send(ws, {"event": "start", "start": {
+                    "accountSid": "ACloadtest", "streamSid": self.stream_sid, "callSid": self.call_sid,
+                    "tracks": ["inbound"], "customParameters": {},
+                    "mediaFormat": {"encoding": "audio/x-mulaw", "sampleRate": 8000, "channels": 1},
+                }})
+                reader = asyncio.create_task(self._read(ws))
+                try:
+                    await self._pump(ws)
+                    await self._send(ws, {"event": "stop", "stop": {"accountSid": "ACloadtest",
+                                                                   "callSid": self.call_sid}})
+                finally:
+                    reader.cancel()
+                    for t in list(self._mark_tasks):
+                        t.cancel()
+        except websockets.ConnectionClosedOK:
+            self.hung_up = True
+        except Exception as e:
+            self.error = repr(e)
+
+    async def _send(self, ws, msg):
+        # Twilio's wire format: compact, `event` first (media_codec.parse_twilio_media's fast path)
+        self._seq += 1
+        msg = {"event": msg["event"], "sequenceNumber": str(self._seq), **msg, "streamSid": self.stream_sid}
+        await ws.send(json.dumps(msg, separators=(",", ":")))
+
+    async def _pump(self, ws):
+        start = time.monotonic()
+        frames = int(self.duration_s * 1000 / 20)
+        for n in range(frames):
+            slot = start + n * 0.02
+            delay = slot - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            else:
+                self.send_lag.append(-delay * 1000)
+            payload = base64.b64encode(make_frame(self.call_idx)).decode("ascii")
+            await self._send(ws, {"event": "media", "media": {
+                "track": "inbound", "chunk": str(n + 1), "timestamp": str(n * 20), "payload": payload,
+            }})
+            self.frames_sent += 1
+
+    async def _read(self, ws):
+        try:
+            async for raw in ws:
+                msg = json.loads(raw)
+                event = msg.get("event")
+                if event == "media":
+                    audio = base64.b64decode(msg["media"]["payload"])
+                    self._bytes_received += len(audio)
+                    self.responses_heard.update(read_responses(audio))
+                    self.frames_received = self._bytes_received // FRAME_BYTES
+                    now = time.monotonic()
+                    if self._played_until <= now:
+                        for _, ms in read_probes(audio):
+                            self.downstream_latency.append(ms)
+                    self._played_until = max(self._played_until, now) + len(audio) / 8000
+                    self.buffered_ms.append((self._played_until - now) * 1000)
+                elif event == "mark":
+                    task = asyncio.create_task(self._echo_mark(ws, msg["mark"]["name"], self._played_until))
+                    self._mark_tasks.add(task)
+                    task.add_done_callback(self._mark_tasks.discard)
+                elif event == "clear":
+                    self.clears += 1
+                    self._played_until = time.monotonic()
+                    for t in list(self._mark_tasks):
+                        t.cancel()
+                    # Twilio returns the marks that were pending when the buffer was cleared
+        except websockets.ConnectionClosed:
+            pass
+
+    async def _echo_mark(self, ws, name, at):
+        try:
+            await asyncio.sleep(max(0.0, at - time.monotonic()))
+        except asyncio.CancelledError:
+            pass        # cleared: echo immediately
+        try:
+            await self._send(ws, {"event": "mark", "mark": {"name": name}})
+            self.marks_echoed += 1
+        except websockets.ConnectionClosed:
+            pass
+
+    def result(self):
+        return {
+            "call": self.call_idx,
+            "frames_sent": self.frames_sent,
+            "frames_received": self.frames_received,
+            "marks_echoed": self.marks_echoed,
+            "clears": self.clears,
+            "hung_up": self.hung_up,
+            "downstream_ms": summarize(self.downstream_latency),
+            "buffered_ms": summarize(self.buffered_ms),
+            "error": self.error,
+        }
+
+
+async def run_calls(base_url, count, duration_s, hit_webhook=True, stagger_s=0.01, to=None):
+    calls = [FakeTwilioCall(base_url, i, duration_s, hit_webhook, to=to) for i in range(count)]
+    async with httpx.AsyncClient(timeout=10) as http:
+        async def launch(i, call):
+            await asyncio.sleep(i * stagger_s)
+            await call.run(http)
+        await asyncio.gather(*(launch(i, c) for i, c in enumerate(calls)))
+    return calls
@@ -0,0 +1,62 @@
+import math
+import time
+import struct
+
+# Every synthetic audio frame starts with a probe so the far end can time it:
+#   MAGIC (4 bytes) | call index (uint32) | perf_counter_ns at send (uint64) | response (uint32)
+# Both fakes run in the harness process, so they share the monotonic clock. Assistant
+# audio carries the number of the fake response it belongs to (0 for caller audio).
+MAGIC = b"\xa5\x5a\xc3\x3c"
+PROBE = struct.Struct(">4sIQ")
+RESPONSE = struct.Struct(">I")
+FRAME_BYTES = 160                   # 20 ms of 8 kHz mu-law
+SILENCE = b"\xff"
+
+
+def make_frame(call_idx, size=FRAME_BYTES, response=0):
+    probe = PROBE.pack(MAGIC, call_idx, time.perf_counter_ns()) + RESPONSE.pack(response)
+    return probe + SILENCE * (size - len(probe))
+
+
+def read_probes(audio, now_ns=None):
+    """Yield (call_idx, latency_ms) for every probe found at a 20 ms boundary in `audio`."""
+    now_ns = now_ns or time.perf_counter_ns()
+    for off in range(0, len(audio) - PROBE.size + 1, FRAME_BYTES):
+        if audio[off:off + 4] != MAGIC:
+            continue
+        _, call_idx, sent_ns = PROBE.unpack_from(audio, off)
+        yield call_idx, (now_ns - sent_ns) / 1e6
+
+
+def read_responses(audio):
+    """Yield the response number of every whole probe in `audio`, wherever it starts.
+
+    The bridge re-slices audio, so frames are not at 20 ms boundaries of a message.
+    """
+    size = PROBE.size + RESPONSE.size
+    off = audio.find(MAGIC)
+    while off != -1 and off + size <= len(audio):
+        yield RESPONSE.unpack_from(audio, off + PROBE.size)[0]
+        off = audio.find(MAGIC, off + size)
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    k = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[k]
+
+
+def summarize(values):
+    return {
+        "n": len(values),
+        "p50": _round(percentile(values, 50)),
+        "p95": _round(percentile(values, 95)),
+        "p99": _round(percentile(values, 99)),
+        "max": _round(max(values) if values else None),
+    }
+
+
+def _round(v):
+    return None if v is None else round(v, 2)
@@ -0,0 +1,257 @@
+"""Capacity test for the media-stream bridge with no network and no API spend.
+
+    python -m loadtest.run --steps 10,50,100,200 --duration 20
+
+Starts the fake realtime server in this process, launches the app under test
+(app5 by default) as a uvicorn subprocess pointed at it, and ramps concurrent fake
+Twilio calls. For each step it reports per-call and aggregate forwarding latency
+(Twilio frame -> upstream append, upstream delta -> Twilio media for audio that
+starts playback), how much audio sat in the simulated Twilio play buffer, the
+app's CPU per call, and the largest step whose p95 stays under --slo-ms.
+
+A final step plays one --long-turn-ms response per call, produced at
+--long-turn-factor x real time: more audio than the bridge's queue holds in
+items. It fails if the bridge dropped downstream audio for room (the app's
+/metrics counter is read around every step).
+
+Then an FAQ step: every caller turn asks --faq-transcript, delivered after the reply
+has started (response.output_item.added), so once the first answer is cached the
+bridge cancels live responses it already heard about. It fails if any audio of a
+cancelled response reached Twilio, or if nothing was answered from the cache.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import asyncio
+import subprocess
+
+import httpx
+
+from loadtest.probes import summarize
+from loadtest.fake_realtime import FakeRealtimeServer
+from loadtest.fake_twilio import run_calls
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CLK_TCK = os.sysconf("SC_CLK_TCK")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def cpu_seconds(pid):
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / CLK_TCK     # utime + stime
+
+
+async def wait_ready(base_url, proc, timeout=30):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as http:
+        while time.monotonic() < deadline:
+            if proc.poll() is not None:
+                raise RuntimeError(f"app exited with code {proc.returncode}")
+            try:
+                if (await http.get(base_url + "/")).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError("app did not become ready")
+
+
+def start_app(module, port, upstream_url, log_path, extra_env):
+    env = {
+        **os.environ,
+        "OPENAI_API_KEY": "sk-loadtest",
+        "OPENAI_WS_URL": upstream_url,
+        "TWILIO_SID": "ACloadtest",
+        "TWILIO_AUTH": "loadtest",
+        # Cached greetings would replay the synthesizing session's probes as downstream audio
+        "GREETING_CACHE": "0",
+        **extra_env,
+    }
+    log = open(log_path, "w") if log_path else subprocess.DEVNULL
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", f"{module}:app", "--host", "127.0.0.1",
+         "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT,
+    )
+
+
+async def overflow_drops(base_url):
+    """Downstream messages the bridge dropped because its queue was full, or None."""
+    try:
+        async with httpx.AsyncClient() as http:
+            text = (await http.get(base_url + "/metrics")).text
+    except httpx.HTTPError:
+        return None
+    for line in text.splitlines():
+        if line.startswith('voice_bridge_dropped_total{direction="downstream",reason="overflow"}'):
+            return float(line.rsplit(" ", 1)[1])
+    return 0.0
+
+
+async def run_step(base_url, server, proc, calls, duration, hit_webhook):
+    server.reset_stats()
+    drops_before = await overflow_drops(base_url)
+    cpu_before = cpu_seconds(proc.pid)
+    wall_before = time.monotonic()
+    fakes = await run_calls(base_url, calls, duration, hit_webhook)
+    wall = time.monotonic() - wall_before
+    cpu = cpu_seconds(proc.pid) - cpu_before
+    drops_after = await overflow_drops(base_url)
+
+    per_call = []
+    up_all, down_all, buffered_all = [], [], []
+    cancelled_heard = 0
+    for call in fakes:
+        cancelled_heard += sum(n for r, n in call.responses_heard.items() if r in server.cancelled)
+        res = call.result()
+        up = server.upstream_latency.get(call.call_idx, [])
+        res["upstream_ms"] = summarize(up)
+        up_all += up
+        down_all += call.downstream_latency
+        buffered_all += call.buffered_ms
+        per_call.append(res)
+
+    return {
+        "calls": calls,
+        "failed_calls": sum(1 for r in per_call if r["error"] or not r["frames_received"]),
+        "upstream_ms": summarize(up_all),
+        "downstream_ms": summarize(down_all),
+        "twilio_buffered_ms": summarize(buffered_all),
+        "downstream_overflow_drops": None if drops_before is None else int(drops_after - drops_before),
+        "responses_cancelled": len(server.cancelled),
+        "cancelled_frames_heard": cancelled_heard,    # audio of responses the bridge cancelled
+        "append_messages_per_call_s": round(server.append_messages / calls / duration, 1),
+        "cpu_core_pct_per_call": round(100 * cpu / wall / calls, 3),
+        "app_cpu_core_pct": round(100 * cpu / wall, 1),
+        "per_call": per_call,
+    }
+
+
+def degraded(step, slo_ms):
+    p95s = [step["upstream_ms"]["p95"], step["downstream_ms"]["p95"]]
+    return (step["failed_calls"] > 0 or bool(step["downstream_overflow_drops"])
+            or any(p is None or p > slo_ms for p in p95s))
+
+
+async def main(args):
+    server = await FakeRealtimeServer(
+        turn_audio_ms=args.turn_audio_ms, realtime_factor=args.realtime_factor,
+        barge_in_rate=args.barge_in_rate,
+    ).start()
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    extra_env = dict(kv.split("=", 1) for kv in args.env)
+    proc = start_app(args.app, port, server.url, args.app_log, extra_env)
+    results, long_turn, faq = [], None, None
+    try:
+        await wait_ready(base_url, proc)
+        for calls in args.steps:
+            step = await run_step(base_url, server, proc, calls, args.duration, not args.no_webhook)
+            step["degraded"] = degraded(step, args.slo_ms)
+            results.append(step)
+            print_step(step)
+            if step["degraded"] and args.stop_on_degrade:
+                break
+            await asyncio.sleep(args.cooldown)
+        if args.long_turn_ms:
+            # One uninterrupted response longer than the bridge's queue holds in items
+            server.turn_audio_ms, server.barge_in_rate = args.long_turn_ms, 0
+            server.realtime_factor = args.long_turn_factor
+            calls = args.steps[0]
+            step = await run_step(base_url, server, proc, calls, args.long_turn_ms / 1000 + 3, not args.no_webhook)
+            step["long_turn_ms"] = args.long_turn_ms
+            step["degraded"] = degraded(step, args.slo_ms)
+            print_step(step, f" ({args.long_turn_ms / 1000:g} s turn)")
+            long_turn = step     # reported apart: a drop here is a defect, not a capacity limit
+        if args.faq_transcript:
+            # Cached FAQ answers replacing live responses whose items were already announced
+            server.turn_audio_ms, server.realtime_factor, server.barge_in_rate = (
+                args.turn_audio_ms, args.realtime_factor, 0)
+            server.caller_transcript, server.transcript_late = args.faq_transcript, True
+            step = await run_step(base_url, server, proc, args.steps[0], args.faq_duration, not args.no_webhook)
+            # Not held to the latency SLO: replayed clips carry the probes of the call they were cached from
+            step["degraded"] = (step["failed_calls"] > 0 or bool(step["downstream_overflow_drops"])
+                                or step["cancelled_frames_heard"] > 0 or not step["responses_cancelled"])
+            print_step(step, " (FAQ)", f" | cancelled {step['responses_cancelled']} | "
+                                       f"cancelled audio heard {step['cancelled_frames_heard']} frames")
+            faq = step
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+        await server.stop()
+
+    healthy = [r["calls"] for r in results if not r["degraded"]]
+    summary = {
+        "app": args.app,
+        "slo_ms": args.slo_ms,
+        "max_concurrent_calls_within_slo": max(healthy) if healthy else 0,
+        "steps": results if args.per_call else [{k: v for k, v in r.items() if k != "per_call"} for r in results],
+    }
+    if long_turn is not None:
+        summary["long_turn"] = long_turn if args.per_call else {k: v for k, v in long_turn.items() if k != "per_call"}
+    if faq is not None:
+        summary["faq"] = faq if args.per_call else {k: v for k, v in faq.items() if k != "per_call"}
+    print(f"max concurrent calls within p95 <= {args.slo_ms} ms: {summary['max_concurrent_calls_within_slo']}")
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(summary, f, indent=2)
+
+
+def print_step(step, label="", extra=""):
+    print(f"{step['calls']:>5} calls{label} | up p50/p95/p99 {fmt(step['upstream_ms'])} | "
+          f"down p50/p95/p99 {fmt(step['downstream_ms'])} | "
+          f"buffered p95/max {fmt_buffered(step['twilio_buffered_ms'])} | "
+          f"cpu/call {step['cpu_core_pct_per_call']}% | failed {step['failed_calls']} | "
+          f"dropped {step['downstream_overflow_drops']}" + extra
+          + ("  << degraded" if step["degraded"] else ""))
+
+
+def fmt(s):
+    return f"{s['p50']}/{s['p95']}/{s['p99']} ms"
+
+
+def fmt_buffered(s):
+    return f"{s['p95']}/{s['max']} ms"
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--app", default="app5", help="module exposing the FastAPI `app`")
+    p.add_argument("--steps", type=lambda s: [int(x) for x in s.split(",")], default=[10, 25, 50, 100, 200])
+    p.add_argument("--duration", type=float, default=20, help="seconds of audio per call")
+    p.add_argument("--slo-ms", type=float, default=100,
+                   help="p95 forwarding latency budget (upstream includes INBOUND_BATCH_MS batching)")
+    p.add_argument("--turn-audio-ms", type=int, default=3000)
+    p.add_argument("--long-turn-ms", type=int, default=25000,
+                   help="audio of the final long-response step; 0 skips it")
+    p.add_argument("--long-turn-factor", type=float, default=10.0,
+                   help="x real time the long response is produced at (the live model is this fast)")
+    p.add_argument("--faq-transcript", default="What are your hours?",
+                   help="caller question of the final FAQ step; empty skips it")
+    p.add_argument("--faq-duration", type=float, default=12, help="seconds of audio per call in the FAQ step")
+    p.add_argument("--realtime-factor", type=float, default=4.0)
+    p.add_argument("--barge-in-rate", type=float, default=0.2)
+    p.add_argument("--cooldown", type=float, default=2)
+    p.add_argument("--no-webhook", action="store_true", help="skip POST /incoming-call")
+    p.add_argument("--stop-on-degrade", action="store_true")
+    p.add_argument("--per-call", action="store_true", help="include per-call stats in --out")
+    p.add_argument("--env", action="append", default=[], help="KEY=VALUE passed to the app")
+    p.add_argument("--app-log", help="write the app's stdout here instead of discarding it")
+    p.add_argument("--out", help="write the JSON report here")
+    return p.parse_args(argv)
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
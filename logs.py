@@ -0,0 +1,171 @@
+import os
+import sys
+import json
+import queue
+import atexit
+import logging
+import contextvars
+from logging.handlers import QueueHandler, QueueListener
+
+# Per-call fields (callSid, streamSid, caller) attached to every record logged from
+# the call's tasks. Bind them before the bridge tasks are created so they inherit it.
+_call_fields = contextvars.ContextVar("call_fields", default={})
+
+_listener = None
+_sampler = None
+
+# Libraries that log every frame / request at DEBUG; LOG_LEVEL only applies to our code.
+_LIBRARY_LOGGERS = ("websockets", "httpx", "httpcore", "twilio", "urllib3", "asyncio")
+
+
+def bind_call(**fields):
+    _call_fields.set({**_call_fields.get(), **{k: v for k, v in fields.items() if v is not None}})
+
+
+def get_logger(name):
+    return logging.getLogger(name)
+
+
+class EventSampler(logging.Filter):
+    """Keeps 1 in N records per `event` type; rate 1 keeps all, 0 drops all.
+
+    Counting instead of random() keeps the decision to an int increment on the hot path.
+    """
+
+    def __init__(self, rates=None):
+        super().__init__()
+        self.rates = {}
+        self._every = {}
+        self._seen = {}
+        for event, rate in (rates or {}).items():
+            self.set_rate(event, rate)
+
+    def set_rate(self, event, rate):
+        rate = min(max(float(rate), 0.0), 1.0)
+        self.rates[event] = rate
+        self._every[event] = 0 if rate == 0 else round(1 / rate)
+
+    def keep(self, event):
+        every = self._every.get(event)
+        if every is None or every == 1:
+            return True
+        if every == 0:
+            return False
+        n = self._seen.get(event, 0) + 1
+        self._seen[event] = n
+        return n % every == 1
+
+    def filter(self, record):
+        event = getattr(record, "event", None)
+        if event is None or getattr(record, "_sampled", False):
+            return True
+        return self.keep(event)
+
+
+class _CallContext(logging.Filter):
+    def filter(self, record):
+        for k, v in _call_fields.get().items():
+            setattr(record, k, v)
+        return True
+
+
+class _NonBlockingQueueHandler(QueueHandler):
+    """Hands records to the writer thread; drops (and counts) instead of blocking when full."""
+
+    dropped = 0
+
+    def prepare(self, record):
+        # Skip QueueHandler's eager self.format(): the writer thread does the JSON work.
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _NonBlockingQueueHandler.dropped += 1
+
+
+_STANDARD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        out = {
+            "ts": round(record.created, 3),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for k, v in vars(record).items():
+            if k not in _STANDARD_ATTRS and not k.startswith("_"):
+                out[k] = v
+        if record.exc_text:
+            out["exc"] = record.exc_text
+        return json.dumps(out, ensure_ascii=False, default=str)
+
+
+def setup_logging(level=None, sample_rates=None, queue_size=None):
+    """Route the root logger through a background JSON-lines writer. Safe to call twice."""
+    global _listener, _sampler
+    if _listener is not None:
+        return
+    level = level or os.getenv("LOG_LEVEL", "INFO")
+    if sample_rates is None:
+        sample_rates = parse_rates(os.getenv("LOG_SAMPLE_RATES", "response.audio.delta=0.01"))
+    queue_size = queue_size or int(os.getenv("LOG_QUEUE_SIZE", 10000))
+
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(JsonFormatter())
+    q = queue.Queue(maxsize=queue_size)
+    handler = _NonBlockingQueueHandler(q)
+    _sampler = EventSampler(sample_rates)
+    handler.addFilter(_sampler)
+    handler.addFilter(_CallContext())
+
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(level.upper())
+    for name in _LIBRARY_LOGGERS:
+        logging.getLogger(name).setLevel(os.getenv("LOG_LIBRARY_LEVEL", "WARNING").upper())
+    _listener = QueueListener(q, stream, respect_handler_level=False)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+
+def parse_rates(spec):
+    rates = {}
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        event, _, rate = part.partition("=")
+        rates[event.strip()] = float(rate)
+    return rates
+
+
+def log_event(logger, event, msg, level=logging.DEBUG, **fields):
+    """Per-event debug log that is sampled before a LogRecord is even built."""
+    if not logger.isEnabledFor(level) or (_sampler is not None and not _sampler.keep(event)):
+        return
+    logger.log(level, msg, extra={"event": event, "_sampled": True, **fields})
+
+
+def configure(level=None, sample_rates=None):
+    """Runtime switch for the debug noise, e.g. from an admin endpoint."""
+    if level:
+        logging.getLogger().setLevel(level.upper())
+    if sample_rates and _sampler is not None:
+        for event, rate in sample_rates.items():
+            _sampler.set_rate(event, rate)
+    return snapshot()
+
+
+def snapshot():
+    return {
+        "level": logging.getLevelName(logging.getLogger().level),
+        "sample_rates": dict(_sampler.rates) if _sampler else {},
+        "dropped": _NonBlockingQueueHandler.dropped,
+        "queued": _listener.queue.qsize() if _listener else 0,
+    }
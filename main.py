@@ -0,0 +1,26 @@
+"""Entry point for scale-to-zero hosting (Render etc.): `python main.py`.
+
+Serves app5's app. Twilio, httpx's CA bundle and numpy are imported lazily (see
+app5.warm_up), so the port opens after importing FastAPI and the bridge modules
+only; the upstream handshake and the session pool warm up in the lifespan hook
+while the first webhook is already being served. GET /ready returns 503 until then.
+"""
+import os
+import time
+
+_import_started = time.perf_counter()
+
+from app5 import app, startup  # noqa: E402
+
+startup["import_s"] = round(time.perf_counter() - _import_started, 3)
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(
+        app,
+        host="0.0.0.0",
+        port=int(os.getenv("PORT", 5000)),
+        access_log=False,           # app5 logs the webhooks it handles
+    )
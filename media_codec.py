@@ -0,0 +1,86 @@
+import json
+import base64
+
+# Fast paths for the hottest message shapes on the bridge. Twilio and OpenAI both send
+# compact JSON with the event type first, and base64 payloads never contain quotes or
+# backslashes, so the payload can be sliced out of the text without a full parse.
+# Anything that does not match the expected shape returns None and the caller falls
+# back to json.loads.
+
+_TWILIO_MEDIA = '{"event":"media"'
+_PAYLOAD = '"payload":"'
+_TIMESTAMP = '"timestamp":"'
+
+_AUDIO_DELTA = '{"type":"response.audio.delta"'
+_ITEM_ID = '"item_id":"'
+_DELTA = '"delta":"'
+
+_APPEND_PREFIX = '{"type":"input_audio_buffer.append","audio":"'
+
+
+def parse_twilio_media(message):
+    """(timestamp_ms, payload) for an inbound Twilio media frame, else None."""
+    if not message.startswith(_TWILIO_MEDIA):
+        return None
+    start = message.find(_PAYLOAD)
+    if start < 0:
+        return None
+    start += len(_PAYLOAD)
+    end = message.find('"', start)
+    ts_start = message.find(_TIMESTAMP)
+    if end < 0 or ts_start < 0:
+        return None
+    ts_start += len(_TIMESTAMP)
+    ts_end = message.find('"', ts_start)
+    payload = message[start:end]
+    timestamp = message[ts_start:ts_end]
+    if "\\" in payload or not timestamp.isdigit():
+        return None
+    return int(timestamp), payload
+
+
+def parse_audio_delta(raw):
+    """(item_id, delta) for an upstream response.audio.delta event, else None."""
+    if not raw.startswith(_AUDIO_DELTA):
+        return None
+    start = raw.find(_DELTA)
+    if start < 0:
+        return None
+    start += len(_DELTA)
+    end = raw.find('"', start)
+    if end < 0:
+        return None
+    delta = raw[start:end]
+    if "\\" in delta:
+        return None
+    item_id = None
+    id_start = raw.find(_ITEM_ID)
+    if id_start >= 0:
+        id_start += len(_ITEM_ID)
+        item_id = raw[id_start:raw.find('"', id_start)]
+    return item_id, delta
+
+
+def encode_append(audio_b64):
+    return _APPEND_PREFIX + audio_b64 + '"}'
+
+
+def encode_append_audio(audio):
+    """input_audio_buffer.append for raw audio bytes in the session's input format."""
+    return encode_append(base64.b64encode(audio).decode("ascii"))
+
+
+class TwilioFrameEncoder:
+    """Pre-rendered outbound Twilio frames for one stream; same bytes as send_json would produce."""
+
+    def __init__(self, stream_sid):
+        sid = json.dumps(stream_sid)
+        self._media = '{"event":"media","streamSid":' + sid + ',"media":{"payload":"'
+        self._mark = '{"event":"mark","streamSid":' + sid + ',"mark":{"name":'
+        self.clear = '{"event":"clear","streamSid":' + sid + '}'
+
+    def media(self, payload):
+        return self._media + payload + '"}}'
+
+    def mark(self, name):
+        return self._mark + json.dumps(name) + '}}'
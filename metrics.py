@@ -0,0 +1,184 @@
+from bisect import bisect_left
+
+# Minimal Prometheus text-format metrics. Everything is updated from the event loop
+# thread, so plain int/float attributes need no locks; observe() is one bisect over
+# a preallocated bucket tuple plus three increments, cheap enough for every frame.
+
+_REGISTRY = []
+
+
+class _Value:
+    __slots__ = ("value", "fn")
+
+    def __init__(self):
+        self.value = 0
+        self.fn = None          # optional callback read at scrape time
+
+    def inc(self, n=1):
+        self.value += n
+
+    def dec(self, n=1):
+        self.value -= n
+
+    def set(self, value):
+        self.value = value
+
+    def set_function(self, fn):
+        self.fn = fn
+
+    def get(self):
+        return self.fn() if self.fn else self.value
+
+
+class _Scalar:
+    type = None
+
+    def __init__(self, name, help, fn=None, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._value = _Value()
+        self._value.fn = fn
+        self._children = {}     # label values tuple -> _Value
+        _REGISTRY.append(self)
+
+    @property
+    def value(self):
+        return self._value.value
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = _Value()
+        return child
+
+    def inc(self, n=1):
+        self._value.inc(n)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        if not self.labelnames:
+            lines.append(f"{self.name} {self._value.get()}")
+        for values, child in self._children.items():
+            labels = ",".join(f'{k}="{v}"' for k, v in zip(self.labelnames, values))
+            lines.append(f"{self.name}{{{labels}}} {child.get()}")
+        return lines
+
+
+class Counter(_Scalar):
+    type = "counter"
+
+
+class Gauge(_Scalar):
+    type = "gauge"
+
+    def set(self, value):
+        self._value.set(value)
+
+    def dec(self, n=1):
+        self._value.dec(n)
+
+    def set_function(self, fn):
+        self._value.set_function(fn)
+
+
+class Histogram:
+    def __init__(self, name, help, buckets):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)     # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+        _REGISTRY.append(self)
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        cumulative = 0
+        for bound, n in zip(self.buckets, self.counts):
+            cumulative += n
+            lines.append(f'{self.name}_bucket{{le="{bound:g}"}} {cumulative}')
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {self.count}')
+        lines.append(f"{self.name}_sum {self.sum}")
+        lines.append(f"{self.name}_count {self.count}")
+        return lines
+
+
+def render():
+    lines = []
+    for metric in _REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+TURN_LATENCY = Histogram(
+    "voice_turn_latency_seconds",
+    "Caller speech_stopped to first assistant audio delta.",
+    (0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.8, 1.0, 1.25, 1.5, 2.0, 3.0, 5.0),
+)
+TWILIO_TO_UPSTREAM_LAG = Histogram(
+    "voice_twilio_to_upstream_lag_seconds",
+    "Twilio media frame received to input_audio_buffer.append sent (includes batching).",
+    (0.001, 0.0025, 0.005, 0.01, 0.02, 0.04, 0.06, 0.08, 0.1, 0.15, 0.25, 0.5),
+)
+UPSTREAM_CONNECT = Histogram(
+    "voice_upstream_connect_seconds",
+    "Time to open the realtime WebSocket.",
+    (0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0),
+)
+SESSION_INIT = Histogram(
+    "voice_session_init_seconds",
+    "session.update sent to session.updated received.",
+    (0.025, 0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 2.0, 5.0),
+)
+FIRST_AUDIO = Histogram(
+    "voice_first_audio_seconds",
+    "Twilio start event to the first assistant audio sent to Twilio.",
+    (0.01, 0.025, 0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0),
+)
+FAQ_LOOKUPS = Counter(
+    "voice_faq_lookups_total",
+    "FAQ answer cache lookups by result; late = cached, but the live answer was already playing.",
+    labelnames=("result",),
+)
+RECORDER_DROPPED = Counter(
+    "voice_recorder_dropped_total", "Recording chunks dropped because the writer fell behind.", labelnames=("track",))
+CAMPAIGN_CALLS = Counter(
+    "voice_campaign_calls_total", "Outbound campaign calls by final status.", labelnames=("outcome",))
+CAMPAIGN_ACTIVE = Gauge("voice_campaign_active_calls", "Campaign calls dialing, ringing or in progress.")
+CAPACITY_REJECTED = Counter(
+    "voice_capacity_rejected_total", "Incoming calls sent to the overflow TwiML, by limiting factor.",
+    labelnames=("reason",))
+CAPACITY_HEADROOM = Gauge("voice_capacity_headroom_calls", "Further calls that fit under upstream limits (+Inf if unlimited).")
+HOLD_QUEUE_WAIT = Histogram(
+    "voice_hold_queue_wait_seconds",
+    "Time callers spent on hold before being connected to the assistant.",
+    (1, 2, 5, 10, 20, 30, 45, 60, 90, 120, 180, 300, 600),
+)
+HOLD_QUEUE_RESULTS = Counter(
+    "voice_hold_queue_results_total", "Callers leaving the hold queue, by how they left.", labelnames=("outcome",))
+HOLD_QUEUE_LENGTH = Gauge("voice_hold_queue_length", "Callers currently on hold.")
+TWILIO_BUFFERED = Histogram(
+    "voice_twilio_buffered_seconds",
+    "Assistant audio sent to Twilio and not yet played, sampled at every paced send.",
+    (0.02, 0.05, 0.1, 0.15, 0.2, 0.3, 0.4, 0.5, 0.75, 1.0, 2.0, 5.0),
+)
+TWILIO_BUFFERED_MS = Gauge("voice_twilio_buffered_ms", "Most assistant audio buffered at Twilio for any live call, ms.")
+ACTIVE_CALLS = Gauge("voice_active_calls", "Media streams currently bridged.")
+MARK_BACKLOG = Gauge("voice_mark_backlog", "Marks sent to Twilio and not yet acknowledged, all calls.")
+SIDE_EFFECTS_OUTSTANDING = Gauge("voice_side_effects_outstanding", "Side-effect tasks in flight.")
+BRIDGE_QUEUE_DEPTH = Gauge(
+    "voice_bridge_queue_depth", "Messages waiting in bridge send queues, all calls.", labelnames=("direction",))
+BRIDGE_DROPPED = Counter(
+    "voice_bridge_dropped_total", "Messages dropped from bridge send queues.", labelnames=("direction", "reason"))
+BRIDGE_MERGED = Counter(
+    "voice_bridge_merged_total", "Audio chunks merged into an already queued append.", labelnames=("direction",))
+BRIDGE_STALLED = Counter(
+    "voice_bridge_stalled_total", "Peers disconnected for not draining their queue.", labelnames=("direction",))
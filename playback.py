@@ -0,0 +1,131 @@
+import time
+import asyncio
+from collections import deque
+
+ULAW_BYTES_PER_MS = 8
+
+
+def ulaw_b64_ms(payload):
+    """Duration of a base64 mu-law payload without decoding it."""
+    size = len(payload) * 3 // 4 - payload.count("=", -2)
+    return size / ULAW_BYTES_PER_MS
+
+
+class PlaybackTracker:
+    """Tracks how much assistant audio Twilio has actually played for one call.
+
+    Every `mark_every_ms` of outbound audio (and at the end of each response) a mark
+    named "<seq>:<cumulative ms sent>" is due; Twilio echoes a mark back once the audio
+    before it has played, so acknowledged marks pin the played position exactly and the
+    time since the last ack interpolates between them.
+    """
+
+    def __init__(self, mark_every_ms=250, clock=time.monotonic):
+        self.mark_every_ms = mark_every_ms
+        self.clock = clock
+        self.sent_ms = 0.0
+        self.acked_ms = 0.0
+        self._acked_at = clock()
+        self._pending = deque()         # (name, cumulative ms sent)
+        self._last_mark_ms = 0.0
+        self._seq = 0
+        self.item_id = None
+        self._item_start_ms = 0.0
+        self.marks_sent = 0
+        self._waiters = []              # (ms, future) resolved once playback reaches ms
+
+    @property
+    def backlog(self):
+        return len(self._pending)
+
+    @property
+    def buffered_ms(self):
+        return self.sent_ms - self.played_ms()
+
+    @property
+    def is_playing(self):
+        return self.buffered_ms > 0
+
+    def on_audio(self, item_id, payload):
+        """Account for an outbound chunk; returns a mark name when one is due, else None."""
+        now = self.clock()
+        if self.played_ms(now) >= self.sent_ms:
+            # Twilio's buffer was empty, so playback of this chunk starts now
+            self.acked_ms = self.sent_ms
+            self._acked_at = now
+            self._wake(self.acked_ms)
+        if item_id and item_id != self.item_id:
+            self.item_id = item_id
+            self._item_start_ms = self.sent_ms
+        self.sent_ms += ulaw_b64_ms(payload)
+        if self.sent_ms - self._last_mark_ms >= self.mark_every_ms:
+            return self._next_mark()
+        return None
+
+    def end_of_response(self):
+        """Mark for the tail of a response so playback-complete is observable; None if already marked."""
+        if self.sent_ms > self._last_mark_ms:
+            return self._next_mark()
+        return None
+
+    def on_mark(self, name):
+        """Twilio played up to `name`. Unknown names (e.g. cleared marks) are ignored."""
+        if not any(n == name for n, _ in self._pending):
+            return
+        while self._pending:
+            pending_name, ms = self._pending.popleft()
+            if pending_name == name:
+                self.acked_ms = ms
+                self._acked_at = self.clock()
+                self._wake(ms)
+                return
+
+    def played_ms(self, now=None):
+        if self.acked_ms >= self.sent_ms:
+            return self.sent_ms
+        now = self.clock() if now is None else now
+        return min(self.sent_ms, self.acked_ms + (now - self._acked_at) * 1000)
+
+    def item_played_ms(self):
+        """audio_end_ms for conversation.item.truncate of the current assistant item."""
+        return int(max(0.0, self.played_ms() - self._item_start_ms))
+
+    def on_clear(self):
+        """Twilio dropped everything still buffered; playback stops where it is now."""
+        position = self.played_ms()
+        self._pending.clear()
+        self.sent_ms = self.acked_ms = self._last_mark_ms = position
+        self._acked_at = self.clock()
+        self._wake(float("inf"))
+        return position
+
+    async def wait_drained(self, timeout):
+        """Wait until Twilio has played everything sent so far (the last mark is acked).
+
+        Needs a mark at the current position, see end_of_response(). Returns False on timeout.
+        """
+        target = self.sent_ms
+        if self.acked_ms >= target:
+            return True
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.append((target, fut))
+        try:
+            await asyncio.wait_for(fut, timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self._waiters = [(ms, f) for ms, f in self._waiters if f is not fut]
+
+    def _wake(self, position):
+        for ms, fut in self._waiters:
+            if ms <= position and not fut.done():
+                fut.set_result(None)
+
+    def _next_mark(self):
+        self._seq += 1
+        name = f"{self._seq}:{int(self.sent_ms)}"
+        self._pending.append((name, self.sent_ms))
+        self._last_mark_ms = self.sent_ms
+        self.marks_sent += 1
+        return name
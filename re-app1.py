@@ -1,10 +1,15 @@
 import os
+import asyncio
 from fastapi import FastAPI, Request
 from fastapi.responses import Response
-from twilio.twiml.voice_response import VoiceResponse
 from twilio.rest import Client
 from dotenv import load_dotenv
 
+from call_state import open_call_state
+from tenants import Tenant, TenantRegistry
+from campaigns import LeadStore
+from twiml import FORWARD_RECORDED, read_form
+
 load_dotenv()
 
 app = FastAPI()
@@ -17,39 +22,82 @@ TWILIO_AUTH = os.getenv("TWILIO_AUTH")
 
 twilio_client = Client(TWILIO_SID, TWILIO_AUTH)
 
-# Temp in-memory store for CallSid → From number
-callers = {}
+# Dialed number -> business; numbers not in TENANTS_FILE forward to BUSINESS_PHONE
+tenants = TenantRegistry(os.getenv("TENANTS_FILE"), Tenant(TWILIO_NUMBER, forward_number=BUSINESS_PHONE))
+
+# CallSid → caller record, shared by all workers (see CALL_STATE_URL in call_state.py)
+call_state = open_call_state()
+CALL_STATE_TIMEOUT_S = float(os.getenv("CALL_STATE_TIMEOUT_S", 2))
+
+# Missed / short calls also become leads that app5's campaign dialer calls back
+CALLBACKS = os.getenv("CALLBACKS", "0") == "1"
+CAMPAIGN_DB = os.getenv("CAMPAIGN_DB", os.path.join(os.path.dirname(__file__), "campaigns.db"))
+campaign_leads = LeadStore(CAMPAIGN_DB) if CALLBACKS else None
+
+@app.on_event("shutdown")
+async def close_call_state():
+    await call_state.close()
+    if campaign_leads is not None:
+        await campaign_leads.close()
+
+# Best effort: a slow or down store must not fail the webhook Twilio is waiting on
+async def load_call(call_sid):
+    try:
+        async with asyncio.timeout(CALL_STATE_TIMEOUT_S):
+            return await call_state.get(call_sid) or {}
+    except Exception as e:
+        print("❌ Could not read call state:", repr(e))
+        return {}
+
+async def save_call(call_sid, **fields):
+    try:
+        async with asyncio.timeout(CALL_STATE_TIMEOUT_S):
+            await call_state.update(call_sid, **fields)
+    except Exception as e:
+        print("❌ Could not record call state:", repr(e))
+
+async def queue_callback(tenant, from_number):
+    if campaign_leads is None or not from_number:
+        return
+    try:
+        if await campaign_leads.add_callback(tenant.number, from_number):
+            print(f"📞 Queued call-back to {from_number}")
+    except Exception as e:
+        print("❌ Failed to queue call-back:", e)
 
 @app.post("/forward-call")
 async def forward_call(request: Request):
-    form = await request.form()
+    form = await read_form(request)
     from_number = form.get("From")
     call_sid = form.get("CallSid")
-    print(f"📞 Incoming call from {from_number}, SID: {call_sid}")
+    tenant = tenants.get(form.get("To"))
+    print(f"📞 Incoming call from {from_number} for {tenant.name}, SID: {call_sid}")
 
-    # Store caller by CallSid
+    # Store caller by CallSid; the recording callback does not say which number was dialed
     if call_sid and from_number:
-        callers[call_sid] = from_number
+        await save_call(call_sid, caller=from_number, to=form.get("To"))
 
-    response = VoiceResponse()
-    dial = response.dial(
+    content = FORWARD_RECORDED.render(
         timeout=15,
         action="/missed-call",
-        caller_id=TWILIO_NUMBER,
-        record="record-from-answer",
-        recording_status_callback="/check-recording",
-        recording_status_callback_event="completed"
+        caller_id=tenant.number,
+        recording_callback="/check-recording",
+        number=tenant.forward_number,
     )
-    dial.number(BUSINESS_PHONE)
-
-    return Response(content=str(response), media_type="application/xml")
+    return Response(content=content, media_type="application/xml")
 
 
 @app.post("/missed-call")
 async def missed_call(request: Request):
-    form = await request.form()
-    from_number = form.get("From")
+    form = await read_form(request)
+    call_sid = form.get("CallSid")
     status = form.get("DialCallStatus") or form.get("CallStatus")
+    from_number = form.get("From")
+    tenant = tenants.get(form.get("To"))
+    if call_sid:
+        await save_call(call_sid, dial_status=status)
+        if not from_number:
+            from_number = (await load_call(call_sid)).get("caller")
     print(f"🏷️  missed_call webhook hit — From={from_number}, DialCallStatus={status!r}")
 
     if status in ("busy", "no-answer", "failed", "canceled"):
@@ -57,11 +105,12 @@ async def missed_call(request: Request):
             print("✅ Missed call condition met, sending SMS…")
             twilio_client.messages.create(
                 body="Hey! Sorry we missed your call. How can we help?",
-                from_=TWILIO_NUMBER,
+                from_=tenant.number,
                 to=from_number
             )
         except Exception as e:
             print("❌ Failed to send SMS:", e)
+        await queue_callback(tenant, from_number)
     else:
         print("📲 Call was answered, no action needed.")
 
@@ -70,10 +119,12 @@ async def missed_call(request: Request):
 
 @app.post("/check-recording")
 async def check_recording(request: Request):
-    form = await request.form()
+    form = await read_form(request)
     call_sid = form.get("CallSid")
     duration = int(form.get("RecordingDuration", "0"))
-    from_number = callers.get(call_sid)
+    record = await load_call(call_sid) if call_sid else {}
+    from_number = record.get("caller")
+    tenant = tenants.get(record.get("to"))
 
     print(f"🎙️ Recording SID: {call_sid}, Duration: {duration}s, Caller: {from_number or 'Unknown'}")
 
@@ -86,10 +137,11 @@ async def check_recording(request: Request):
             print("⚠️ Short call detected — sending follow-up SMS...")
             twilio_client.messages.create(
                 body="Hey! Sorry we missed your call. How can we help?",
-                from_=TWILIO_NUMBER,
+                from_=tenant.number,
                 to=from_number
             )
         except Exception as e:
             print("❌ Failed to send SMS for short call:", e)
+        await queue_callback(tenant, from_number)
 
     return Response(status_code=204)
\ No newline at end of file
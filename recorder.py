@@ -0,0 +1,222 @@
+import os
+import json
+import time
+import base64
+import struct
+import asyncio
+from collections import deque
+
+from logs import get_logger
+from metrics import RECORDER_DROPPED
+
+log = get_logger(__name__)
+
+CALLER, ASSISTANT, TRANSCRIPT = "caller", "assistant", "transcript"
+SAMPLE_RATE = 8000
+ULAW_SILENCE = b"\xff"
+WAVE_FORMAT_MULAW = 7
+
+
+def wav_header(data_bytes=0):
+    """58-byte header of a mono 8 kHz mu-law WAV holding `data_bytes` of audio.
+
+    Non-PCM formats carry an 18-byte fmt chunk and a fact chunk (sample count);
+    at 8 bits per sample both sizes are just the data length.
+    """
+    fmt = struct.pack("<HHIIHHH", WAVE_FORMAT_MULAW, 1, SAMPLE_RATE, SAMPLE_RATE, 1, 8, 0)
+    return (
+        b"RIFF" + struct.pack("<I", 4 + (8 + len(fmt)) + 12 + 8 + data_bytes) + b"WAVE"
+        + b"fmt " + struct.pack("<I", len(fmt)) + fmt
+        + b"fact" + struct.pack("<II", 4, data_bytes)
+        + b"data" + struct.pack("<I", data_bytes)
+    )
+
+
+WAV_HEADER_BYTES = len(wav_header())
+
+
+class CallRecorder:
+    """Per-call recording: caller.wav, assistant.wav and transcript.jsonl under `directory`.
+
+    The call path only appends base64 payloads / transcript events to a deque; a
+    writer task drains it every `flush_interval` (or once `flush_bytes` are waiting),
+    decodes and serializes them, and writes them from a worker thread through large
+    file buffers. Memory is bounded by `max_buffered`: if the disk falls behind that
+    far, new audio is dropped and replaced with the same length of silence, and the
+    call itself never waits on I/O. Silence is never queued: every chunk carries its
+    offset in the track (and the assistant's, any cut since the previous chunk), and
+    the writer cuts back and fills the gap before it.
+
+    Both tracks run on the caller's clock (inbound frames, 20 ms each), so they line
+    up and can be mixed. Assistant audio starts where the caller's track is when it is
+    handed to Twilio, after silence since the previous reply; audio sent ahead of
+    playback follows on back to back, as Twilio plays it. assistant_cleared() cuts
+    the track back to the caller's position, dropping what Twilio threw away on a
+    barge-in `clear`, and close() does the same with audio the call ended before.
+
+    The WAVs are written with zero sizes and fixed up on close(); a recording cut
+    short by a crash is still readable by most tools, which fall back to file size.
+    """
+
+    def __init__(self, directory, max_buffered=1024 * 1024, flush_bytes=64 * 1024,
+                 flush_interval=0.5, buffer_size=256 * 1024):
+        self.directory = directory
+        self.max_buffered = max_buffered
+        self.flush_bytes = flush_bytes
+        self.flush_interval = flush_interval
+        self.buffer_size = buffer_size
+        self.started = time.monotonic()
+        self.closed = False
+        # (kind, data, size): audio as (offset in its track, base64 str, cut to or None),
+        # or a transcript dict
+        self._queue = deque()
+        self._buffered = 0
+        self._position = {CALLER: 0, ASSISTANT: 0}     # track lengths in bytes, counted on the call path
+        self._cut = None        # lowest assistant position cleared back to, not queued yet
+        self._ready = asyncio.Event()
+        self._task = None
+        self._files = {}
+        self._audio_bytes = {CALLER: 0, ASSISTANT: 0}
+        self.stats = {"caller_ms": 0, "assistant_ms": 0, "transcript_lines": 0, "dropped": 0}
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+        return self
+
+    # --- call path: never blocks ------------------------------------------
+
+    def caller_audio(self, payload):
+        self._put_audio(CALLER, payload)
+
+    def assistant_audio(self, payload):
+        # Nothing played since the last reply ended: it starts now, after silence
+        self._position[ASSISTANT] = max(self._position[ASSISTANT], self._position[CALLER])
+        self._put_audio(ASSISTANT, payload)
+
+    def assistant_cleared(self):
+        """Twilio dropped the audio it had not played yet; so does the assistant track.
+
+        The cut travels with the next assistant chunk queued (or reaches close()).
+        """
+        now = self._position[CALLER]
+        if self._position[ASSISTANT] > now:
+            self._position[ASSISTANT] = now
+            self._cut = now if self._cut is None else min(self._cut, now)
+
+    def transcript(self, role, text, **fields):
+        if text:
+            self._put(TRANSCRIPT, {"t_ms": self._now_ms(), "role": role, "text": text, **fields}, len(text) + 64)
+
+    def _put_audio(self, track, payload):
+        if not payload:
+            return
+        at, cut = self._position[track], self._cut if track == ASSISTANT else None
+        self._position[track] += len(payload) * 3 // 4 - payload.endswith("=") - payload.endswith("==")
+        if self._put(track, (at, payload, cut), len(payload)) and cut is not None:
+            self._cut = None
+        # if dropped, the writer fills its place with silence before the next chunk
+
+    def _put(self, kind, data, size):
+        if self.closed:
+            return True
+        if self._buffered + size > self.max_buffered:
+            self.stats["dropped"] += 1
+            RECORDER_DROPPED.labels(kind).inc()
+            return False
+        self._queue.append((kind, data, size))
+        self._buffered += size
+        if self._buffered >= self.flush_bytes:
+            self._ready.set()
+        return True
+
+    def _now_ms(self):
+        return round((time.monotonic() - self.started) * 1000)
+
+    # --- writer ---------------------------------------------------------------
+
+    async def close(self):
+        """Write what is still queued, fix up the WAV headers and close the files."""
+        if self.closed:
+            return
+        self.assistant_cleared()    # the call is over: audio still ahead of the caller's clock never played
+        self.closed = True
+        if self._task:
+            self._ready.set()
+            await asyncio.gather(self._task, return_exceptions=True)
+        try:
+            await asyncio.to_thread(self._finish)
+        except OSError as e:
+            log.warning("❌ could not finalize recording: %r", e, extra={"recording": self.directory})
+        log.info("🎙️ recording saved", extra={"recording": self.directory, **self.stats})
+
+    async def _run(self):
+        try:
+            await asyncio.to_thread(self._open)
+            while True:
+                try:
+                    async with asyncio.timeout(self.flush_interval):
+                        await self._ready.wait()
+                except TimeoutError:
+                    pass
+                self._ready.clear()
+                batch, self._queue = self._queue, deque()
+                if batch:
+                    await asyncio.to_thread(self._write, batch)
+                    self._buffered -= sum(size for _, _, size in batch)
+                if self.closed and not self._queue:
+                    return
+        except OSError as e:
+            # Recording is best effort; the call goes on without it
+            log.error("❌ recording failed: %r", e, extra={"recording": self.directory})
+            self.closed = True
+            self._queue.clear()
+
+    def _open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        for track in (CALLER, ASSISTANT):
+            f = open(os.path.join(self.directory, track + ".wav"), "wb", buffering=self.buffer_size)
+            f.write(wav_header())
+            self._files[track] = f
+        self._files[TRANSCRIPT] = open(os.path.join(self.directory, "transcript.jsonl"), "w",
+                                       encoding="utf-8", buffering=self.buffer_size)
+
+    def _write(self, batch):
+        files = self._files
+        for kind, data, _ in batch:
+            if kind == TRANSCRIPT:
+                files[TRANSCRIPT].write(json.dumps(data) + "\n")
+                self.stats["transcript_lines"] += 1
+            else:
+                at, payload, cut = data
+                audio = base64.b64decode(payload)
+                if cut is not None:
+                    self._end_at(kind, min(cut, self._audio_bytes[kind]))
+                self._end_at(kind, at)
+                files[kind].write(audio)
+                self._audio_bytes[kind] += len(audio)
+
+    def _end_at(self, track, at):
+        """Pad `track` with silence (audio dropped) or cut it back (cleared) to `at` bytes."""
+        f, length = self._files[track], self._audio_bytes[track]
+        if at > length:
+            f.write(ULAW_SILENCE * (at - length))
+        elif at < length:
+            f.seek(WAV_HEADER_BYTES + at)
+            f.truncate()
+        self._audio_bytes[track] = at
+
+    def _finish(self):
+        for track in (CALLER, ASSISTANT):
+            if track not in self._files:
+                continue
+            if track == ASSISTANT and self._cut is not None:
+                self._end_at(track, min(self._cut, self._audio_bytes[track]))
+            self._end_at(track, self._position[track])
+            f = self._files.pop(track)
+            f.seek(0)
+            f.write(wav_header(self._audio_bytes[track]))
+            f.close()
+            self.stats[track + "_ms"] = self._audio_bytes[track] * 1000 // SAMPLE_RATE
+        f = self._files.pop(TRANSCRIPT, None)
+        if f is not None:
+            f.close()
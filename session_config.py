@@ -0,0 +1,113 @@
+import os
+import json
+import asyncio
+import hashlib
+import weakref
+
+from logs import get_logger
+
+log = get_logger(__name__)
+
+
+class SessionConfigCache:
+    """Pre-serialized session.update messages, rebuilt when prompt.txt changes.
+
+    The instructions are most of the message, so each (voice, temperature,
+    turn_detection, transcribe, audio_format) variant is encoded to UTF-8 once per prompt version
+    and sent as-is. watch() polls the file's mtime/size and re-hashes it on change; a new version
+    swaps in as one attribute assignment, so sessions already configured keep the
+    prompt they started with and only new ones pick up the change.
+    """
+
+    def __init__(self, prompt_path, check_interval=2.0, on_change=None):
+        self.prompt_path = prompt_path
+        self.check_interval = check_interval
+        self.on_change = on_change          # (version) -> None, e.g. drop pre-warmed sessions
+        self.version = None                 # first 12 hex chars of sha256(prompt)
+        self.instructions = None
+        self._stat = None
+        self._messages = {}                 # variant -> bytes, for the current version only
+        self._sent = weakref.WeakKeyDictionary()    # websocket -> (version, variant) it was configured with
+        self._task = None
+        self.reload()
+
+    def reload(self):
+        """Re-read the prompt if the file changed; True when the version changed."""
+        st = os.stat(self.prompt_path)
+        stat = (st.st_mtime_ns, st.st_size)
+        if stat == self._stat:
+            return False
+        with open(self.prompt_path, "r", encoding="utf-8") as f:
+            instructions = f.read().strip()
+        self._stat = stat
+        version = hashlib.sha256(instructions.encode()).hexdigest()[:12]
+        if version == self.version:
+            return False        # touched but unchanged
+        previous = self.version
+        self.instructions, self.version, self._messages = instructions, version, {}
+        if previous is not None:
+            log.info("📝 prompt.txt changed", extra={"prompt_version": version, "previous_version": previous})
+            if self.on_change:
+                self.on_change(version)
+        return True
+
+    @staticmethod
+    def variant(voice, temperature=0.8, turn_detection="server_vad", transcribe=None, audio_format="g711_ulaw"):
+        return voice, temperature, turn_detection, transcribe, audio_format
+
+    def message(self, voice, temperature=0.8, turn_detection="server_vad", transcribe=None,
+                audio_format="g711_ulaw"):
+        variant = self.variant(voice, temperature, turn_detection, transcribe, audio_format)
+        data = self._messages.get(variant)
+        if data is None:
+            session = {
+                "turn_detection": {"type": turn_detection},
+                "input_audio_format": audio_format,
+                "output_audio_format": audio_format,
+                "voice": voice,
+                "instructions": self.instructions,
+                "modalities": ["text", "audio"],
+                "temperature": temperature,
+            }
+            if transcribe:
+                session["input_audio_transcription"] = {"model": transcribe}
+            data = self._messages[variant] = json.dumps({"type": "session.update", "session": session}).encode()
+        return data
+
+    async def send(self, ws, voice, **settings):
+        version = self.version
+        await ws.send(self.message(voice, **settings), text=True)
+        self._sent[ws] = (version, self.variant(voice, **settings))
+
+    def version_of(self, ws):
+        sent = self._sent.get(ws)
+        return sent[0] if sent else None
+
+    def configured(self, ws, voice, **settings):
+        """Whether `ws` got this prompt (any version) with exactly this voice and settings."""
+        sent = self._sent.get(ws)
+        return sent is not None and sent[1] == self.variant(voice, **settings)
+
+    # --- file watcher ----------------------------------------------------
+
+    def start(self):
+        if self.check_interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._watch())
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.check_interval)
+            try:
+                self.reload()
+            except Exception as e:
+                # Mid-save or deleted: keep serving the last good version
+                log.warning("❌ could not reload prompt: %r", e)
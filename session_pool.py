@@ -0,0 +1,193 @@
+import time
+import asyncio
+from collections import deque
+
+from logs import get_logger
+from metrics import SESSION_INIT, UPSTREAM_CONNECT
+
+log = get_logger(__name__)
+
+
+class RealtimeSessionPool:
+    """Keeps a few OpenAI realtime sockets connected and session.update'd ahead of calls."""
+
+    def __init__(self, connect, initialize, size=2, ttl=300.0,
+                 check_interval=10.0, ping_timeout=5.0, confirm=None, on_idle=None):
+        self.connect = connect          # async () -> websocket
+        self.initialize = initialize    # async (websocket) -> None, sends session.update
+        self.confirm = confirm          # async (websocket) -> None, waits for session.updated
+        self.on_idle = on_idle          # () -> None, called when a new session is ready to take
+        self.size = size
+        self.ttl = ttl
+        self.check_interval = check_interval
+        self.ping_timeout = ping_timeout
+
+        self._idle = deque()            # (created_at, websocket)
+        self._dialing = 0
+        self._generation = 0            # bumped by invalidate(); older dials are discarded
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self.stats = {
+            "hits": 0, "misses": 0, "dialed": 0, "dial_failures": 0,
+            "expired": 0, "unhealthy": 0, "invalidated": 0,
+        }
+
+    # --- lifecycle -------------------------------------------------------
+
+    def start(self):
+        if self.size > 0 and self._task is None:
+            self._task = asyncio.create_task(self._maintain())
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        while self._idle:
+            _, ws = self._idle.popleft()
+            await _close_quietly(ws)
+
+    # --- handler API -----------------------------------------------------
+
+    async def take(self):
+        """Return a ready session or None; never dials."""
+        now = time.monotonic()
+        while self._idle:
+            created, ws = self._idle.popleft()
+            if now - created > self.ttl:
+                self.stats["expired"] += 1
+                await _close_quietly(ws)
+                continue
+            if ws.close_code is not None:
+                self.stats["unhealthy"] += 1
+                continue
+            self.stats["hits"] += 1
+            self._wakeup.set()
+            return ws
+        self.stats["misses"] += 1
+        self._wakeup.set()
+        return None
+
+    async def acquire(self, initialize=None):
+        """Take a pooled session, falling back to a fresh connect + initialize.
+
+        `initialize` replaces the pool's own for a freshly dialed session only; pooled
+        sessions are always configured by the pool.
+        """
+        ws = await self.take()
+        if ws is not None:
+            return ws, True
+        ws = await self._timed_connect()
+        await (initialize or self.initialize)(ws)
+        return ws, False
+
+    def invalidate(self):
+        """Drop idle sessions (e.g. configured with an old prompt) and re-dial them."""
+        self._generation += 1
+        while self._idle:
+            _, ws = self._idle.popleft()
+            self.stats["invalidated"] += 1
+            asyncio.create_task(_close_quietly(ws))
+        self._wakeup.set()
+
+    def snapshot(self):
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "idle": len(self._idle),
+            "dialing": self._dialing,
+            "size": self.size,
+            "hit_rate": round(self.stats["hits"] / lookups, 3) if lookups else None,
+        }
+
+    # --- background refill / health checks -------------------------------
+
+    async def _maintain(self):
+        while True:
+            try:
+                await self._evict()
+                await self._refill()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.exception("❌ session pool maintenance failed")
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.check_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _evict(self):
+        now = time.monotonic()
+        keep = deque()
+        while self._idle:
+            created, ws = self._idle.popleft()
+            if now - created > self.ttl:
+                self.stats["expired"] += 1
+                await _close_quietly(ws)
+            elif not await self._healthy(ws):
+                self.stats["unhealthy"] += 1
+                await _close_quietly(ws)
+            else:
+                keep.append((created, ws))
+        # take() may have drained entries while we awaited pings; keep order oldest-first
+        keep.extend(self._idle)
+        self._idle = keep
+
+    async def _healthy(self, ws):
+        if ws.close_code is not None:
+            return False
+        try:
+            pong = await ws.ping()
+            await asyncio.wait_for(pong, timeout=self.ping_timeout)
+            return True
+        except Exception:
+            return False
+
+    async def _refill(self):
+        missing = self.size - len(self._idle) - self._dialing
+        if missing > 0:
+            await asyncio.gather(*(self._dial_one() for _ in range(missing)))
+
+    async def _dial_one(self):
+        self._dialing += 1
+        generation = self._generation
+        try:
+            ws = await self._timed_connect()
+            started = time.perf_counter()
+            await self.initialize(ws)
+            if self.confirm:
+                # Off the call path, so it is fine to wait until the session is really configured
+                await self.confirm(ws)
+                SESSION_INIT.observe(time.perf_counter() - started)
+        except Exception as e:
+            self.stats["dial_failures"] += 1
+            log.error("❌ session pool failed to pre-connect: %r", e)
+            return
+        finally:
+            self._dialing -= 1
+        if generation != self._generation:
+            self.stats["invalidated"] += 1
+            await _close_quietly(ws)
+            self._wakeup.set()
+            return
+        self.stats["dialed"] += 1
+        self._idle.append((time.monotonic(), ws))
+        if self.on_idle:
+            self.on_idle()
+
+    async def _timed_connect(self):
+        started = time.perf_counter()
+        ws = await self.connect()
+        UPSTREAM_CONNECT.observe(time.perf_counter() - started)
+        return ws
+
+
+async def _close_quietly(ws):
+    try:
+        await ws.close()
+    except Exception:
+        pass
@@ -0,0 +1,145 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from logs import get_logger
+
+log = get_logger(__name__)
+
+
+def pooled_twilio_http_client(timeout=10.0):
+    """Twilio HTTP client backed by one keep-alive requests.Session, shared by every call."""
+    from twilio.http.http_client import TwilioHttpClient
+    return TwilioHttpClient(pool_connections=True, timeout=timeout)
+
+
+def is_retryable(exc):
+    import httpx
+    if isinstance(exc, (asyncio.TimeoutError, httpx.TransportError, ConnectionError)):
+        return True
+    status = getattr(exc, "status", None)
+    if status is None and isinstance(exc, httpx.HTTPStatusError):
+        status = exc.response.status_code
+    if status is not None:
+        return status == 429 or status >= 500
+    return False
+
+
+class SideEffectService:
+    """Runs Twilio REST / webhook calls off the event loop so a slow HTTPS round trip
+    on one call never stalls audio on the others.
+
+    Sync callables go to a bounded thread pool, coroutine functions run on the loop
+    with the shared pooled httpx client. Every operation gets a timeout and retries
+    with exponential backoff on transient errors.
+
+    A timeout does not mean the request failed: a thread cannot be cancelled, so the
+    request may still go through after run() gave up on it. Retrying is only safe for
+    operations that end in the same state when repeated (calls(sid).update to the
+    same TwiML or URL, fetches). Anything that reaches a caller, like messages.create
+    or calls.create, must pass retries=0 or they may get it twice. Form posts to the
+    business (booking) keep retrying: a duplicate lead beats a lost one. A thread
+    still running after its timeout keeps its concurrency slot until it returns, so
+    abandoned requests cannot pile up behind the pool.
+
+    The httpx client is created on first use: importing httpx and loading its CA
+    bundle is ~200 ms that a cold start serving its first webhook should not pay.
+    """
+
+    def __init__(self, max_concurrency=8, timeout=10.0, retries=2, backoff=0.5):
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self._sem = asyncio.Semaphore(max_concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="side-effect")
+        self._tasks = set()
+        self._max_concurrency = max_concurrency
+        self._http = None
+        self.stats = {"ok": 0, "failed": 0, "retried": 0, "timed_out": 0, "abandoned": 0}
+
+    @property
+    def http(self):
+        if self._http is None:
+            import httpx
+            self._http = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self._max_concurrency,
+                                    max_keepalive_connections=self._max_concurrency),
+            )
+        return self._http
+
+    @property
+    def outstanding(self):
+        return len(self._tasks)
+
+    async def run(self, name, fn, *args, timeout=None, retries=None, **kwargs):
+        """Await fn(*args, **kwargs) off the loop; raises the last error once retries are spent."""
+        timeout = self.timeout if timeout is None else timeout
+        retries = self.retries if retries is None else retries
+        attempt = 0
+        while True:
+            try:
+                result = await self._attempt(fn, args, kwargs, timeout)
+                self.stats["ok"] += 1
+                return result
+            except Exception as e:
+                if isinstance(e, asyncio.TimeoutError):
+                    self.stats["timed_out"] += 1
+                if attempt >= retries or not is_retryable(e):
+                    self.stats["failed"] += 1
+                    raise
+                delay = self.backoff * (2 ** attempt)
+                attempt += 1
+                self.stats["retried"] += 1
+                log.warning("🔁 side effect %s failed (%r); retry %d/%d in %.1fs", name, e, attempt, retries, delay)
+                await asyncio.sleep(delay)
+
+    def submit(self, name, fn, *args, **kwargs):
+        """Fire-and-forget variant of run(); failures are logged, never raised into the media loop."""
+        return self.spawn(name, self.run(name, fn, *args, **kwargs))
+
+    def spawn(self, name, coro):
+        """Track a multi-step flow whose individual steps go through run()."""
+        task = asyncio.create_task(self._logged(name, coro))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def snapshot(self):
+        return {**self.stats, "outstanding": self.outstanding}
+
+    async def close(self):
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._http is not None:
+            await self._http.aclose()
+        self._executor.shutdown(wait=False)
+
+    async def _logged(self, name, coro):
+        try:
+            return await coro
+        except Exception as e:
+            log.error("❌ side effect %s failed: %r", name, e)
+
+    async def _attempt(self, fn, args, kwargs, timeout):
+        await self._sem.acquire()
+        if asyncio.iscoroutinefunction(fn):
+            try:
+                return await asyncio.wait_for(fn(*args, **kwargs), timeout=timeout)     # cancelled on timeout
+            finally:
+                self._sem.release()
+        loop = asyncio.get_running_loop()
+        future = self._executor.submit(functools.partial(fn, *args, **kwargs))
+        future.add_done_callback(lambda _: self._release_from_thread(loop))
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout=timeout)
+        except asyncio.TimeoutError:
+            if not future.done():
+                self.stats["abandoned"] += 1    # still running in its thread, holding its slot
+            raise
+
+    def _release_from_thread(self, loop):
+        try:
+            loop.call_soon_threadsafe(self._sem.release)
+        except RuntimeError:
+            pass        # loop already closed at shutdown
@@ -0,0 +1,70 @@
+import asyncio
+
+from logs import get_logger
+
+log = get_logger(__name__)
+
+
+class SpeculativeSessions:
+    """Opens the upstream session for a CallSid while Twilio is still playing the greeting.
+
+    /incoming-call calls start(call_sid); /media-stream calls adopt(call_sid) once the
+    `start` event arrives. Sessions nobody adopts within `timeout` seconds are closed.
+    """
+
+    def __init__(self, acquire, timeout=30.0):
+        self.acquire = acquire          # async () -> (websocket, pooled)
+        self.timeout = timeout
+        self._pending = {}              # call_sid -> asyncio.Task
+        self.stats = {"started": 0, "adopted": 0, "orphaned": 0, "failed": 0}
+
+    def start(self, call_sid, acquire=None):
+        if not call_sid or call_sid in self._pending:
+            return
+        task = asyncio.create_task((acquire or self.acquire)())
+        self._pending[call_sid] = task
+        self.stats["started"] += 1
+        asyncio.get_running_loop().call_later(self.timeout, self._expire, call_sid, task)
+
+    async def adopt(self, call_sid):
+        """Return the in-flight session for call_sid, or None if there is none (or it failed)."""
+        task = self._pending.pop(call_sid, None)
+        if task is None:
+            return None
+        try:
+            ws, _ = await task
+        except Exception as e:
+            self.stats["failed"] += 1
+            log.error("❌ speculative connect failed: %r", e, extra={"callSid": call_sid})
+            return None
+        self.stats["adopted"] += 1
+        return ws
+
+    def snapshot(self):
+        return {**self.stats, "pending": len(self._pending)}
+
+    async def close(self):
+        tasks = list(self._pending.values())
+        self._pending.clear()
+        await asyncio.gather(*(_discard(t) for t in tasks))
+
+    def _expire(self, call_sid, task):
+        if self._pending.get(call_sid) is not task:
+            return
+        del self._pending[call_sid]
+        self.stats["orphaned"] += 1
+        log.info("🧹 dropping orphaned speculative session", extra={"callSid": call_sid})
+        asyncio.create_task(_discard(task))
+
+
+async def _discard(task):
+    if not task.done():
+        task.cancel()
+    try:
+        ws, _ = await task
+    except BaseException:
+        return
+    try:
+        await ws.close()
+    except Exception:
+        pass
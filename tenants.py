@@ -0,0 +1,158 @@
+import os
+import json
+import time
+from collections import OrderedDict
+
+from logs import get_logger
+from session_config import SessionConfigCache
+
+log = get_logger(__name__)
+
+# Businesses served by one process, keyed by the Twilio number the caller dialed
+# (the webhook's `To`). TENANTS_FILE is a JSON object of number -> settings:
+#
+#   {"+13235550100": {"name": "Mark's Properties", "prompt": "prompts/marks.txt",
+#                     "voice": "alloy", "greeting": "You've reached Mark's Properties.",
+#                     "greeting_voice": "Polly.Matthew", "forward_number": "+13232108697",
+#                     "booking_url": "https://formspree.io/f/..."}}
+#
+# Prompt paths are relative to the file; settings a tenant leaves out come from the
+# default tenant, which also answers numbers the file does not list. Upstream
+# sessions, HTTP clients and caches are shared, so a tenant is only its settings
+# plus its prompt, loaded on its first call.
+
+
+class Tenant:
+    def __init__(self, number, name=None, prompt_path=None, voice=None, greeting=None,
+                 greeting_voice=None, forward_number=None, booking_url=None, session_config=None):
+        self.number = number                # the Twilio number; caller ID for SMS and transfers
+        self.name = name or number
+        self.prompt_path = prompt_path
+        self.voice = voice
+        self.greeting = greeting            # <Say> intro when no cached greeting clip exists
+        self.greeting_voice = greeting_voice
+        self.forward_number = forward_number
+        self.booking_url = booking_url
+        self._session_config = session_config
+
+    @property
+    def session_config(self):
+        # Read the prompt on first use; re-read when TenantRegistry.get() sees it change
+        if self._session_config is None:
+            self._session_config = SessionConfigCache(self.prompt_path, check_interval=0)
+        return self._session_config
+
+    def __repr__(self):
+        return f"Tenant({self.number!r}, {self.name!r})"
+
+
+class TenantRegistry:
+    """Resolves a dialed number to its Tenant.
+
+    The settings file is re-read when it changes (checked at most every
+    `check_interval` seconds, on lookup). Tenants are built on first lookup and kept
+    in an LRU of `max_loaded`; an evicted tenant costs one prompt read on its next call.
+    """
+
+    def __init__(self, path, default, max_loaded=32, check_interval=2.0, clock=time.monotonic):
+        self.path = path
+        self.default = default
+        self.max_loaded = max_loaded
+        self.check_interval = check_interval
+        self.clock = clock
+        self._specs = {}                # number -> settings dict from the file
+        self._stat = None
+        self._checked = {}              # number (or None for the file) -> last check time
+        self._loaded = OrderedDict()    # number -> Tenant
+        self.stats = {"hits": 0, "loads": 0, "evictions": 0, "unknown": 0}
+
+    def get(self, number):
+        self._refresh_specs()
+        number = (number or "").strip()
+        spec = self._specs.get(number)
+        if spec is None:
+            self.stats["unknown"] += 1
+            return self.default
+        tenant = self._loaded.get(number)
+        if tenant is not None:
+            self._loaded.move_to_end(number)
+            self.stats["hits"] += 1
+            self._refresh_prompt(number, tenant)
+            return tenant
+        try:
+            tenant = self._build(number, spec)
+        except Exception as e:
+            log.error("❌ could not load tenant, using the default: %r", e, extra={"tenant": number})
+            return self.default
+        self._loaded[number] = tenant
+        self._checked[number] = self.clock()
+        self.stats["loads"] += 1
+        log.info("🏢 tenant loaded", extra={"tenant": number, "tenant_name": tenant.name})
+        while len(self._loaded) > self.max_loaded:
+            evicted, _ = self._loaded.popitem(last=False)
+            self._checked.pop(evicted, None)
+            self.stats["evictions"] += 1
+        return tenant
+
+    def snapshot(self):
+        return {
+            **self.stats,
+            "configured": len(self._specs),
+            "loaded": {number: t.name for number, t in self._loaded.items()},
+        }
+
+    def _build(self, number, spec):
+        d = self.default
+        prompt = spec.get("prompt")
+        if prompt:
+            prompt = os.path.join(os.path.dirname(os.path.abspath(self.path)), prompt)
+        tenant = Tenant(
+            number,
+            name=spec.get("name"),
+            prompt_path=prompt or d.prompt_path,
+            voice=spec.get("voice", d.voice),
+            greeting=spec.get("greeting", d.greeting),
+            greeting_voice=spec.get("greeting_voice", d.greeting_voice),
+            forward_number=spec.get("forward_number", d.forward_number),
+            booking_url=spec.get("booking_url", d.booking_url),
+            session_config=None if prompt else d._session_config,     # same prompt: share its cache
+        )
+        if tenant.prompt_path:
+            tenant.session_config   # read the prompt now, so a bad path falls back to the default
+        return tenant
+
+    def _due(self, key):
+        now = self.clock()
+        if now - self._checked.get(key, float("-inf")) < self.check_interval:
+            return False
+        self._checked[key] = now
+        return True
+
+    def _refresh_specs(self):
+        if not self.path or not self._due(None):
+            return
+        try:
+            st = os.stat(self.path)
+            stat = (st.st_mtime_ns, st.st_size)
+            if stat == self._stat:
+                return
+            with open(self.path, "r", encoding="utf-8") as f:
+                specs = json.load(f)
+        except (OSError, ValueError) as e:
+            # Mid-save or deleted: keep routing with the last good file
+            log.warning("❌ could not read tenants file: %r", e, extra={"path": self.path})
+            return
+        first = self._stat is None
+        self._stat = stat
+        self._specs = {number.strip(): spec for number, spec in specs.items()}
+        self._loaded.clear()        # rebuilt with the new settings on their next call
+        if not first:
+            log.info("🏢 tenants file changed", extra={"configured": len(self._specs)})
+
+    def _refresh_prompt(self, number, tenant):
+        if not tenant.prompt_path or not self._due(number):
+            return
+        try:
+            tenant.session_config.reload()
+        except OSError as e:
+            log.warning("❌ could not reload tenant prompt: %r", e, extra={"tenant": number})
@@ -0,0 +1,113 @@
+import re
+from string import Formatter
+from urllib.parse import parse_qsl
+from xml.sax.saxutils import escape
+
+# Webhook responses are a handful of fixed documents with a few variable attributes,
+# so they are written out once as templates instead of building a VoiceResponse tree
+# per request. Rendering escapes values the way VoiceResponse (ElementTree) does:
+# text gets &, < and >; attribute values also get quotes, newlines and tabs. An
+# attribute whose value is None is left out, as VoiceResponse does; None text
+# renders as nothing. The output matches VoiceResponse's byte for byte when the
+# template lists attributes in the same (alphabetical) order.
+
+_XML_DECLARATION = '<?xml version="1.0" encoding="UTF-8"?>'
+_ATTR_ENTITIES = {'"': "&quot;", "\n": "&#10;", "\r": "&#13;", "\t": "&#09;"}
+_ATTR_OPEN = re.compile(r' ([A-Za-z:]+)="$')     # literal ending in ` name="`, the slot is its value
+
+
+class TwimlTemplate:
+    """A TwiML document with {name} placeholders, split into literal/slot parts once."""
+
+    def __init__(self, source):
+        self.source = source
+        self._parts = []        # literal strings and (placeholder, attribute name or None), alternating
+        self.fields = set()
+        attribute = None
+        for literal, field, _, _ in Formatter().parse(source):
+            if attribute is not None:
+                literal = literal[1:]       # the attribute's closing quote
+            attribute = None
+            if field is not None:
+                opened = _ATTR_OPEN.search(literal)
+                if opened:
+                    attribute = opened.group(1)
+                    literal = literal[:opened.start()]
+            self._parts.append(literal)
+            if field is not None:
+                self._parts.append((field, attribute))
+                self.fields.add(field)
+            else:
+                self._parts.append(None)
+
+    def render(self, **values):
+        missing = self.fields - values.keys()
+        if missing:
+            raise KeyError(f"TwiML template needs {sorted(missing)}")
+        parts = self._parts
+        out = []
+        for i in range(0, len(parts), 2):
+            out.append(parts[i])
+            slot = parts[i + 1]
+            if slot is None:
+                continue
+            name, attribute = slot
+            value = values[name]
+            if attribute is None:
+                if value is not None:
+                    out.append(escape(str(value)))
+            elif value is not None:
+                out.append(f' {attribute}="{escape(str(value), _ATTR_ENTITIES)}"')
+        return "".join(out)
+
+
+def template(body):
+    return TwimlTemplate(_XML_DECLARATION + "<Response>" + body + "</Response>")
+
+
+CONNECT_STREAM = template(
+    '<Say voice="{voice}">{greeting}</Say>'
+    '<Pause length="{pause}" />'
+    '<Connect><Stream url="{stream_url}" /></Connect>'
+)
+
+STREAM = template('<Connect><Stream url="{stream_url}" /></Connect>')
+
+FORWARD = template(
+    '<Dial callerId="{caller_id}" timeout="{timeout}"><Number>{number}</Number></Dial>'
+)
+
+FORWARD_RECORDED = template(
+    '<Dial action="{action}" callerId="{caller_id}" record="record-from-answer" '
+    'recordingStatusCallback="{recording_callback}" recordingStatusCallbackEvent="completed" '
+    'timeout="{timeout}"><Number>{number}</Number></Dial>'
+)
+
+# Sent instead of a stream when the upstream has no capacity for the call
+OVERFLOW_FORWARD = template(
+    '<Say voice="{voice}">{message}</Say>'
+    '<Dial action="{action}" callerId="{caller_id}" timeout="{timeout}"><Number>{number}</Number></Dial>'
+)
+
+OVERFLOW_VOICEMAIL = template(
+    '<Say voice="{voice}">{message}</Say>'
+    '<Record action="{action}" maxLength="{max_length}" playBeep="true" />'
+)
+
+# Hold queue: Twilio plays the wait TwiML in a loop until the call is redirected out
+ENQUEUE = template('<Enqueue action="{action}" waitUrl="{wait_url}">{queue}</Enqueue>')
+
+HOLD = template('<Say voice="{voice}">{message}</Say><Play>{music_url}</Play>')
+
+HANGUP = template('<Hangup />')
+
+
+async def read_form(request):
+    """Webhook form fields as a dict.
+
+    Twilio posts application/x-www-form-urlencoded; parsing the body directly skips
+    Starlette's form parser, the biggest cost in a webhook that only renders a template.
+    """
+    if request.headers.get("content-type", "").startswith("application/x-www-form-urlencoded"):
+        return dict(parse_qsl((await request.body()).decode(), keep_blank_values=True))
+    return await request.form()
@@ -0,0 +1,49 @@
+from audio import np, ulaw_decode_table     # np is None without numpy; the bridge then uses server VAD only
+
+FRAME_SAMPLES = 160     # 20 ms at 8 kHz
+
+
+class UlawEnergyVad:
+    """Frame-energy voice activity detector on the raw inbound mu-law stream.
+
+    Speech starts after `attack_ms` of consecutive frames above `threshold_db` (dBFS)
+    and ends after `hangover_ms` below it. process() returns "start" / "end" on
+    transitions, otherwise None.
+    """
+
+    def __init__(self, threshold_db=-35.0, attack_ms=60, hangover_ms=300):
+        if np is None:
+            raise RuntimeError("numpy is required for local VAD")
+        self._table = ulaw_decode_table().astype(np.float32)
+        self._threshold = (10 ** (threshold_db / 20) * 32768) ** 2     # mean-square equivalent
+        self.attack_frames = max(1, attack_ms // 20)
+        self.hangover_frames = max(1, hangover_ms // 20)
+        self._carry = b""
+        self._above = 0
+        self._below = 0
+        self.speaking = False
+
+    def process(self, audio):
+        audio = self._carry + audio
+        whole = len(audio) - len(audio) % FRAME_SAMPLES
+        self._carry = audio[whole:]
+        if not whole:
+            return None
+        samples = self._table[np.frombuffer(audio, dtype=np.uint8, count=whole)]
+        energy = np.square(samples.reshape(-1, FRAME_SAMPLES)).mean(axis=1)
+
+        transition = None
+        for loud in (energy > self._threshold).tolist():
+            if loud:
+                self._above += 1
+                self._below = 0
+                if not self.speaking and self._above >= self.attack_frames:
+                    self.speaking = True
+                    transition = "start"
+            else:
+                self._below += 1
+                self._above = 0
+                if self.speaking and self._below >= self.hangover_frames:
+                    self.speaking = False
+                    transition = "end"
+        return transition